@@ -3,18 +3,84 @@ Main Flask application for PonyXpress
 """
 import os
 import csv
+import tempfile
+import hashlib
+import json
+import math
+import zlib
 from io import StringIO
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 
-from flask import Flask, render_template, redirect, url_for, flash, request, send_file, jsonify
+import click
+from flask import (
+    Flask,
+    Response,
+    abort,
+    render_template,
+    redirect,
+    url_for,
+    flash,
+    request,
+    jsonify,
+    send_file,
+    session,
+    stream_with_context,
+)
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from functools import wraps
+from sqlalchemy.exc import OperationalError
 
+from database.export import FORMATS as EXPORT_FORMATS, ExportFormatError, available_formats, export_scans, resolve_format
+from database.importer import (
+    DEFAULT_CHUNK_BYTES,
+    DeliveryImportError,
+    ManifestImportError,
+    import_deliveries,
+    import_packages,
+)
 from database.models import db, User, RouteTrace, MailboxStop, PackageScan
+from database.migrations import rebuild_geometry_levels, upgrade_db
+from database.queries import (
+    daily_rollups,
+    package_details,
+    route_page,
+    route_rollup_page,
+    route_version_stamp,
+    scan_export_query,
+    user_page,
+)
+from database.query_plans import check_query_plans
+from database.rollups import create_rollups, rebuild_rollups
+from database.spatial import MAX_SEARCH_M, create_spatial_index, nearest
+from database.storage import apply_storage_profile
+from database.sync import SyncError, apply_changes, changes_since, create_sync
+from geometry import (
+    FORMAT_VERSION as GEOMETRY_FORMAT_VERSION,
+    MAX_ZOOM,
+    SIMPLIFICATION_ZOOMS,
+    GeometryError,
+    decode_geometry,
+    dumps_geojson,
+    simplification_level,
+    tolerance_zoom,
+)
+from live_feed import LiveFeed
+from optimizer import DEFAULT_SPEED_KMH, OptimizerPool, RouteOptimizationError, optimize_routes
+from permissions import PermissionEngine, PermissionsError
+from photos import MIMETYPES as PHOTO_MIMETYPES, PhotoError, PhotoStore
+from response_cache import ResponseCache
+from scan_buffer import LogDirLocked, ScanWriteBuffer
+from scan_dedupe import ScanDeduper, ScanKeyError
+from tracking_index import TrackingIndex
+from voice_intents import IntentMatcher, VoiceCommandsError
+from user_cache import UserCache
 
 
-def create_app():
-    """Factory pattern for creating the Flask app"""
+def create_app(config=None):
+    """Factory pattern for creating the Flask app
+
+    ``config`` optionally overrides the defaults below (e.g. a temporary
+    database URI for benchmarks and query-plan checks).
+    """
     app = Flask(__name__, instance_relative_config=True)
 
     # ------------------------------------------------------------------
@@ -24,39 +90,248 @@ def create_app():
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///ponyexpress.db"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # SQLite PRAGMA profile (see database/storage.py); SQLITE_PRAGMAS
+    # may override individual settings of the chosen profile.
+    app.config["STORAGE_PROFILE"] = "production"
+    app.config["SQLITE_PRAGMAS"] = {}
+
+    # Rows fetched per round trip when streaming exports
+    app.config["EXPORT_CHUNK_SIZE"] = 1000
+    # Rows per column chunk (Parquet row group) in columnar exports
+    app.config["EXPORT_COLUMNAR_CHUNK_SIZE"] = 65536
+
+    # Upper bound on scans accepted by a single batch upload
+    app.config["SCAN_BATCH_MAX"] = 1000
+
+    # Scan deduplication (see scan_dedupe.py): seconds in which repeats of a
+    # barcode count as one scan, and the recent keys remembered in memory
+    app.config["SCAN_DEDUPE_WINDOW"] = 60
+    app.config["SCAN_DEDUPE_ROUTES"] = 1024
+    app.config["SCAN_DEDUPE_KEYS_PER_ROUTE"] = 4096
+
+    # Tracking-number index (see tracking_index.py): seconds between checks
+    # for new packages, new numbers buffered before a merge, and results
+    # per lookup by default and at most
+    app.config["TRACKING_INDEX_REFRESH"] = 5.0
+    app.config["TRACKING_INDEX_MERGE_ROWS"] = 65536
+    app.config["PACKAGE_LOOKUP_LIMIT"] = 20
+    app.config["PACKAGE_LOOKUP_LIMIT_MAX"] = 100
+
+    # Voice commands (see voice_intents.py): the command file, seconds
+    # between checks for changes, and the lowest score that counts as a match
+    app.config["VOICE_COMMANDS_PATH"] = os.path.join(os.path.dirname(app.root_path), "voice-commands.json")
+    app.config["VOICE_RELOAD_INTERVAL"] = 2.0
+    app.config["VOICE_MIN_SCORE"] = 0.5
+
+    # Role permissions (see permissions.py): the permissions file and
+    # seconds between checks for changes
+    app.config["PERMISSIONS_PATH"] = os.path.join(os.path.dirname(app.root_path), "roles-permissions.json")
+    app.config["PERMISSIONS_RELOAD_INTERVAL"] = 2.0
+
+    # Flask-Login user cache: entry lifetime (seconds) and size (0 disables)
+    app.config["USER_CACHE_TTL"] = 30.0
+    app.config["USER_CACHE_SIZE"] = 1024
+
+    # Write-behind scan ingestion (see scan_buffer.py). Off by default: each
+    # scan is then committed by its own request. The log directory makes
+    # acknowledged scans survive a crash; set it to None for memory-only.
+    # It is locked by one process: other workers commit scans per request.
+    app.config["SCAN_WRITE_BEHIND"] = False
+    app.config["SCAN_WRITE_BEHIND_LOG_DIR"] = os.path.join(app.instance_path, "scan-log")
+    app.config["SCAN_WRITE_BEHIND_FLUSH_MS"] = 50
+    app.config["SCAN_WRITE_BEHIND_FLUSH_ROWS"] = 500
+    app.config["SCAN_WRITE_BEHIND_FSYNC"] = True
+
+    # Live scan feed for supervisors: events kept for Last-Event-ID replay
+    # and seconds between keepalives on an idle stream
+    app.config["LIVE_FEED_SIZE"] = 10000
+    app.config["LIVE_FEED_HEARTBEAT"] = 15.0
+
+    # Rows per page on the admin dashboard and its JSON endpoints
+    app.config["ADMIN_PAGE_SIZE"] = 50
+    app.config["ADMIN_PAGE_SIZE_MAX"] = 500
+
+    # Daily rollup endpoint: days shown by default and the widest range allowed
+    app.config["ROLLUP_DEFAULT_DAYS"] = 30
+    app.config["ROLLUP_MAX_DAYS"] = 366
+
+    # Device sync: changes per pull page by default and at most, and changes
+    # accepted in one push
+    app.config["SYNC_PAGE_SIZE"] = 500
+    app.config["SYNC_PAGE_SIZE_MAX"] = 5000
+    app.config["SYNC_PUSH_MAX"] = 1000
+
+    # Route optimiser: local-search budget per route, process-pool size
+    # (None = one worker per CPU) for multi-route requests, routes accepted
+    # in one request and stops per route (the distance matrix is N×N)
+    app.config["OPTIMIZER_TIME_LIMIT"] = 1.0
+    app.config["OPTIMIZER_WORKERS"] = None
+    app.config["OPTIMIZER_MAX_ROUTES"] = 50
+    app.config["OPTIMIZER_MAX_STOPS"] = 1000
+    # Distance matrices kept per process for repeated stop sets (see geo.py)
+    app.config["OPTIMIZER_MATRIX_CACHE_BYTES"] = 64 * 1024 * 1024
+
     # Folder for uploading mailbox photos
     app.config["UPLOAD_FOLDER"] = os.path.join(app.root_path, "static", "uploads")
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
+    # Photo uploads (see photos.py): size limit, read size, longest side of
+    # each downscaled variant, render processes and photos waiting for them
+    app.config["PHOTO_MAX_BYTES"] = 20 * 1024 * 1024
+    app.config["PHOTO_CHUNK_BYTES"] = 64 * 1024
+    app.config["PHOTO_VARIANTS"] = {"thumb": 320, "medium": 1280}
+    app.config["PHOTO_WORKERS"] = 1
+    app.config["PHOTO_QUEUE_SIZE"] = 64
+    app.config["PHOTO_FSYNC"] = True
+
+    # Rendered route pages and geometry (see response_cache.py): total size
+    # of the cached bodies and their compression settings
+    app.config["RESPONSE_CACHE_BYTES"] = 32 * 1024 * 1024
+    app.config["RESPONSE_CACHE_GZIP_LEVEL"] = 9
+    app.config["RESPONSE_CACHE_BROTLI_QUALITY"] = 9
+
+    if config:
+        app.config.update(config)
+
     # ------------------------------------------------------------------
     # Extensions
     # ------------------------------------------------------------------
     db.init_app(app)
+    apply_storage_profile(app)
     login_manager = LoginManager(app)
     login_manager.login_view = "login"
 
+    user_cache = UserCache(ttl=app.config["USER_CACHE_TTL"], maxsize=app.config["USER_CACHE_SIZE"])
+    user_cache.watch_user_changes()
+    app.extensions["user_cache"] = user_cache
+
     @login_manager.user_loader
     def load_user(user_id):  # noqa: D401
-        """Flask-Login callback to load a user from the DB"""
-        return User.query.get(int(user_id))
+        """Flask-Login callback to load a user, served from the user cache when warm"""
+        return user_cache.load_user(int(user_id))
+
+    live_feed = LiveFeed(size=app.config["LIVE_FEED_SIZE"], heartbeat=app.config["LIVE_FEED_HEARTBEAT"])
+    app.extensions["live_feed"] = live_feed
+
+    photo_store = PhotoStore(
+        os.path.join(app.config["UPLOAD_FOLDER"], "photos"),
+        variants=app.config["PHOTO_VARIANTS"],
+        workers=app.config["PHOTO_WORKERS"],
+        queue_size=app.config["PHOTO_QUEUE_SIZE"],
+        max_bytes=app.config["PHOTO_MAX_BYTES"],
+        chunk_bytes=app.config["PHOTO_CHUNK_BYTES"],
+        fsync=app.config["PHOTO_FSYNC"],
+    )
+    app.extensions["photo_store"] = photo_store
+
+    optimizer_pool = OptimizerPool(
+        workers=app.config["OPTIMIZER_WORKERS"], matrix_cache_bytes=app.config["OPTIMIZER_MATRIX_CACHE_BYTES"]
+    )
+    app.extensions["optimizer_pool"] = optimizer_pool
+
+    # Everything that renders the cached responses goes into their ETags,
+    # so clients revalidating across a deploy get the new version
+    salt = hashlib.sha1(repr((GEOMETRY_FORMAT_VERSION, SIMPLIFICATION_ZOOMS)).encode("utf-8"))
+    for template in ("base.html", "map.html"):
+        salt.update(app.jinja_env.loader.get_source(app.jinja_env, template)[0].encode("utf-8"))
+    response_cache = ResponseCache(
+        maxbytes=app.config["RESPONSE_CACHE_BYTES"],
+        salt=salt.hexdigest(),
+        gzip_level=app.config["RESPONSE_CACHE_GZIP_LEVEL"],
+        brotli_quality=app.config["RESPONSE_CACHE_BROTLI_QUALITY"],
+    )
+    app.extensions["response_cache"] = response_cache
+
+    scan_deduper = ScanDeduper(
+        window=app.config["SCAN_DEDUPE_WINDOW"],
+        routes=app.config["SCAN_DEDUPE_ROUTES"],
+        keys_per_route=app.config["SCAN_DEDUPE_KEYS_PER_ROUTE"],
+    )
+    app.extensions["scan_deduper"] = scan_deduper
+
+    tracking_index = TrackingIndex(
+        refresh_interval=app.config["TRACKING_INDEX_REFRESH"], merge_rows=app.config["TRACKING_INDEX_MERGE_ROWS"]
+    )
+    app.extensions["tracking_index"] = tracking_index
+
+    intent_matcher = IntentMatcher(
+        app.config["VOICE_COMMANDS_PATH"],
+        reload_interval=app.config["VOICE_RELOAD_INTERVAL"],
+        min_score=app.config["VOICE_MIN_SCORE"],
+    )
+    app.extensions["intent_matcher"] = intent_matcher
+
+    permission_engine = PermissionEngine(
+        app.config["PERMISSIONS_PATH"], reload_interval=app.config["PERMISSIONS_RELOAD_INTERVAL"]
+    )
+    try:
+        permission_engine.reload()
+    except PermissionsError as exc:
+        app.logger.warning("Permission checks will deny all access: %s", exc)
+    app.extensions["permission_engine"] = permission_engine
+
+    scan_buffer = None
+    if app.config["SCAN_WRITE_BEHIND"]:
+        try:
+            scan_buffer = ScanWriteBuffer(
+                app,
+                log_dir=app.config["SCAN_WRITE_BEHIND_LOG_DIR"],
+                flush_interval=app.config["SCAN_WRITE_BEHIND_FLUSH_MS"] / 1000,
+                flush_rows=app.config["SCAN_WRITE_BEHIND_FLUSH_ROWS"],
+                fsync=app.config["SCAN_WRITE_BEHIND_FSYNC"],
+                on_commit=live_feed.publish_scan_rows,
+                deduper=scan_deduper,
+            )
+        except LogDirLocked as exc:
+            app.logger.warning("Scan write-behind disabled; scans are committed per request: %s", exc)
+    if scan_buffer is not None:
+        try:
+            scan_buffer.start()  # replays any segments left by a crash
+        except OperationalError:
+            app.logger.warning("Scan write-behind deferred until the database is initialised")
+        app.extensions["scan_buffer"] = scan_buffer
 
     # ------------------------------------------------------------------
-    # Helper decorators
+    # Helper decorators & request helpers
     # ------------------------------------------------------------------
-    def roles_required(*roles):  # noqa: D401
-        """Ensure the current user has at least one of the required roles."""
+    def coordinate(value):
+        """A JSON ``lat``/``lng`` as a finite float (``None`` if absent); ``ValueError`` otherwise."""
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"not a number: {value!r}")
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(f"not a finite number: {value!r}")
+        return value
+
+    def flag(value):
+        """A JSON ``too_big``/``too_small`` as a bool (``False`` if absent); ``ValueError`` otherwise.
 
-        def decorator(f):
-            @wraps(f)
-            def decorated_function(*args, **kwargs):
-                if not current_user.is_authenticated or current_user.role not in roles:
-                    flash("You do not have permission to access this page.", "danger")
-                    return redirect(url_for("index"))
-                return f(*args, **kwargs)
+        Only real booleans: ``bool("false")`` would be true.
+        """
+        if value is None:
+            return False
+        if not isinstance(value, bool):
+            raise ValueError(f"not a boolean: {value!r}")
+        return value
 
-            return decorated_function
+    def permissions_required(*permissions):
+        """Ensure the current user's role holds every listed permission (see permissions.py)."""
+        return permission_engine.required(*permissions)
 
-        return decorator
+    def route_filters():
+        """Carrier/date-range route filters from the query string."""
+        return {
+            "carrier": request.args.get("carrier") or None,
+            "start": request.args.get("start", type=date.fromisoformat),
+            "end": request.args.get("end", type=date.fromisoformat),
+        }
+
+    def page_size():
+        """Requested page size, clamped to the configured maximum."""
+        limit = request.args.get("limit", app.config["ADMIN_PAGE_SIZE"], type=int)
+        return max(1, min(limit, app.config["ADMIN_PAGE_SIZE_MAX"]))
 
     # ------------------------------------------------------------------
     # Routes – Authentication
@@ -99,12 +374,15 @@ def create_app():
     # ------------------------------------------------------------------
     @app.route("/map", methods=["GET", "POST"])
     @login_required
-    @roles_required("carrier")
+    @permissions_required("navigate_routes")
     def map_view():
-        """Carrier can draw their daily route and save it."""
+        """Carriers draw their daily route and save it."""
         if request.method == "POST":
-            geojson = request.json.get("geojson")
-            route = RouteTrace(geojson=str(geojson), carrier=current_user)
+            route = RouteTrace(carrier=current_user)
+            try:
+                route.set_geometry(request.json.get("geojson"))
+            except GeometryError as exc:
+                return jsonify({"success": False, "error": str(exc)}), 400
             db.session.add(route)
             db.session.commit()
             return jsonify({"success": True, "route_id": route.id})
@@ -112,51 +390,547 @@ def create_app():
 
     @app.route("/scan/<int:route_id>", methods=["GET", "POST"])
     @login_required
-    @roles_required("carrier")
+    @permissions_required("scan_packages")
     def scan(route_id):
-        """Barcode scanning page for a given route."""
+        """Barcode scanning page for a given route.
+
+        POSTed scans are idempotent (see scan_dedupe.py): a repeat of a scan
+        already recorded answers ``{"success": true, "duplicate": true}``
+        and stores nothing.
+        """
         route = RouteTrace.query.get_or_404(route_id)
         if request.method == "POST":
-            data = request.json
-            scan = PackageScan(
-                route=route,
-                barcode=data.get("barcode"),
-                too_big=data.get("too_big", False),
-                too_small=data.get("too_small", False),
-                lat=data.get("lat"),
-                lng=data.get("lng"),
-            )
-            # Automatically add a mailbox stop if the package is delivered to mailbox
-            if scan.too_small:
-                mailbox = MailboxStop(route=route, lat=scan.lat, lng=scan.lng, label="Auto stop")
-                db.session.add(mailbox)
-            db.session.add(scan)
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"success": False, "error": "Expected a JSON object"}), 400
+            if not data.get("barcode"):
+                return jsonify({"success": False, "error": "Missing barcode"}), 400
+            if not isinstance(data["barcode"], str):
+                return jsonify({"success": False, "error": "Invalid barcode"}), 400
+            row = {
+                "route_id": route.id,
+                "barcode": data["barcode"],
+                "timestamp": datetime.utcnow(),
+            }
+            # Checked before anything is queued: the write-behind buffer
+            # acknowledges a scan before it is inserted
+            for field, parse in (("too_big", flag), ("too_small", flag), ("lat", coordinate), ("lng", coordinate)):
+                try:
+                    row[field] = parse(data.get(field))
+                except ValueError:
+                    return jsonify({"success": False, "error": f"Invalid {field}"}), 400
+            try:
+                row["dedupe_key"] = scan_deduper.key(
+                    row["barcode"], row["timestamp"], data.get("key", request.headers.get("Idempotency-Key"))
+                )
+            except ScanKeyError as exc:
+                return jsonify({"success": False, "error": str(exc)}), 400
+            if scan_deduper.seen(route.id, row["dedupe_key"]):
+                return jsonify({"success": True, "duplicate": True})
+            if scan_buffer is not None:
+                # Acknowledge once logged; the buffer group-commits it shortly
+                # and remembers its key once committed
+                scan_buffer.submit(row)
+                return jsonify({"success": True, "queued": True})
+            # Also adds the mailbox stop if the package is delivered to the mailbox
+            inserted = scan_deduper.insert([row])
+            carrier = route.carrier.username if route.carrier else None
             db.session.commit()
+            scan_deduper.remember([row])
+            if not inserted:
+                return jsonify({"success": True, "duplicate": True})
+            live_feed.publish_scan_rows(inserted, {route.id: carrier})
             return jsonify({"success": True})
         return render_template("scan.html", route=route)
 
+    @app.route("/scan/<int:route_id>/batch", methods=["POST"])
+    @login_required
+    @permissions_required("scan_packages")
+    def scan_batch(route_id):
+        """Bulk-insert a backlog of scans (e.g. replayed after going offline).
+
+        Accepts either a JSON list of scans or ``{"scans": [...]}``. Each item
+        carries the same fields as a single scan plus an optional ISO-8601
+        ``timestamp`` recorded on the device and an optional idempotency
+        ``key``. Valid items are written in one transaction; the response
+        lists a result per item in request order, with ``duplicate: true``
+        for scans that were already recorded.
+        """
+        route = RouteTrace.query.get_or_404(route_id)
+        data = request.get_json(silent=True)
+        items = data.get("scans") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({"success": False, "error": "Expected a list of scans"}), 400
+        if len(items) > app.config["SCAN_BATCH_MAX"]:
+            return jsonify({"success": False, "error": "Too many scans in one batch"}), 413
+
+        scan_rows, results = [], []
+        received_at = datetime.utcnow()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("barcode"):
+                results.append({"index": index, "success": False, "error": "Missing barcode"})
+                continue
+            if not isinstance(item["barcode"], str):
+                results.append({"index": index, "success": False, "error": "Invalid barcode"})
+                continue
+            try:
+                timestamp = datetime.fromisoformat(item["timestamp"]) if item.get("timestamp") else received_at
+            except (TypeError, ValueError):
+                results.append({"index": index, "success": False, "error": "Invalid timestamp"})
+                continue
+            if timestamp.tzinfo is not None:
+                # Stored timestamps are naive UTC, like datetime.utcnow()
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            row = {
+                "route_id": route.id,
+                "barcode": item["barcode"],
+                "timestamp": timestamp,
+            }
+            invalid = None
+            for field, parse in (("too_big", flag), ("too_small", flag), ("lat", coordinate), ("lng", coordinate)):
+                try:
+                    row[field] = parse(item.get(field))
+                except ValueError:
+                    invalid = invalid or f"Invalid {field}"
+            if invalid:
+                results.append({"index": index, "success": False, "error": invalid})
+                continue
+            try:
+                row["dedupe_key"] = scan_deduper.key(row["barcode"], timestamp, item.get("key"))
+            except ScanKeyError as exc:
+                results.append({"index": index, "success": False, "error": str(exc)})
+                continue
+            if scan_deduper.seen(route.id, row["dedupe_key"]):
+                results.append({"index": index, "success": True, "duplicate": True})
+                continue
+            scan_rows.append(row)
+            results.append({"index": index, "success": True, "dedupe_key": row["dedupe_key"]})
+
+        # One executemany per table inside a single transaction / fsync; the
+        # same rules as the single-scan view, auto stops included
+        inserted = scan_deduper.insert(scan_rows)
+        carrier = route.carrier.username if route.carrier else None
+        db.session.commit()
+        scan_deduper.remember(scan_rows)
+        if inserted:
+            live_feed.publish_scan_rows(inserted, {route.id: carrier})
+        new = {row["dedupe_key"] for row in inserted}
+        for result in results:
+            key = result.pop("dedupe_key", None)
+            if key is None:
+                continue
+            if key in new:
+                new.discard(key)  # a second item with the same key is a duplicate
+            else:
+                result["duplicate"] = True
+        return jsonify({"success": True, "accepted": len(inserted), "results": results})
+
+    @app.route("/sync", methods=["GET", "POST"])
+    @login_required
+    @permissions_required("access_offline_maps")
+    def sync():
+        """Delta sync for the carrier's offline device (see database/sync.py).
+
+        ``GET`` returns the carrier's route, mailbox-stop and scan changes
+        after ``cursor`` (default 0: everything), ``limit`` per page; repeat
+        with the returned ``cursor`` while ``has_more``. ``POST`` applies
+        offline changes and reports created ids, new versions, conflicts and
+        rejected items.
+        """
+        if request.method == "POST":
+            try:
+                result = apply_changes(
+                    current_user,
+                    request.get_json(silent=True),
+                    max_items=app.config["SYNC_PUSH_MAX"],
+                    on_commit=live_feed.publish_scan_rows,
+                    deduper=scan_deduper,
+                )
+            except SyncError as exc:
+                return jsonify({"success": False, "error": str(exc)}), 400
+            return jsonify({"success": True, **result})
+        cursor = request.args.get("cursor", 0, type=int)
+        limit = request.args.get("limit", app.config["SYNC_PAGE_SIZE"], type=int)
+        limit = max(1, min(limit, app.config["SYNC_PAGE_SIZE_MAX"]))
+        return jsonify(changes_since(current_user.id, cursor=max(0, cursor), limit=limit))
+
+    @app.route("/packages/lookup")
+    @login_required
+    @permissions_required("scan_packages")
+    def package_lookup():
+        """Manifest details for a scanned barcode or digits read out by a carrier.
+
+        Exactly one of ``number`` (a full tracking number), ``prefix`` or
+        ``suffix`` (e.g. the last digits on the label). Spaces and dashes
+        are ignored. Returns up to ``limit`` packages and the number of
+        matches.
+        """
+        searches = {name: request.args[name] for name in ("number", "prefix", "suffix") if request.args.get(name)}
+        if len(searches) != 1:
+            return jsonify({"success": False, "error": "Give one of number, prefix or suffix"}), 400
+        limit = request.args.get("limit", app.config["PACKAGE_LOOKUP_LIMIT"], type=int)
+        limit = max(1, min(limit, app.config["PACKAGE_LOOKUP_LIMIT_MAX"]))
+        [(mode, value)] = searches.items()
+
+        tracking_index.refresh()
+        if mode == "number":
+            ids = tracking_index.exact(value)
+            count = len(ids)
+        else:
+            ids, count = getattr(tracking_index, mode)(value, limit)
+        return jsonify({"success": True, "count": count, "packages": package_details(ids)})
+
+    @app.route("/voice/intent", methods=["POST"])
+    @login_required
+    @permissions_required("use_voice_assistant")
+    def voice_intent():
+        """Match a transcribed utterance to a voice-command intent.
+
+        Body: ``{"text": "...", "wake_word": false}``; with ``wake_word``
+        true, utterances that do not start with a wake word match nothing.
+        ``intent`` is null when nothing scores high enough. For
+        ``package_info`` with digits left over ("package info 1 2 3 4 5"),
+        the packages whose tracking number ends with them are included.
+        """
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data.get("text"), str):
+            return jsonify({"success": False, "error": "Expected {\"text\": \"...\"}"}), 400
+        try:
+            match = intent_matcher.match(data["text"], require_wake_word=bool(data.get("wake_word")))
+        except VoiceCommandsError as exc:
+            return jsonify({"success": False, "error": str(exc)}), 503
+        if match is None:
+            return jsonify({"success": True, "intent": None})
+        result = {"success": True, **match.to_dict()}
+        digits = "".join(ch for ch in match.rest if ch.isdigit())
+        if match.intent == "package_info" and len(digits) >= 4:
+            tracking_index.refresh()
+            ids, result["package_count"] = tracking_index.suffix(digits, app.config["PACKAGE_LOOKUP_LIMIT"])
+            result["packages"] = package_details(ids)
+        return jsonify(result)
+
+    @app.route("/photos", methods=["POST"])
+    @login_required
+    @permissions_required("take_photos")
+    def upload_photo():
+        """Store a photo sent as the raw request body (``image/jpeg``, PNG or WebP).
+
+        Optional ``scan`` or ``stop`` query parameters attach it to a package
+        scan or mailbox stop on one of the user's own routes (any route for
+        roles with ``edit_routes``). Identical photos are stored once;
+        thumbnails are rendered in the background (see photos.py).
+        """
+        scan_id = request.args.get("scan", type=int)
+        stop_id = request.args.get("stop", type=int)
+        target = None
+        if scan_id is not None:
+            target = PackageScan.query.get_or_404(scan_id)
+        elif stop_id is not None:
+            target = MailboxStop.query.get_or_404(stop_id)
+        if target is not None and not (
+            (target.route is not None and target.route.carrier_id == current_user.id)
+            or permission_engine.has(current_user.role, "edit_routes")
+        ):
+            return jsonify({"success": False, "error": "Not your route"}), 403
+        if (request.content_length or 0) > photo_store.max_bytes:
+            return jsonify({"success": False, "error": "Photo too large"}), 413
+        try:
+            name, created = photo_store.save(request.stream)
+        except PhotoError as exc:
+            return jsonify({"success": False, "error": str(exc)}), 400
+        if target is not None:
+            target.photo = name
+            db.session.commit()
+        return jsonify({
+            "success": True,
+            "photo": name,
+            "created": created,
+            "url": url_for("photo", name=name),
+            "variants": {label: url_for("photo", name=name, variant=label) for label in photo_store.variants},
+        }), 201 if created else 200
+
+    @app.route("/photos/<name>")
+    @login_required
+    def photo(name):
+        """Serve a stored photo, or ``?variant=thumb`` etc.; supports Range and ETags.
+
+        Content-addressed files never change, so they are cached as
+        immutable. A variant still being rendered is answered with the
+        original, uncached.
+        """
+        variant = request.args.get("variant")
+        try:
+            path, final = photo_store.locate(name, variant)
+        except PhotoError as exc:
+            return jsonify({"error": str(exc)}), 404
+        if path is None:
+            return jsonify({"error": "No such photo"}), 404
+        mimetype = "image/jpeg" if final and variant else PHOTO_MIMETYPES[name.rsplit(".", 1)[1]]
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=os.path.basename(path))
+        response.cache_control.private = True
+        if final:
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = 365 * 24 * 3600
+            response.cache_control.immutable = True
+        return response
+
     @app.route("/route/<int:route_id>")
     @login_required
-    @roles_required("substitute", "carrier")
+    @permissions_required("navigate_routes")
     def view_route(route_id):
-        """Substitutes and carriers can view an existing route trace."""
-        route = RouteTrace.query.get_or_404(route_id)
-        return render_template("map.html", route=route)
+        """Carriers, substitutes and supervisors can view an existing route trace.
+
+        The page is cached per route and viewer (the navbar shows who is
+        logged in) until the route or its stops change.
+        """
+        if session.get("_flashes"):  # one-off messages: render, don't cache
+            return render_template("map.html", route=RouteTrace.query.get_or_404(route_id))
+        stamp = route_version_stamp(route_id)
+        if stamp is None:
+            abort(404)
+        key = ("page", route_id, current_user.id, current_user.username, current_user.role)
+        return response_cache.respond(
+            key, stamp, lambda: render_template("map.html", route=db.session.get(RouteTrace, route_id)), "text/html"
+        )
+
+    @app.route("/route/<int:route_id>/geometry")
+    @login_required
+    @permissions_required("navigate_routes")
+    def route_geometry(route_id):
+        """Route geometry as GeoJSON, simplified for the requested map scale.
+
+        ``zoom`` (Leaflet zoom level, clamped to 0-``MAX_ZOOM``) or
+        ``tolerance`` (degrees) selects the coarsest precomputed level that
+        is still accurate at that scale; with neither, the full geometry is
+        returned. Non-finite values are rejected with 400. Rendered levels are cached
+        until the route changes and carry a strong ETag, so unchanged levels
+        revalidate with a bodyless 304.
+        """
+        zoom = request.args.get("zoom", type=float)
+        tolerance = request.args.get("tolerance", type=float)
+        for name, value in (("zoom", zoom), ("tolerance", tolerance)):
+            if value is not None and not math.isfinite(value):
+                return jsonify({"success": False, "error": f"{name} must be a finite number"}), 400
+        stamp = route_version_stamp(route_id)
+        if stamp is None:
+            abort(404)
+        if tolerance is not None and tolerance > 0:
+            zoom = tolerance_zoom(tolerance)
+        # Keyed by the level actually served: any zoom maps to one of a
+        # handful of cache entries per route
+        level = simplification_level(None if zoom is None else min(max(zoom, 0.0), MAX_ZOOM))
+
+        def render():
+            route = db.session.get(RouteTrace, route_id)
+            data = route.geometry_for_zoom(level)
+            if data is None:  # row not yet converted by `flask upgrade-db`
+                geojson = route.to_geojson()
+            else:
+                try:
+                    geojson = decode_geometry(data)
+                except GeometryError:
+                    geojson = None  # unreadable: served as an empty route
+            return dumps_geojson(geojson or {"type": "FeatureCollection", "features": []})
+
+        # Stops are not part of the geometry: only the route's own version counts
+        return response_cache.respond(("geometry", route_id, level), stamp[0], render, "application/geo+json")
+
+    @app.route("/nearby/<kind>")
+    @login_required
+    @permissions_required("navigate_routes")
+    def nearby(kind):
+        """The ``k`` mailbox stops or scans nearest to a point.
+
+        Query parameters: ``lat``/``lng`` (required), ``k`` (1-100, default
+        10), ``radius`` in metres (up to half the equator), and optional
+        ``route_id`` / ``carrier_id`` filters.
+        """
+        tables = {"stops": "mailbox_stop", "scans": "package_scan"}
+        lat = request.args.get("lat", type=float)
+        lng = request.args.get("lng", type=float)
+        k = request.args.get("k", 10, type=int)
+        radius = request.args.get("radius", type=float)
+        if kind not in tables:
+            return jsonify({"success": False, "error": "Unknown kind; use stops or scans"}), 404
+        if lat is None or lng is None:
+            return jsonify({"success": False, "error": "lat and lng are required"}), 400
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return jsonify({"success": False, "error": "lat and lng must be valid coordinates"}), 400
+        if not 1 <= k <= 100:
+            return jsonify({"success": False, "error": "k must be between 1 and 100"}), 400
+        if radius is not None and not 0 < radius <= MAX_SEARCH_M:
+            return jsonify({"success": False, "error": f"radius must be above 0 and at most {MAX_SEARCH_M:.0f} m"}), 400
+        hits = nearest(
+            tables[kind],
+            lat,
+            lng,
+            k=k,
+            radius_m=radius,
+            route_id=request.args.get("route_id", type=int),
+            carrier_id=request.args.get("carrier_id", type=int),
+        )
+        return jsonify({"success": True, "results": hits})
+
+    @app.route("/optimize", methods=["POST"])
+    @login_required
+    @permissions_required("navigate_routes")
+    def optimize():
+        """Order the stops of one or more routes and return ETAs.
+
+        The body is a route in the ``sample-routes.json`` layout, a list of
+        them, or ``{"routes": [...], "depot": {...}, "speed_kmh": ...}``.
+        """
+        data = request.get_json(silent=True)
+        options = data if isinstance(data, dict) and "routes" in data else {}
+        routes = options.get("routes", data)
+        if isinstance(routes, dict):
+            routes = [routes]
+        if not isinstance(routes, list) or not all(isinstance(r, dict) for r in routes):
+            return jsonify({"success": False, "error": "Expected a route or a list of routes"}), 400
+        if len(routes) > app.config["OPTIMIZER_MAX_ROUTES"]:
+            return jsonify({"success": False, "error": "Too many routes in one request"}), 413
+        for route in routes:
+            stops = route.get("stops")
+            if isinstance(stops, list) and len(stops) > app.config["OPTIMIZER_MAX_STOPS"]:
+                error = f"Route {route.get('route_id')!r} has more than {app.config['OPTIMIZER_MAX_STOPS']} stops"
+                return jsonify({"success": False, "error": error}), 400
+        speed_kmh = options.get("speed_kmh")
+        try:
+            results = optimizer_pool.optimize_routes(
+                routes,
+                time_limit=app.config["OPTIMIZER_TIME_LIMIT"],
+                speed_kmh=DEFAULT_SPEED_KMH if speed_kmh is None else speed_kmh,
+                depot=options.get("depot"),
+            )
+        except RouteOptimizationError as exc:
+            return jsonify({"success": False, "error": str(exc)}), 400
+        return jsonify({"success": True, "routes": results})
+
+    # ------------------------------------------------------------------
+    # Routes – Supervisor live tracking
+    # ------------------------------------------------------------------
+    @app.route("/live")
+    @login_required
+    @permissions_required("access_live_tracking")
+    def live_view():
+        """Live list of scans and mailbox stops as carriers commit them."""
+        return render_template("live.html")
+
+    @app.route("/live/scans")
+    @login_required
+    @permissions_required("access_live_tracking")
+    def live_scans():
+        """Server-Sent Events stream of committed scans and mailbox stops.
+
+        ``?route=<id>`` and ``?carrier=<username>`` narrow the stream. On
+        reconnect the browser sends ``Last-Event-ID`` (or pass
+        ``?last_event_id=``) and receives the buffered events it missed.
+        """
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        stream = live_feed.stream(
+            last_event_id=last_event_id,
+            route_id=request.args.get("route", type=int),
+            carrier=request.args.get("carrier") or None,
+        )
+        # The generator needs no request context, so no DB session is held open
+        return Response(
+            stream,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     # ------------------------------------------------------------------
     # Routes – Admin dashboard & utilities
     # ------------------------------------------------------------------
     @app.route("/admin")
     @login_required
-    @roles_required("admin")
+    @permissions_required("data_management")
     def admin_dashboard():
-        users = User.query.all()
-        routes = RouteTrace.query.order_by(RouteTrace.date.desc()).all()
-        return render_template("admin_dashboard.html", users=users, routes=routes)
+        """First page of users and routes; further pages load from the JSON endpoints."""
+        filters = route_filters()
+        users, users_cursor = user_page(limit=app.config["ADMIN_PAGE_SIZE"])
+        routes, routes_cursor = route_page(limit=app.config["ADMIN_PAGE_SIZE"], **filters)
+        return render_template(
+            "admin_dashboard.html",
+            users=users,
+            users_cursor=users_cursor,
+            routes=routes,
+            routes_cursor=routes_cursor,
+            filters=request.args,
+            export_formats=available_formats(),
+        )
+
+    @app.route("/admin/api/routes")
+    @login_required
+    @permissions_required("data_management")
+    def admin_routes_api():
+        """Keyset-paginated routes: ``?cursor=&limit=&carrier=&start=&end=``."""
+        items, next_cursor = route_page(cursor=request.args.get("cursor"), limit=page_size(), **route_filters())
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    @app.route("/admin/api/users")
+    @login_required
+    @permissions_required("manage_users")
+    def admin_users_api():
+        """Keyset-paginated users: ``?cursor=&limit=&role=``."""
+        items, next_cursor = user_page(
+            cursor=request.args.get("cursor"), limit=page_size(), role=request.args.get("role") or None
+        )
+        for item in items:
+            item["delete_url"] = url_for("delete_user", user_id=item["id"])
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    @app.route("/admin/api/rollups/daily")
+    @login_required
+    @permissions_required("data_management")
+    def admin_daily_rollups_api():
+        """Scan totals per carrier and day from the rollups: ``?start=&end=&carrier=``.
+
+        A missing bound spans ``ROLLUP_DEFAULT_DAYS`` from the other one (or
+        ends today). The cost depends on the days shown, not on how many
+        scans were ever recorded.
+        """
+        filters = route_filters()
+        window = timedelta(days=app.config["ROLLUP_DEFAULT_DAYS"] - 1)
+        start, end = filters["start"], filters["end"]
+        if end is None:
+            end = min(start + window, date.today()) if start else date.today()
+        start = start or end - window
+        if start > end or (end - start).days >= app.config["ROLLUP_MAX_DAYS"]:
+            return jsonify({"error": f"Date range must span 1 to {app.config['ROLLUP_MAX_DAYS']} days"}), 400
+        items, days = daily_rollups(start, end, filters["carrier"])
+        return jsonify({"start": start.isoformat(), "end": end.isoformat(), "days": days, "items": items})
+
+    @app.route("/admin/api/rollups/routes")
+    @login_required
+    @permissions_required("data_management")
+    def admin_route_rollups_api():
+        """Keyset-paginated routes with their rollup totals; same parameters as ``/admin/api/routes``."""
+        items, next_cursor = route_rollup_page(cursor=request.args.get("cursor"), limit=page_size(), **route_filters())
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    @app.route("/admin/api/metrics")
+    @login_required
+    @permissions_required("system_configuration")
+    def admin_metrics():
+        """Runtime counters of the in-process caches."""
+        metrics = {
+            "user_cache": user_cache.stats(),
+            "live_feed": live_feed.stats(),
+            "photos": photo_store.stats(),
+            "response_cache": response_cache.stats(),
+            "scan_dedupe": scan_deduper.stats(),
+            "tracking_index": tracking_index.stats(),
+            "voice_intents": intent_matcher.stats(),
+            "permissions": permission_engine.stats(),
+        }
+        if scan_buffer is not None:
+            metrics["scan_buffer"] = scan_buffer.stats()
+        return jsonify(metrics)
 
     @app.route("/admin/user/add", methods=["POST"])
     @login_required
-    @roles_required("admin")
+    @permissions_required("manage_users")
     def add_user():
         username = request.form["username"]
         password = request.form["password"]
@@ -165,47 +939,99 @@ def create_app():
         user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate(user.id)  # ids of deleted users can be reused by SQLite
         flash("User added.", "success")
         return redirect(url_for("admin_dashboard"))
 
     @app.route("/admin/user/delete/<int:user_id>")
     @login_required
-    @roles_required("admin")
+    @permissions_required("manage_users")
     def delete_user(user_id):
         user = User.query.get_or_404(user_id)
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user_id)
         flash("User deleted.", "info")
         return redirect(url_for("admin_dashboard"))
 
     @app.route("/admin/export/csv")
     @login_required
-    @roles_required("admin")
+    @permissions_required("data_management")
     def export_csv():
-        """Generate a CSV of all scans for download."""
-        si = StringIO()
-        cw = csv.writer(si)
-        cw.writerow(["Date", "Carrier", "Barcode", "TooBig", "TooSmall", "Lat", "Lng", "Timestamp"])
-        scans = PackageScan.query.order_by(PackageScan.timestamp.desc()).all()
-        for scan in scans:
-            cw.writerow([
-                scan.route.date,
-                scan.route.carrier.username,
-                scan.barcode,
-                scan.too_big,
-                scan.too_small,
-                scan.lat,
-                scan.lng,
-                scan.timestamp,
-            ])
-        output = si.getvalue()
-        return send_file(
-            StringIO(output),
-            mimetype="text/csv",
-            as_attachment=True,
-            download_name="scans.csv",
+        """Stream a CSV of scans for download.
+
+        Optional query parameters: ``start``/``end`` (ISO dates, inclusive,
+        matched against the scan timestamp), ``carrier`` (username) and
+        ``gzip=1`` to compress the stream.
+        """
+        start = request.args.get("start", type=date.fromisoformat)
+        end = request.args.get("end", type=date.fromisoformat)
+        carrier = request.args.get("carrier")
+        compress = request.args.get("gzip", type=int, default=0) == 1
+
+        chunk_size = app.config["EXPORT_CHUNK_SIZE"]
+        query = scan_export_query(start, end, carrier).yield_per(chunk_size)
+
+        def generate_rows():
+            # Rows are pulled from the cursor one chunk at a time, so memory
+            # stays bounded by EXPORT_CHUNK_SIZE regardless of table size.
+            si = StringIO()
+            cw = csv.writer(si)
+            cw.writerow(["Date", "Carrier", "Barcode", "TooBig", "TooSmall", "Lat", "Lng", "Timestamp"])
+            for count, row in enumerate(query, start=1):
+                cw.writerow(row)
+                if count % chunk_size == 0:
+                    yield si.getvalue()
+                    si.seek(0)
+                    si.truncate()
+            yield si.getvalue()
+
+        def generate_gzip():
+            compressor = zlib.compressobj(wbits=31)  # gzip container
+            for text in generate_rows():
+                chunk = compressor.compress(text.encode("utf-8"))
+                if chunk:
+                    yield chunk
+            yield compressor.flush()
+
+        if compress:
+            body, mimetype, filename = generate_gzip(), "application/gzip", "scans.csv.gz"
+        else:
+            body, mimetype, filename = generate_rows(), "text/csv", "scans.csv"
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
         )
 
+    @app.route("/admin/export/columnar")
+    @login_required
+    @permissions_required("data_management")
+    def export_columnar():
+        """Download scans as typed columns (see database/export.py).
+
+        Takes the same filters as :func:`export_csv` plus ``format``
+        (``parquet`` or ``npz``; default: Parquet when pyarrow is installed).
+        The file is built in a temporary file, then sent.
+        """
+        start = request.args.get("start", type=date.fromisoformat)
+        end = request.args.get("end", type=date.fromisoformat)
+        carrier = request.args.get("carrier")
+        try:
+            fmt = resolve_format(request.args.get("format"))
+        except ExportFormatError as exc:
+            return jsonify({"error": str(exc)}), 400
+
+        out = tempfile.TemporaryFile()
+        try:
+            export_scans(out, fmt, start, end, carrier, chunk_size=app.config["EXPORT_COLUMNAR_CHUNK_SIZE"])
+        except BaseException:
+            out.close()
+            raise
+        out.seek(0)
+        mimetype, suffix = EXPORT_FORMATS[fmt]
+        return send_file(out, mimetype=mimetype, as_attachment=True, download_name=f"scans{suffix}")
+
     # ------------------------------------------------------------------
     # CLI helper – initialise DB
     # ------------------------------------------------------------------
@@ -213,6 +1039,9 @@ def create_app():
     def init_db():  # noqa: D401
         """Create all tables and a default admin user."""
         db.create_all()
+        create_spatial_index()
+        create_rollups()
+        create_sync()
         if not User.query.filter_by(username="admin").first():
             admin = User(username="admin", role="admin")
             admin.set_password("admin")
@@ -220,6 +1049,107 @@ def create_app():
             db.session.commit()
         print("✅ Database initialised with default admin (admin/admin)")
 
+    @app.cli.command("import-deliveries")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--workers", type=int, default=1, help="Parser processes (1 = in-process).")
+    @click.option("--chunk-mb", type=float, default=DEFAULT_CHUNK_BYTES / 2**20, help="Rows committed per chunk, in MiB of CSV.")
+    @click.option("--create-carriers/--skip-unknown-carriers", default=True, help="Create users for unknown carrier names.")
+    @click.option("--restart", is_flag=True, help="Ignore the saved checkpoint and import from the top.")
+    def import_deliveries_command(path, workers, chunk_mb, create_carriers, restart):  # noqa: D401
+        """Bulk-load a delivery-log CSV as scans, resuming an interrupted import."""
+
+        def progress(stats):
+            rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0
+            print(f"  {stats['rows']:>12,} rows  {rate:>9,.0f} rows/s  offset {stats['offset']:,}")
+
+        try:
+            stats = import_deliveries(
+                path,
+                chunk_bytes=int(chunk_mb * 2**20),
+                workers=workers,
+                create_carriers=create_carriers,
+                restart=restart,
+                progress=progress,
+            )
+        except DeliveryImportError as exc:
+            raise SystemExit(f"❌ {exc}")
+        print(
+            f"✅ Imported {stats['rows']:,} scans in {stats['seconds']:.1f}s "
+            f"({stats['carriers_created']} carriers, {stats['routes_created']} routes created; "
+            f"{stats['rejected']} rejected, {stats['unknown_carrier']} unknown carrier)"
+        )
+
+    @app.cli.command("import-packages")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def import_packages_command(path):  # noqa: D401
+        """Upsert a sample-packages.json style manifest into the package table."""
+        try:
+            stats = import_packages(path)
+        except ManifestImportError as exc:
+            raise SystemExit(f"❌ {exc}")
+        print(f"✅ Imported {stats['packages']:,} packages in {stats['seconds']:.1f}s ({stats['rejected']} rejected)")
+
+    @app.cli.command("export-scans")
+    @click.argument("path", type=click.Path(dir_okay=False, writable=True))
+    @click.option("--format", "fmt", type=click.Choice(sorted(EXPORT_FORMATS)), default=None,
+                  help="Output format (default: from the file suffix, else Parquet if pyarrow is installed).")
+    @click.option("--start", type=date.fromisoformat, default=None, help="First scan date (YYYY-MM-DD).")
+    @click.option("--end", type=date.fromisoformat, default=None, help="Last scan date (YYYY-MM-DD).")
+    @click.option("--carrier", default=None, help="Only this carrier's scans.")
+    def export_scans_command(path, fmt, start, end, carrier):  # noqa: D401
+        """Write scans to a Parquet or .npz file for analysis."""
+        if fmt is None:
+            fmt = next((name for name, (_, suffix) in EXPORT_FORMATS.items() if path.endswith(suffix)), None)
+        try:
+            fmt = resolve_format(fmt)
+        except ExportFormatError as exc:
+            raise SystemExit(f"❌ {exc}")
+        rows = export_scans(path, fmt, start, end, carrier, chunk_size=app.config["EXPORT_COLUMNAR_CHUNK_SIZE"])
+        print(f"✅ Exported {rows:,} scans to {path} ({fmt})")
+
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():  # noqa: D401
+        """Bring an existing database up to the current schema."""
+        changes = upgrade_db()
+        for change in changes:
+            print(f"  + {change}")
+        print(f"✅ Database upgraded ({len(changes)} changes)")
+
+    @app.cli.command("rebuild-route-levels")
+    def rebuild_route_levels_command():  # noqa: D401
+        """Recompute simplified geometry levels for every route."""
+        count = rebuild_geometry_levels()
+        print(f"✅ Rebuilt geometry levels for {count} routes")
+
+    @app.cli.command("rebuild-rollups")
+    def rebuild_rollups_command():  # noqa: D401
+        """Recompute the per-route and per-carrier-day scan rollups from scratch."""
+        create_rollups(backfill=False)
+        route_rows, daily_rows = rebuild_rollups()
+        print(f"✅ Rebuilt rollups for {route_rows} routes and {daily_rows} carrier-days")
+
+    @app.cli.command("optimize-routes")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--workers", type=int, default=None, help="Process-pool size (1 = in-process).")
+    @click.option("--time-limit", type=float, default=2.0, help="Local-search seconds per route.")
+    def optimize_routes_command(path, workers, time_limit):  # noqa: D401
+        """Optimise the routes in a sample-routes.json style file and print JSON."""
+        with open(path, encoding="utf-8") as fh:
+            routes = json.load(fh)
+        results = optimize_routes(routes if isinstance(routes, list) else [routes], workers=workers, time_limit=time_limit)
+        print(json.dumps(results, indent=2))
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans_command():  # noqa: D401
+        """Fail if any hot query falls back to a full table scan."""
+        plans, failures = check_query_plans()
+        for name, plan in plans.items():
+            print(f"{'❌' if name in failures else '✅'} {name}")
+            for line in plan:
+                print(f"    {line}")
+        if failures:
+            raise SystemExit(f"Full table scans in: {', '.join(sorted(failures))}")
+
     return app
 
 
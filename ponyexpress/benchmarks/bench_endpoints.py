@@ -0,0 +1,323 @@
+"""Mixed-workload endpoint benchmark.
+
+Seeds a database at the requested scale, then ``--clients`` threads each
+act as one carrier and share the admin account. For ``--duration`` seconds
+each thread picks requests by the weights in ``WORKLOAD``:
+- the carrier's scans, map, route pages and device sync;
+- the admin dashboard, its JSON pages and week-long CSV exports.
+Reports throughput and latency percentiles per endpoint.
+
+``--output`` writes the results as JSON. ``--baseline`` compares this run
+with an earlier results file and exits non-zero when an endpoint's
+``--metric`` got more than ``--threshold`` slower (or more requests
+failed). ``--compare OLD NEW`` compares two saved files without running
+anything. ``--database`` keeps the seeded database for later runs. The
+workload adds scans and routes, so reuse it only for runs that are
+compared with each other.
+
+    python -m benchmarks.bench_endpoints --carriers 100 --routes 50000 --scans 5000000 \\
+        --duration 60 --clients 4 --database /tmp/ponyxpress-bench.db --output after.json \\
+        --baseline before.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from app import create_app
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import db, RouteTrace, User
+from database.rollups import create_rollups
+from database.spatial import create_spatial_index
+from database.sync import create_sync
+
+FORMAT = 1  # results file layout
+
+# name: (weight, who sends it)
+WORKLOAD = {
+    "POST /scan/<id>": (40, "carrier"),
+    "GET /scan/<id>": (5, "carrier"),
+    "GET /map": (8, "carrier"),
+    "POST /map": (3, "carrier"),
+    "GET /route/<id>": (10, "carrier"),
+    "GET /route/<id>/geometry": (8, "carrier"),
+    "GET /sync": (4, "carrier"),
+    "GET /admin": (8, "admin"),
+    "GET /admin?carrier=": (4, "admin"),
+    "GET /admin/api/routes": (6, "admin"),
+    "GET /admin/export/csv": (4, "admin"),
+}
+
+
+class Session:
+    """One simulated carrier (and a client for the shared admin account)."""
+
+    def __init__(self, app, carrier, route_ids, carriers, seed_):
+        self.rng = random.Random(seed_)
+        self.route_ids = route_ids
+        self.carriers = carriers
+        self.clients = {"carrier": login(app.test_client(), carrier), "admin": login(app.test_client(), "admin")}
+        for client in self.clients.values():
+            client.get("/", follow_redirects=True)  # shows the login flash
+
+    def request(self, name):
+        """Send one ``name`` request; return ``(ok, response bytes)``."""
+        rng, route_id = self.rng, self.rng.choice(self.route_ids)
+        client = self.clients[WORKLOAD[name][1]]
+        if name == "POST /scan/<id>":
+            scan = {
+                "barcode": f"94055{rng.randrange(10**16):016d}",
+                "too_small": rng.random() < 0.2,
+                "lat": 40.7 + rng.uniform(-0.2, 0.2),
+                "lng": -74.0 + rng.uniform(-0.2, 0.2),
+            }
+            response = client.post(f"/scan/{route_id}", json=scan)
+        elif name == "GET /scan/<id>":
+            response = client.get(f"/scan/{route_id}")
+        elif name == "GET /map":
+            response = client.get("/map")
+        elif name == "POST /map":
+            lat, lng = 40.7 + rng.uniform(-0.2, 0.2), -74.0 + rng.uniform(-0.2, 0.2)
+            line = [[lng + i * 0.0005, lat + rng.uniform(-0.0003, 0.0003)] for i in range(200)]
+            response = client.post("/map", json={"geojson": {"type": "LineString", "coordinates": line}})
+        elif name == "GET /route/<id>":
+            response = client.get(f"/route/{route_id}")
+        elif name == "GET /route/<id>/geometry":
+            response = client.get(f"/route/{route_id}/geometry?zoom={rng.randint(10, 18)}")
+        elif name == "GET /sync":
+            response = client.get("/sync?limit=500")
+        elif name == "GET /admin":
+            response = client.get("/admin")
+        elif name == "GET /admin?carrier=":
+            response = client.get(f"/admin?carrier={rng.choice(self.carriers)}")
+        elif name == "GET /admin/api/routes":
+            response = client.get(f"/admin/api/routes?start={random_day(rng)}")
+        elif name == "GET /admin/export/csv":
+            start = random_day(rng)
+            response = client.get(
+                f"/admin/export/csv?carrier={rng.choice(self.carriers)}&start={start}&end={start + timedelta(days=6)}"
+            )
+        size = len(response.get_data())  # drains streamed bodies
+        return response.status_code == 200, size
+
+
+def random_day(rng):
+    # Seeded scans fall within 365 days of 2025-01-01
+    return date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+
+
+def open_app(args):
+    """App on ``--database`` (seeded on first use) or on a fresh temporary database."""
+    routes_per_carrier = max(1, args.routes // args.carriers)
+    scans_per_route = max(0, args.scans // (routes_per_carrier * args.carriers))
+    if args.database:
+        existing = os.path.exists(args.database)
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(args.database)}"})
+        if existing:
+            routes = carrier_routes(app)
+            print(f"Reusing {args.database}: {len(routes)} carriers, {sum(map(len, routes.values())):,} routes")
+            return app, routes, 0.0
+        with app.app_context():
+            db.create_all()
+            create_spatial_index()
+            create_rollups()
+            create_sync()
+    else:
+        app, _ = temp_app()
+    started = time.perf_counter()
+    route_ids = seed(app, carriers=args.carriers, routes_per_carrier=routes_per_carrier, scans_per_route=scans_per_route)
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {args.carriers} carriers, {len(route_ids):,} routes, "
+          f"{len(route_ids) * scans_per_route:,} scans in {elapsed:.1f}s")
+    return app, carrier_routes(app), elapsed
+
+
+def carrier_routes(app):
+    """Route ids of each carrier, by username."""
+    routes = {}
+    with app.app_context():
+        query = db.session.query(User.username, RouteTrace.id).join(RouteTrace, RouteTrace.carrier_id == User.id)
+        for username, route_id in query.filter(User.role == "carrier").order_by(User.id, RouteTrace.id):
+            routes.setdefault(username, []).append(route_id)
+    return routes
+
+
+def run(app, routes, args):
+    """Drive the workload; return ``{endpoint: (latencies, errors, bytes)}`` and the measured seconds."""
+    names = list(WORKLOAD)
+    weights = [WORKLOAD[name][0] for name in names]
+    carriers = list(routes)
+    results = {name: ([], [0], [0]) for name in names}
+    lock = threading.Lock()
+    stop, measuring = threading.Event(), threading.Event()
+
+    def worker(index):
+        carrier = carriers[index % len(carriers)]
+        session = Session(app, carrier, routes[carrier], carriers, index)
+        local = {name: ([], 0, 0) for name in names}
+        while not stop.is_set():
+            name = session.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            ok, size = session.request(name)
+            elapsed = time.perf_counter() - started
+            if measuring.is_set():
+                latencies, errors, nbytes = local[name]
+                if ok:
+                    latencies.append(elapsed)
+                local[name] = (latencies, errors + (not ok), nbytes + size)
+        with lock:
+            for name, (latencies, errors, nbytes) in local.items():
+                results[name][0].extend(latencies)
+                results[name][1][0] += errors
+                results[name][2][0] += nbytes
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    measuring.clear()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {name: (lat, errors[0], nbytes[0]) for name, (lat, errors, nbytes) in results.items()}, elapsed
+
+
+def report(results, elapsed, args, seed_seconds, route_count):
+    endpoints = {}
+    for name, (latencies, errors, nbytes) in results.items():
+        stats = summarize(latencies)
+        endpoints[name] = {
+            "requests": stats["count"],
+            "errors": errors,
+            "per_sec": stats["count"] / elapsed,
+            "mean_ms": stats["mean_ms"],
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "p99_ms": stats["p99_ms"],
+            "max_ms": max(latencies) * 1000 if latencies else float("nan"),
+            "kib_per_request": nbytes / 1024 / max(1, stats["count"] + errors),
+        }
+    everything = summarize(lat for latencies, _, _ in results.values() for lat in latencies)
+    return {
+        "format": FORMAT,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": {
+            "carriers": args.carriers,
+            "routes": route_count,
+            "scans": args.scans,
+            "clients": args.clients,
+            "duration": args.duration,
+            "seed_seconds": seed_seconds,
+        },
+        "total": {
+            "requests": everything["count"],
+            "errors": sum(errors for _, errors, _ in results.values()),
+            "per_sec": everything["count"] / elapsed,
+            "p50_ms": everything["p50_ms"],
+            "p95_ms": everything["p95_ms"],
+            "p99_ms": everything["p99_ms"],
+        },
+        "endpoints": endpoints,
+    }
+
+
+def print_results(data):
+    rows = [
+        [name, e["requests"], e["errors"], e["per_sec"], e["p50_ms"], e["p95_ms"], e["p99_ms"], e["kib_per_request"]]
+        for name, e in data["endpoints"].items()
+    ]
+    total = data["total"]
+    rows.append(["total", total["requests"], total["errors"], total["per_sec"], total["p50_ms"], total["p95_ms"],
+                 total["p99_ms"], "-"])
+    print_table(["endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "KiB/req"], rows)
+
+
+def compare(old, new, metric, threshold, min_requests):
+    """Print ``metric`` per endpoint of two results; return the endpoints that regressed.
+
+    Endpoints with fewer than ``min_requests`` successful requests in
+    either run are shown but not judged: their tail percentiles are noise.
+    """
+    rows, regressions = [], []
+    for name, after in new["endpoints"].items():
+        before = old["endpoints"].get(name)
+        if before is None or not before["requests"] or not after["requests"]:
+            continue
+        if min(before["requests"], after["requests"]) < min_requests:
+            rows.append([name, before[metric], after[metric], "-", "too few requests"])
+            continue
+        change = after[metric] / before[metric] - 1 if before[metric] else 0.0
+        failing = after["errors"] / (after["requests"] + after["errors"]) > (
+            before["errors"] / (before["requests"] + before["errors"])
+        ) + 0.01
+        regressed = change > threshold or failing
+        if regressed:
+            regressions.append(name)
+        rows.append([name, before[metric], after[metric], f"{change:+.1%}", "REGRESSION" if regressed else "ok"])
+    print_table(["endpoint", f"before {metric}", f"after {metric}", "change", f"threshold {threshold:.0%}"], rows)
+    return regressions
+
+
+def load(path):
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    if data.get("format") != FORMAT:
+        raise SystemExit(f"❌ {path} is not a bench_endpoints results file (format {FORMAT})")
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--carriers", type=int, default=20)
+    parser.add_argument("--routes", type=int, default=2000, help="Routes in total, spread over the carriers.")
+    parser.add_argument("--scans", type=int, default=200000, help="Scans in total, spread over the routes.")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent simulated carriers.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured.")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds run before measuring.")
+    parser.add_argument("--database", help="SQLite file to seed on first use and reuse afterwards.")
+    parser.add_argument("--output", help="Write the results here as JSON.")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare with.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results files and exit.")
+    parser.add_argument("--metric", default="p95_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown, as a fraction.")
+    parser.add_argument("--min-requests", type=int, default=100, help="Fewest requests an endpoint needs to be judged.")
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = map(load, args.compare)
+    else:
+        old = load(args.baseline) if args.baseline else None  # fail before seeding, not after
+        app, routes, seed_seconds = open_app(args)
+        results, elapsed = run(app, routes, args)
+        new = report(results, elapsed, args, seed_seconds, sum(map(len, routes.values())))
+        print()
+        print_results(new)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as fh:
+                json.dump(new, fh, indent=2)
+            print(f"\nResults written to {args.output}")
+    if old is not None:
+        print()
+        regressions = compare(old, new, args.metric, args.threshold, args.min_requests)
+        if regressions:
+            raise SystemExit(f"❌ {len(regressions)} endpoint(s) regressed: {', '.join(regressions)}")
+        print(f"\n✅ No endpoint's {args.metric} regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
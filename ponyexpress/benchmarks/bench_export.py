@@ -0,0 +1,83 @@
+"""CSV vs columnar scan export benchmark.
+
+Seeds scans, downloads them from ``/admin/export/csv`` (plain and gzip)
+and ``/admin/export/columnar`` (each available format), and reports export
+time, file size and the time to load the file back into typed columns.
+For CSV that means parsing every field back to its date, bool, float or
+datetime; for ``npz`` it means ``np.load``.
+
+    python -m benchmarks.bench_export --carriers 20 --routes 50 --scans-per-route 1000
+"""
+import argparse
+import csv
+import gzip
+import io
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+from benchmarks.common import login, print_table, seed, temp_app
+from database.export import available_formats
+
+
+def load_csv(body, compressed):
+    """Parse an export back into typed Python columns."""
+    text = gzip.decompress(body) if compressed else body
+    reader = csv.reader(io.StringIO(text.decode("utf-8")))
+    next(reader)
+    columns = [[] for _ in range(8)]
+    for day, carrier, barcode, too_big, too_small, lat, lng, ts in reader:
+        columns[0].append(date.fromisoformat(day))
+        columns[1].append(carrier)
+        columns[2].append(barcode)
+        columns[3].append(too_big == "True")
+        columns[4].append(too_small == "True")
+        columns[5].append(float(lat) if lat else None)
+        columns[6].append(float(lng) if lng else None)
+        columns[7].append(datetime.fromisoformat(ts))
+    return len(columns[0])
+
+
+def load_npz(body):
+    with np.load(io.BytesIO(body)) as data:
+        return len({name: data[name] for name in data.files}["timestamp"])
+
+
+def load_parquet(body):
+    import pyarrow.parquet as pq
+
+    return pq.read_table(io.BytesIO(body)).num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--carriers", type=int, default=20)
+    parser.add_argument("--routes", type=int, default=50, help="Routes per carrier.")
+    parser.add_argument("--scans-per-route", type=int, default=1000)
+    args = parser.parse_args()
+
+    app, _ = temp_app()
+    seed(app, carriers=args.carriers, routes_per_carrier=args.routes, scans_per_route=args.scans_per_route)
+    client = login(app.test_client(), "admin")
+
+    runs = [("csv", "/admin/export/csv", lambda b: load_csv(b, False))]
+    runs.append(("csv.gz", "/admin/export/csv?gzip=1", lambda b: load_csv(b, True)))
+    loaders = {"npz": load_npz, "parquet": load_parquet}
+    runs += [(fmt, f"/admin/export/columnar?format={fmt}", loaders[fmt]) for fmt in available_formats()]
+
+    table = []
+    for label, url, load in runs:
+        started = time.perf_counter()
+        response = client.get(url)
+        body = response.get_data()
+        exported = time.perf_counter() - started
+        started = time.perf_counter()
+        rows = load(body)
+        loaded = time.perf_counter() - started
+        table.append([label, rows, exported, len(body) / 2**20, loaded])
+    print_table(["format", "rows", "export s", "size MiB", "load s"], table)
+
+
+if __name__ == "__main__":
+    main()
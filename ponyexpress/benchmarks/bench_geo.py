@@ -0,0 +1,78 @@
+"""Vectorised haversine versus pure-Python loops.
+
+For each point count it times point-to-many distances, polyline length and
+the full N×N distance matrix, plus a memoised matrix lookup. The Python
+matrix at large N is timed on a sample of rows and extrapolated (marked
+with ``~``); the NumPy matrix switches to float32 above ``--float32-above``
+points to keep memory in check.
+
+    python -m benchmarks.bench_geo --sizes 100 1000 10000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from geo import (
+    cached_distance_matrix,
+    clear_matrix_cache,
+    distance_matrix,
+    haversine_m,
+    haversine_many,
+    polyline_length_m,
+)
+
+
+def timed(fn, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--sample-rows", type=int, default=50, help="rows timed for large Python matrices")
+    parser.add_argument("--float32-above", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = []
+    for n in args.sizes:
+        rng = random.Random(n)
+        lats = [40.7 + rng.uniform(-0.1, 0.1) for _ in range(n)]
+        lngs = [-74.0 + rng.uniform(-0.1, 0.1) for _ in range(n)]
+        points = list(zip(lats, lngs))
+        repeat = 5 if n <= 1000 else 1
+
+        py_many = timed(lambda: [haversine_m(lats[0], lngs[0], a, b) for a, b in points], repeat)
+        np_many = timed(lambda: haversine_many(lats[0], lngs[0], lats, lngs), repeat)
+        rows.append([n, "point-to-many", py_many * 1000, np_many * 1000, py_many / np_many])
+
+        py_line = timed(lambda: sum(haversine_m(*points[i], *points[i + 1]) for i in range(n - 1)), repeat)
+        np_line = timed(lambda: polyline_length_m(lats, lngs), repeat)
+        rows.append([n, "polyline length", py_line * 1000, np_line * 1000, py_line / np_line])
+
+        sample = min(n, args.sample_rows) if n > 1000 else n
+        py_matrix = timed(lambda: [[haversine_m(*a, *b) for b in points] for a in points[:sample]]) * n / sample
+        dtype = np.float32 if n > args.float32_above else np.float64
+        np_matrix = timed(lambda: distance_matrix(lats, lngs, dtype=dtype))
+        label = "N×N matrix" + (" (f32)" if dtype is np.float32 else "")
+        py_cell = f"~{py_matrix * 1000:.2f}" if sample < n else py_matrix * 1000
+        rows.append([n, label, py_cell, np_matrix * 1000, py_matrix / np_matrix])
+
+        if n <= args.float32_above:
+            clear_matrix_cache()
+            cached_distance_matrix(points)
+            hit = timed(lambda: cached_distance_matrix(points), repeat)
+            rows.append([n, "cached matrix hit", "-", hit * 1000, np_matrix / hit])
+
+    print_table(["points", "operation", "python ms", "numpy ms", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Delivery-log and package-manifest import benchmark.
+
+Writes a synthetic log in the ``delivery-log-sample.csv`` layout and loads
+it with ``import_deliveries`` for each parser-pool size, reporting rows/s
+and resident memory. A further run is interrupted halfway and resumed to
+check that the checkpoint neither skips nor duplicates rows. Finally a
+``sample-packages.json`` style manifest is imported twice (insert, then
+upsert of the same tracking numbers).
+
+    python -m benchmarks.bench_import --rows 1000000 --workers 1 4 --packages 300000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.common import print_table, temp_app
+from database.importer import import_deliveries, import_packages
+from database.models import db, Package, PackageScan
+
+HEADER = (
+    "delivery_id,tracking_number,carrier_name,delivery_date,delivery_time,address,status,signature,"
+    "photo_taken,delivery_duration_minutes,gps_lat,gps_lng,weather,notes\n"
+)
+
+
+def write_log(path, rows, carriers=50, seed=7):
+    """Synthetic log in date order, like years of exported history."""
+    rng = random.Random(seed)
+    names = [f"Carrier {i}" for i in range(carriers)]
+    day, per_day = date(2022, 1, 1), max(1, rows // 1000)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(HEADER)
+        for n in range(rows):
+            if n and n % per_day == 0:
+                day += timedelta(days=1)
+            fh.write(
+                f"DEL{n:09d},9405511206{n:012d},{rng.choice(names)},{day},"
+                f"{rng.randint(8, 17):02d}:{rng.randint(0, 59):02d}:00,{rng.randint(1, 9999)} Main St,Delivered,"
+                f"Electronic,Yes,{rng.randint(1, 9)},{40.6 + rng.random() * 0.2:.6f},{-74.1 + rng.random() * 0.2:.6f},Clear,\n"
+            )
+
+
+def write_manifest(path, packages, seed=7):
+    """Synthetic manifest as one JSON array, one package per line."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("[\n")
+        for n in range(packages):
+            item = {
+                "tracking_number": f"9405511206{n:012d}",
+                "package_type": rng.choice(["First Class", "Priority Mail", "Priority Express", "Media Mail"]),
+                "weight": round(rng.uniform(0.1, 30), 2),
+                "dimensions": {"length": rng.randint(4, 24), "width": rng.randint(2, 14), "height": rng.randint(1, 10)},
+                "status": "Pending",
+                "destination": {
+                    "name": f"Customer {n}",
+                    "address": f"{rng.randint(1, 9999)} Main St",
+                    "city": "Staten Island",
+                    "state": "NY",
+                    "zip": f"{10000 + rng.randint(0, 300)}",
+                },
+                "special_handling": rng.choice([None, "Fragile", "Signature Required"]),
+                "created_date": "2025-06-22T03:06:22.927100",
+                "estimated_delivery": "2025-06-24T03:06:22.927119",
+            }
+            fh.write(("," if n else "") + json.dumps(item) + "\n")
+        fh.write("]\n")
+
+
+def rss_mib():
+    """Current resident set size (anonymous + file-backed) in MiB."""
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def run(path, workers, args):
+    app, _ = temp_app()
+    peak = [0.0]
+
+    def progress(stats):
+        peak[0] = max(peak[0], rss_mib())
+
+    with app.app_context():
+        stats = import_deliveries(path, chunk_bytes=args.chunk_mb * 2**20, workers=workers, progress=progress)
+    return stats["rows"] / stats["seconds"], peak[0]
+
+
+def resume_check(path, rows, args):
+    app, _ = temp_app()
+    seen = [0]
+
+    def progress(stats):
+        seen[0] = stats["rows"]
+        if stats["rows"] >= rows // 2:
+            raise _Interrupted
+
+    with app.app_context():
+        try:
+            import_deliveries(path, chunk_bytes=args.chunk_mb * 2**20, progress=progress)
+        except _Interrupted:
+            db.session.rollback()
+        import_deliveries(path, chunk_bytes=args.chunk_mb * 2**20)
+        total = PackageScan.query.count()
+        distinct = db.session.query(db.func.count(db.distinct(PackageScan.barcode))).scalar()
+    return seen[0], total, distinct
+
+
+def manifest_runs(path):
+    app, _ = temp_app()
+    results = []
+    with app.app_context():
+        for label in ("insert", "upsert"):
+            before = rss_mib()
+            stats = import_packages(path)
+            results.append([label, stats["packages"], stats["packages"] / stats["seconds"], stats["seconds"], rss_mib() - before])
+        assert Package.query.count() == results[0][1]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--chunk-mb", type=int, default=4)
+    parser.add_argument("--packages", type=int, default=300000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="ponyxpress-bench-"), "deliveries.csv")
+    write_log(path, args.rows)
+    print(f"{args.rows:,} rows, {os.path.getsize(path) / 2**20:.0f} MiB of CSV\n")
+
+    table = []
+    for workers in args.workers:
+        rate, peak = run(path, workers, args)
+        table.append([workers, rate, peak])
+    print_table(["workers", "rows/s", "peak RSS MiB"], table)
+
+    interrupted_at, total, distinct = resume_check(path, args.rows, args)
+    print(f"\nInterrupted after {interrupted_at:,} committed rows; after resuming: {total:,} rows, {distinct:,} distinct")
+
+    manifest = os.path.join(os.path.dirname(path), "packages.json")
+    write_manifest(manifest, args.packages)
+    print(f"\nManifest: {args.packages:,} packages, {os.path.getsize(manifest) / 2**20:.0f} MiB of JSON\n")
+    print_table(["manifest run", "packages", "packages/s", "seconds", "RSS growth MiB"], manifest_runs(manifest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Live scan feed benchmark.
+
+One carrier posts scans while N supervisors watch, first by polling
+``PackageScan`` every ``--poll-interval`` seconds and then over the SSE
+feed. Reports read queries per second against the database and scan-to-screen
+latency for each approach.
+
+    python -m benchmarks.bench_live_feed --subscribers 50 --duration 10
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import db, PackageScan
+
+
+def post_scans(app, route_id, args, stop):
+    client = login(app.test_client(), "carrier0")
+    n = 0
+    while not stop.is_set():
+        client.post(f"/scan/{route_id}", json={"barcode": f"9405{n:018d}", "lat": 40.7, "lng": -74.0})
+        n += 1
+        time.sleep(1 / args.rate)
+    return n
+
+
+def poll(app, args, stop, latencies, queries):
+    last_id = 0
+    while not stop.wait(args.poll_interval):
+        with app.app_context():
+            rows = PackageScan.query.filter(PackageScan.id > last_id).order_by(PackageScan.id).all()
+            queries.append(1)
+            now = datetime.utcnow()
+            for scan in rows:
+                latencies.append((now - scan.timestamp).total_seconds())
+                last_id = scan.id
+            db.session.remove()
+
+
+def subscribe(feed, stop, latencies):
+    for chunk in feed.stream():
+        now = datetime.utcnow()
+        for line in chunk.splitlines():
+            if line.startswith("data: ") and '"barcode"' in line:
+                latencies.append((now - datetime.fromisoformat(json.loads(line[6:])["timestamp"])).total_seconds())
+        if stop.is_set():
+            return
+
+
+def run(mode, args):
+    app, _ = temp_app(LIVE_FEED_HEARTBEAT=0.5)
+    route_ids = seed(app, carriers=1, routes_per_carrier=1, scans_per_route=0)
+    stop = threading.Event()
+    latencies, queries = [], []
+    if mode == "polling":
+        watchers = [threading.Thread(target=poll, args=(app, args, stop, latencies, queries)) for _ in range(args.subscribers)]
+    else:
+        feed = app.extensions["live_feed"]
+        watchers = [threading.Thread(target=subscribe, args=(feed, stop, latencies)) for _ in range(args.subscribers)]
+    for t in watchers:
+        t.start()
+    writer = threading.Thread(target=post_scans, args=(app, route_ids[0], args, stop))
+    writer.start()
+    time.sleep(args.duration)
+    stop.set()
+    writer.join()
+    for t in watchers:
+        t.join()
+    return {"reads_per_sec": len(queries) / args.duration, "delivered": len(latencies), **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=20.0, help="scans per second posted by the carrier")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    args = parser.parse_args()
+
+    rows = []
+    for mode in ("polling", "sse"):
+        result = run(mode, args)
+        rows.append([mode, result["reads_per_sec"], result["delivered"], result["p50_ms"], result["p99_ms"]])
+    print_table(["watchers", "DB reads/s", "events delivered", "p50 ms", "p99 ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
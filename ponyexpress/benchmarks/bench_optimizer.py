@@ -0,0 +1,81 @@
+"""Route optimiser benchmark on generated routes.
+
+For each route size it reports solve time, distance before (nearest
+neighbour only) and after local search, and total minutes late; then it compares
+serial and process-pool throughput on a batch of routes.
+
+    python -m benchmarks.bench_optimizer --sizes 50 200 1000 --batch 16
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import print_table
+from geo import clear_matrix_cache
+from optimizer import optimize_route, optimize_routes
+
+CENTER = (40.7128, -74.0060)
+
+
+def generate_route(size, seed, spread_deg=0.03):
+    """A route with ``size`` stops in a ~6 km box and mixed time windows."""
+    rng = random.Random(seed)
+    windows = ["08:00-18:00", "09:00-17:00", "09:00-12:00", "13:00-17:00", None]
+    return {
+        "route_id": f"GEN{size}-{seed}",
+        "start_time": "08:00:00",
+        "stops": [
+            {
+                "stop_id": i + 1,
+                "coordinates": {
+                    "lat": CENTER[0] + rng.uniform(-spread_deg, spread_deg),
+                    "lng": CENTER[1] + rng.uniform(-spread_deg, spread_deg),
+                },
+                "time_window": rng.choices(windows, weights=[5, 3, 1, 1, 5])[0],
+                "estimated_duration": rng.randint(1, 4),
+            }
+            for i in range(size)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 200, 1000])
+    parser.add_argument("--time-limit", type=float, default=2.0, help="local-search seconds per route")
+    parser.add_argument("--batch", type=int, default=16, help="routes for the pool comparison")
+    parser.add_argument("--batch-size", type=int, default=150, help="stops per route in the batch")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        route = generate_route(size, seed=size)
+        baseline = optimize_route(route, time_limit=0)
+        clear_matrix_cache()  # time the matrix build too
+        started = time.perf_counter()
+        result = optimize_route(route, time_limit=args.time_limit)
+        elapsed = time.perf_counter() - started
+        rows.append([
+            size,
+            elapsed * 1000,
+            baseline["total_distance_m"] / 1000,
+            result["total_distance_m"] / 1000,
+            baseline["late_minutes"],
+            result["late_minutes"],
+        ])
+    print_table(["stops", "solve ms", "NN km", "optimised km", "NN late min", "late min"], rows)
+
+    routes = [generate_route(args.batch_size, seed=1000 + i) for i in range(args.batch)]
+    timings = []
+    for label, workers in [("serial", 1), ("process pool", args.workers)]:
+        started = time.perf_counter()
+        optimize_routes(routes, workers=workers, time_limit=args.time_limit)
+        elapsed = time.perf_counter() - started
+        timings.append([label, args.batch, elapsed, args.batch / elapsed])
+    print()
+    print_table(["mode", "routes", "seconds", "routes/s"], timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Permission check benchmark.
+
+Times one permission check three ways: the compiled bitsets of
+:class:`PermissionEngine`, reading and parsing ``roles-permissions.json``
+on every call (expanding ``all_*_permissions``), and a hard-coded role
+tuple (how views were guarded before the engine). Then times ``GET /live`` for a supervisor,
+which goes through ``permissions_required``.
+
+    python -m benchmarks.bench_permissions --checks 100000
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import BENCH_PASSWORD, login, print_table, summarize, temp_app
+from database.models import db, User
+from permissions import PermissionEngine
+
+PERMISSIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "..", "roles-permissions.json")
+
+
+def parse_per_call(path):
+    def has(role, permission):
+        with open(path, encoding="utf-8") as fh:
+            roles = json.load(fh)["roles"]
+        pending, granted = [role], set()
+        while pending:
+            for name in roles.get(pending.pop(), {}).get("permissions", ()):
+                if name.startswith("all_") and name.endswith("_permissions"):
+                    pending.append(name[4:-12])
+                else:
+                    granted.add(name)
+        return permission in granted
+
+    return has
+
+
+def timed(fn, checks):
+    cases = [("carrier", "take_photos"), ("admin", "access_live_tracking"), ("supervisor", "manage_users")]
+    samples = []
+    for n in range(checks):
+        role, permission = cases[n % len(cases)]
+        started = time.perf_counter()
+        fn(role, permission)
+        samples.append(time.perf_counter() - started)
+    stats = summarize(samples)
+    return [stats["p50_ms"] * 1000, stats["p99_ms"] * 1000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--permissions", default=PERMISSIONS)
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = PermissionEngine(args.permissions)
+    engine.reload()
+    roles = {"take_photos": ("carrier", "substitute", "admin"), "access_live_tracking": ("supervisor", "admin")}
+    rows = [
+        ["compiled bitsets", *timed(engine.has, args.checks)],
+        ["parse JSON per check", *timed(parse_per_call(args.permissions), args.checks // 10)],
+        ["role tuple", *timed(lambda role, p: role in roles.get(p, ()), args.checks)],
+    ]
+
+    app, _ = temp_app(PERMISSIONS_PATH=args.permissions)
+    with app.app_context():
+        user = User(username="supervisor0", role="supervisor")
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    client = login(app.test_client(), "supervisor0")
+    client.get("/")  # the login flash
+    samples = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        assert client.get("/live").status_code == 200
+        samples.append(time.perf_counter() - started)
+    stats = summarize(samples)
+    rows.append(["GET /live (whole request)", stats["p50_ms"] * 1000, stats["p99_ms"] * 1000])
+    print(f"{engine.stats()['permissions']} permissions, {engine.stats()['roles']} roles, "
+          f"compiled in {engine.stats()['compile_ms']:.2f} ms\n")
+    print_table(["check", "p50 µs", "p99 µs"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Photo upload benchmark: scan latency while photos stream in.
+
+One thread posts scans back to back while ``--uploaders`` threads post
+distinct camera-sized JPEGs to ``/photos``, ``--rate`` photos/s in total.
+The run is repeated with no uploads, with variants rendered inline on the
+upload thread (``PHOTO_WORKERS=0``) and with the background pool. Each run
+reports scan latency, photo throughput and upload latency. A final pass
+re-uploads every photo to check that duplicates are not stored again.
+
+    python -m benchmarks.bench_photos --duration 10 --uploaders 4 --rate 2
+"""
+import argparse
+import io
+import os
+import tempfile
+import threading
+import time
+
+from PIL import Image
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+
+
+def camera_jpeg(width, height):
+    """A noisy JPEG, roughly the size of a phone photo."""
+    image = Image.effect_noise((width, height), 48).convert("RGB")
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def originals(root):
+    """Stored photos, not counting their variants."""
+    return sum(1 for _, _, files in os.walk(root) for f in files if "-" not in f)
+
+
+def run(workers, uploaders, rate, duration, photo):
+    folder = tempfile.mkdtemp(prefix="ponyxpress-photos-")
+    app, _ = temp_app(UPLOAD_FOLDER=folder, PHOTO_WORKERS=workers)
+    route_ids = seed(app, carriers=uploaders + 1, routes_per_carrier=1, scans_per_route=1)
+    stop = threading.Event()
+    scan_samples, upload_samples, bodies = [], [], []
+
+    def scanner():
+        client = login(app.test_client(), "carrier0")
+        n = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.post(f"/scan/{route_ids[0]}", json={"barcode": f"9405{n:018d}", "lat": 40.7, "lng": -74.0})
+            scan_samples.append(time.perf_counter() - started)
+            n += 1
+
+    def uploader(index):
+        client = login(app.test_client(), f"carrier{index + 1}")
+        n = 0
+        interval = uploaders / rate
+        next_at = time.perf_counter() + interval * index / uploaders  # staggered start
+        while not stop.wait(max(0.0, next_at - time.perf_counter())):
+            next_at += interval
+            # Bytes after the JPEG end marker make each upload distinct
+            body = photo + f"{index}-{n}".encode()
+            started = time.perf_counter()
+            response = client.post("/photos", data=body, content_type="image/jpeg")
+            assert response.status_code == 201, response.get_json()
+            upload_samples.append(time.perf_counter() - started)
+            bodies.append(body)
+            n += 1
+
+    threads = [threading.Thread(target=scanner)]
+    threads += [threading.Thread(target=uploader, args=(i,)) for i in range(uploaders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    store = app.extensions["photo_store"]
+    store.close()
+    return app, folder, summarize(scan_samples), summarize(upload_samples), bodies, store.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="Photos per second, all uploaders together.")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+
+    photo = camera_jpeg(args.width, args.height)
+    print(f"{args.width}x{args.height} JPEG, {len(photo) / 2**20:.1f} MiB\n")
+
+    rows = []
+    for label, workers, uploaders in (
+        ("no uploads", 1, 0),
+        ("inline variants", 0, args.uploaders),
+        ("pool variants", 1, args.uploaders),
+    ):
+        app, folder, scans, uploads, bodies, stats = run(workers, uploaders, args.rate, args.duration, photo)
+        rows.append([
+            label,
+            scans["count"] / args.duration,
+            scans["p50_ms"],
+            scans["p99_ms"],
+            len(bodies) / args.duration,
+            uploads["p50_ms"] if bodies else "-",
+            uploads["p99_ms"] if bodies else "-",
+            stats["rendered"],
+        ])
+    print_table(
+        ["mode", "scans/s", "scan p50 ms", "scan p99 ms", "photos/s", "upload p50 ms", "upload p99 ms", "rendered"], rows
+    )
+
+    # Re-upload everything from the last run: no new originals should appear
+    before = originals(folder)
+    client = login(app.test_client(), "carrier1")
+    created = sum(client.post("/photos", data=body, content_type="image/jpeg").status_code == 201 for body in bodies)
+    print(f"\nRe-uploaded {len(bodies)} photos: {created} created, stored originals {before} -> {originals(folder)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Daily rollup benchmark.
+
+Seeds a year of routes per carrier and compares the dashboard's daily
+totals computed on the fly from ``PackageScan`` with the same totals read
+from ``DailyCarrierRollup``, for a 30-day and a full-year window. Also
+measures what the rollup triggers add to a single scan POST.
+
+    python -m benchmarks.bench_rollups --carriers 20 --scans-per-route 100
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, text
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import db, PackageScan, RouteTrace, User
+from database.queries import daily_rollups
+
+
+def on_the_fly(start, end):
+    """What a report had to run before the rollups existed."""
+    return (
+        db.session.query(
+            RouteTrace.date,
+            User.username,
+            func.count(PackageScan.id),
+            func.sum(PackageScan.too_big),
+            func.sum(PackageScan.too_small),
+            func.min(PackageScan.timestamp),
+            func.max(PackageScan.timestamp),
+        )
+        .join(PackageScan, PackageScan.route_id == RouteTrace.id)
+        .outerjoin(User, RouteTrace.carrier_id == User.id)
+        .filter(RouteTrace.date >= start, RouteTrace.date <= end)
+        .group_by(RouteTrace.date, RouteTrace.carrier_id)
+        .order_by(RouteTrace.date.desc())
+        .all()
+    )
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)["p50_ms"]
+
+
+def scan_latency(app, route_id, requests):
+    client = login(app.test_client(), "carrier0")
+    samples = []
+    for n in range(requests):
+        started = time.perf_counter()
+        client.post(f"/scan/{route_id}", json={"barcode": f"9405{n:018d}", "lat": 40.7, "lng": -74.0})
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)["p50_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--carriers", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--scans-per-route", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    app, _ = temp_app()
+    route_ids = seed(app, carriers=args.carriers, routes_per_carrier=args.days, scans_per_route=args.scans_per_route)
+    first = date(2025, 1, 1)
+    rows = []
+    with app.app_context():
+        total = PackageScan.query.count()
+        for label, days in (("30 days", 30), (f"{args.days} days", args.days)):
+            start, end = first, first + timedelta(days=days - 1)
+            rows.append([
+                label,
+                timed(lambda: on_the_fly(start, end), args.repeat),
+                timed(lambda: daily_rollups(start, end), args.repeat),
+            ])
+    print(f"{total:,} scans over {len(route_ids):,} routes\n")
+    print_table(["window", "on the fly p50 ms", "rollups p50 ms"], rows)
+
+    with_triggers = scan_latency(app, route_ids[0], args.requests)
+    with app.app_context():
+        for name in ("package_scan_rollup_insert", "mailbox_stop_rollup_insert"):
+            db.session.execute(text(f"DROP TRIGGER {name}"))
+        db.session.commit()
+    without_triggers = scan_latency(app, route_ids[0], args.requests)
+    print()
+    print_table(["scan POST", "p50 ms"], [["without rollups", without_triggers], ["with rollups", with_triggers]])
+
+
+if __name__ == "__main__":
+    main()
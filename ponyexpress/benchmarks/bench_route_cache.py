@@ -0,0 +1,111 @@
+"""Route page response cache benchmark.
+
+Substitutes open the same few routes again and again during a shift. Each
+visit loads the route page and the route geometry at two zoom levels.
+Every ``--edit-every`` visits one route gets a new mailbox stop, which has
+to invalidate its cached responses. The same visit sequence is replayed
+three ways:
+
+``no cache``
+    ``RESPONSE_CACHE_BYTES=0``: every request renders and sends the full body.
+``server cache``
+    Bodies come from the cache, precompressed, but the client keeps no copy.
+``server cache + ETags``
+    As above, and the client revalidates with ``If-None-Match`` like a browser.
+
+Reports latency, bytes on the wire per visit and the cache's hit ratio.
+
+    python -m benchmarks.bench_route_cache --routes 20 --clients 10 --visits 2000 --points 3000
+"""
+import argparse
+import math
+import random
+import time
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import db, MailboxStop, RouteTrace
+
+
+def gps_trace(rng, points):
+    """A carrier's day as a GPS random walk."""
+    lat, lng, heading = 40.7, -74.0, 0.0
+    coordinates = []
+    for _ in range(points):
+        heading += rng.uniform(-0.5, 0.5)
+        lat += 0.0002 * math.cos(heading)
+        lng += 0.0002 * math.sin(heading)
+        coordinates.append([round(lng, 6), round(lat, 6)])
+    return {"type": "LineString", "coordinates": coordinates}
+
+
+def run(label, args, cache_bytes, revalidate):
+    app, _ = temp_app(RESPONSE_CACHE_BYTES=cache_bytes)
+    route_ids = seed(app, carriers=args.clients, routes_per_carrier=1, scans_per_route=1)
+    rng = random.Random(42)
+    with app.app_context():
+        routes = RouteTrace.query.order_by(RouteTrace.id).limit(args.routes).all()
+        for route in routes:
+            route.set_geometry(gps_trace(rng, args.points))
+        db.session.commit()
+    route_ids = route_ids[: args.routes]
+
+    clients = []
+    for n in range(args.clients):
+        client = login(app.test_client(), f"carrier{n}")
+        client.get("/")  # show the login flash, so route pages are cacheable
+        clients.append((client, {}))
+
+    headers = {"Accept-Encoding": "gzip, deflate, br"}
+    samples, wire = [], 0
+    for visit in range(args.visits):
+        if args.edit_every and visit % args.edit_every == args.edit_every - 1:
+            with app.app_context():
+                db.session.add(MailboxStop(route_id=rng.choice(route_ids), lat=40.7, lng=-74.0))
+                db.session.commit()
+        client, etags = rng.choice(clients)
+        route_id = rng.choice(route_ids)
+        for url in (f"/route/{route_id}", f"/route/{route_id}/geometry?zoom=12", f"/route/{route_id}/geometry?zoom=15"):
+            request_headers = dict(headers)
+            if revalidate and url in etags:
+                request_headers["If-None-Match"] = etags[url]
+            started = time.perf_counter()
+            response = client.get(url, headers=request_headers)
+            samples.append(time.perf_counter() - started)
+            assert response.status_code in (200, 304), (url, response.status_code)
+            etags[url] = response.headers["ETag"]
+            wire += len(response.get_data())
+
+    stats = app.extensions["response_cache"].stats()
+    latency = summarize(samples)
+    return [
+        label,
+        latency["p50_ms"],
+        latency["p99_ms"],
+        wire / args.visits / 1024,
+        stats["hit_ratio"],
+        stats["not_modified"],
+        stats["stale"],
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--visits", type=int, default=2000)
+    parser.add_argument("--points", type=int, default=3000, help="GPS points per route.")
+    parser.add_argument("--edit-every", type=int, default=50, help="Visits between mailbox stop edits (0 = never).")
+    args = parser.parse_args()
+
+    rows = [
+        run("no cache", args, 0, False),
+        run("server cache", args, 32 * 1024 * 1024, False),
+        run("server cache + ETags", args, 32 * 1024 * 1024, True),
+    ]
+    print(f"{args.visits} visits to {args.routes} routes of {args.points} points by {args.clients} clients, "
+          f"a stop edit every {args.edit_every} visits\n")
+    print_table(["mode", "p50 ms", "p99 ms", "KiB/visit", "hit ratio", "304s", "stale"], rows)
+
+
+if __name__ == "__main__":
+    main()
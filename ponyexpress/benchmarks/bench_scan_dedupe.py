@@ -0,0 +1,78 @@
+"""Scan deduplication benchmark.
+
+Replays a carrier's shift as the scan page sends it: every label is
+reported one to ``--max-repeats`` times in a row, the way Quagga fires
+while a label stays in view, and a fifth of the labels are small packages
+that create an "Auto stop". The whole shift is then resent through
+``/scan/<id>/batch``, as an offline device would after reconnecting.
+
+Runs once with the in-memory front and once with only the unique index
+(``SCAN_DEDUPE_ROUTES=0``). Reports latency of new and duplicate scans and
+checks that exactly one scan and one stop were stored per label.
+
+    python -m benchmarks.bench_scan_dedupe --labels 2000 --max-repeats 4
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import MailboxStop, PackageScan
+
+
+def run(label, args, routes):
+    app, _ = temp_app(SCAN_DEDUPE_ROUTES=routes)
+    route_id = seed(app, carriers=1, routes_per_carrier=1, scans_per_route=0)[0]
+    client = login(app.test_client(), "carrier0")
+    rng = random.Random(7)
+    new, duplicate, shift = [], [], []
+    for n in range(args.labels):
+        scan = {"barcode": f"9405{n:018d}", "key": f"label-{n}", "too_small": n % 5 == 0, "lat": 40.7, "lng": -74.0}
+        shift.append(scan)
+        for repeat in range(rng.randint(1, args.max_repeats)):
+            started = time.perf_counter()
+            result = client.post(f"/scan/{route_id}", json=scan).get_json()
+            (duplicate if repeat else new).append(time.perf_counter() - started)
+            assert result["success"] and bool(result.get("duplicate")) == bool(repeat), result
+
+    started = time.perf_counter()
+    for offset in range(0, len(shift), 500):
+        result = client.post(f"/scan/{route_id}/batch", json=shift[offset:offset + 500]).get_json()
+        assert result["accepted"] == 0, result["accepted"]
+    replay = time.perf_counter() - started
+
+    with app.app_context():
+        scans = PackageScan.query.filter_by(route_id=route_id).count()
+        stops = MailboxStop.query.filter_by(route_id=route_id).count()
+    assert scans == args.labels and stops == len(range(0, args.labels, 5)), (scans, stops)
+    stats = app.extensions["scan_deduper"].stats()
+    new, duplicate = summarize(new), summarize(duplicate)
+    return [
+        label,
+        new["p50_ms"],
+        duplicate["count"],
+        duplicate["p50_ms"],
+        duplicate["p99_ms"],
+        replay,
+        stats["duplicates_memory"],
+        stats["duplicates_db"],
+        scans,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", type=int, default=2000)
+    parser.add_argument("--max-repeats", type=int, default=4, help="Most times one label is reported in a row.")
+    args = parser.parse_args()
+
+    rows = [run("memory front + index", args, 1024), run("unique index only", args, 0)]
+    print(f"{args.labels} labels, each reported 1-{args.max_repeats} times, then the shift resent as batches\n")
+    print_table(
+        ["mode", "new p50 ms", "duplicates", "dup p50 ms", "dup p99 ms", "replay s", "in memory", "by index", "stored"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Nearest-stop query benchmark: R*Tree index versus naive scans.
+
+Seeds ``--points`` mailbox stops around a city centre, then answers
+``--queries`` k-nearest lookups three ways and reports latency percentiles:
+
+* ``python``  – load every point and rank in Python (what callers do today),
+* ``sql-box`` – bounding-box filter on the unindexed lat/lng columns,
+* ``rtree``   – :func:`database.spatial.nearest` via the R*Tree index.
+
+    python -m benchmarks.bench_spatial --points 1000000 --queries 200
+"""
+import argparse
+import heapq
+import random
+import time
+
+from sqlalchemy import insert, text
+
+from benchmarks.common import print_table, seed, summarize, temp_app
+from database.models import db, MailboxStop
+from database.spatial import nearest
+from geo import bounding_box, haversine_m
+
+CENTER = (40.7128, -74.0060)
+SPREAD_DEG = 0.5  # ~55 km box around the centre
+
+
+def seed_points(app, count, route_ids, batch=50000):
+    rng = random.Random(7)
+    with app.app_context():
+        rows = []
+        for i in range(count):
+            rows.append({
+                "route_id": route_ids[i % len(route_ids)],
+                "lat": CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                "lng": CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                "label": f"stop {i}",
+            })
+            if len(rows) >= batch:
+                db.session.execute(insert(MailboxStop), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(MailboxStop), rows)
+        db.session.commit()
+
+
+def naive_python(lat, lng, k, radius_m):
+    rows = db.session.execute(text("SELECT id, lat, lng FROM mailbox_stop")).all()
+    scored = ((haversine_m(lat, lng, r.lat, r.lng), r.id) for r in rows)
+    return heapq.nsmallest(k, (s for s in scored if s[0] <= radius_m))
+
+
+def naive_sql_box(lat, lng, k, radius_m):
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_m)
+    rows = db.session.execute(
+        text("SELECT id, lat, lng FROM mailbox_stop WHERE lat BETWEEN :a AND :b AND lng BETWEEN :c AND :d"),
+        {"a": min_lat, "b": max_lat, "c": min_lng, "d": max_lng},
+    ).all()
+    scored = ((haversine_m(lat, lng, r.lat, r.lng), r.id) for r in rows)
+    return heapq.nsmallest(k, (s for s in scored if s[0] <= radius_m))
+
+
+def rtree(lat, lng, k, radius_m):
+    return nearest("mailbox_stop", lat, lng, k=k, radius_m=radius_m)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--naive-queries", type=int, default=5, help="queries for the slow python scan")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius", type=float, default=1000.0, help="metres")
+    args = parser.parse_args()
+
+    app, _ = temp_app()
+    route_ids = seed(app, carriers=10, routes_per_carrier=10, scans_per_route=0)
+    started = time.perf_counter()
+    seed_points(app, args.points, route_ids)
+    print(f"seeded {args.points} stops (R*Tree maintained by triggers) in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(11)
+    probes = [
+        (CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+        for _ in range(args.queries)
+    ]
+    rows = []
+    with app.app_context():
+        for name, fn, n in [
+            ("python", naive_python, args.naive_queries),
+            ("sql-box", naive_sql_box, args.queries),
+            ("rtree", rtree, args.queries),
+        ]:
+            latencies = []
+            for lat, lng in probes[:n]:
+                t0 = time.perf_counter()
+                fn(lat, lng, args.k, args.radius)
+                latencies.append(time.perf_counter() - t0)
+            stats = summarize(latencies)
+            rows.append([name, stats["count"], stats["p50_ms"], stats["p99_ms"]])
+    print_table(["method", "queries", "p50 ms", "p99 ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
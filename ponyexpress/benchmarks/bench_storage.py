@@ -0,0 +1,109 @@
+"""Contention benchmark for the SQLite storage profiles.
+
+Writer threads POST scans to ``/scan/<route_id>`` while reader threads
+alternate between the admin dashboard and the CSV export. For each storage
+profile it reports sustained writes/sec, failed requests (typically
+``database is locked``) and read latency percentiles.
+
+    python -m benchmarks.bench_storage --duration 10 --writers 8 --readers 2
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.storage import STORAGE_PROFILES
+
+
+def run_profile(profile, args):
+    app, _ = temp_app(STORAGE_PROFILE=profile)
+    route_ids = seed(app, carriers=args.writers, routes_per_carrier=5, scans_per_route=args.seed_scans)
+    routes_by_carrier = [route_ids[i * 5] for i in range(args.writers)]
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    write_latencies, read_latencies = [], {"dashboard": [], "export": []}
+    errors = {"write": 0, "read": 0}
+
+    def writer(index):
+        client = login(app.test_client(), f"carrier{index}")
+        route_id = routes_by_carrier[index]
+        rng = random.Random(index)
+        while not stop.is_set():
+            payload = {"barcode": f"9405{rng.randrange(10**18)}", "too_small": rng.random() < 0.2, "lat": 40.7, "lng": -74.0}
+            started = time.perf_counter()
+            response = client.post(f"/scan/{route_id}", json=payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code == 200:
+                    write_latencies.append(elapsed)
+                else:
+                    errors["write"] += 1
+
+    def reader(index):
+        client = login(app.test_client(), "admin")
+        endpoints = [("dashboard", "/admin"), ("export", "/admin/export/csv")]
+        n = index
+        while not stop.is_set():
+            name, url = endpoints[n % len(endpoints)]
+            n += 1
+            started = time.perf_counter()
+            response = client.get(url)
+            response.get_data()  # drain streamed bodies
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code == 200:
+                    read_latencies[name].append(elapsed)
+                else:
+                    errors["read"] += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        "writes_per_sec": len(write_latencies) / args.duration,
+        "write": summarize(write_latencies),
+        "dashboard": summarize(read_latencies["dashboard"]),
+        "export": summarize(read_latencies["export"]),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=list(STORAGE_PROFILES), choices=list(STORAGE_PROFILES))
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per profile")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seed-scans", type=int, default=200, help="scans per seeded route")
+    args = parser.parse_args()
+
+    rows = []
+    for profile in args.profiles:
+        result = run_profile(profile, args)
+        rows.append([
+            profile,
+            result["writes_per_sec"],
+            result["write"]["p99_ms"],
+            result["dashboard"]["p50_ms"],
+            result["dashboard"]["p99_ms"],
+            result["export"]["p50_ms"],
+            result["export"]["p99_ms"],
+            result["errors"]["write"],
+            result["errors"]["read"],
+        ])
+    print_table(
+        ["profile", "writes/s", "write p99", "dash p50", "dash p99", "export p50", "export p99", "write err", "read err"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
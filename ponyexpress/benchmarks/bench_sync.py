@@ -0,0 +1,91 @@
+"""Device delta-sync benchmark.
+
+Seeds a history of routes and scans per carrier, then follows one
+carrier's device through a full initial sync and a shift:
+
+1. Pull everything from cursor 0, page by page.
+2. Push the shift's offline work: a new route and its scans.
+3. Other carriers scan too, through ``/scan/<id>/batch``.
+4. Re-sync from the saved cursor.
+
+Reports bytes on the wire (raw and gzip) and time for each step. A final
+pull from the new cursor must be empty.
+
+    python -m benchmarks.bench_sync --carriers 20 --days 365 --scans-per-route 100 --shift 300
+"""
+import argparse
+import gzip
+import time
+
+from benchmarks.common import login, print_table, seed, temp_app
+
+
+def pull(client, cursor, limit):
+    """Page through /sync from ``cursor``; return (cursor, rows, raw bytes, gzip bytes, pages)."""
+    rows = raw = packed = pages = 0
+    while True:
+        response = client.get(f"/sync?cursor={cursor}&limit={limit}")
+        body = response.get_data()
+        data = response.get_json()
+        raw += len(body)
+        packed += len(gzip.compress(body))
+        pages += 1
+        rows += sum(len(data[kind]["rows"]) for kind in ("routes", "stops", "scans") if kind in data)
+        cursor = data["cursor"]
+        if not data["has_more"]:
+            return cursor, rows, raw, packed, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--carriers", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--scans-per-route", type=int, default=100)
+    parser.add_argument("--shift", type=int, default=300, help="Scans per carrier in the simulated shift.")
+    parser.add_argument("--limit", type=int, default=500, help="Rows per pull page.")
+    args = parser.parse_args()
+
+    app, _ = temp_app()
+    route_ids = seed(app, carriers=args.carriers, routes_per_carrier=args.days, scans_per_route=args.scans_per_route)
+    device = login(app.test_client(), "carrier0")
+    table = []
+
+    started = time.perf_counter()
+    cursor, rows, raw, packed, pages = pull(device, 0, args.limit)
+    table.append(["initial pull", rows, pages, raw / 1024, packed / 1024, time.perf_counter() - started])
+
+    shift = {
+        "routes": [{"ref": "shift-route", "date": "2026-01-02"}],
+        "scans": [
+            {"ref": f"shift-{n}", "route_id": "shift-route", "barcode": f"9405{n:018d}", "too_small": n % 5 == 0,
+             "lat": 40.7, "lng": -74.0, "timestamp": "2026-01-02T09:00:00Z"}
+            for n in range(args.shift)
+        ],
+    }
+    started = time.perf_counter()
+    response = device.post("/sync", json=shift)
+    body = response.get_data()
+    assert response.get_json()["success"], response.get_json()
+    table.append(["push shift", len(response.get_json()["created"]), 1, len(body) / 1024,
+                  len(gzip.compress(body)) / 1024, time.perf_counter() - started])
+
+    # Everyone else's shift, which the device must not download
+    for carrier in range(1, args.carriers):
+        client = login(app.test_client(), f"carrier{carrier}")
+        route_id = route_ids[carrier * args.days]
+        scans = [{"barcode": f"9406{carrier:06d}{n:012d}", "lat": 40.7, "lng": -74.0} for n in range(args.shift)]
+        client.post(f"/scan/{route_id}/batch", json=scans)
+
+    started = time.perf_counter()
+    cursor, rows, raw, packed, pages = pull(device, cursor, args.limit)
+    table.append(["re-sync after shift", rows, pages, raw / 1024, packed / 1024, time.perf_counter() - started])
+
+    _, empty, _, _, _ = pull(device, cursor, args.limit)
+    assert empty == 0, empty
+
+    print(f"{args.carriers} carriers x {args.days} routes x {args.scans_per_route} scans; shift of {args.shift} scans\n")
+    print_table(["step", "rows", "requests", "KiB", "KiB gzip", "seconds"], table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Tracking-number index benchmark.
+
+Loads ``--packages`` random 22-digit tracking numbers into ``package``,
+builds the index and times exact, prefix and suffix lookups of existing
+numbers. The index's memory is compared with a dict of ``Package`` ORM
+objects, which is measured on a sample and scaled up. Then more packages
+are added and picked up incrementally, including one merge. Every lookup
+kind is checked against a brute-force scan along the way.
+
+    python -m benchmarks.bench_tracking_index --packages 1000000 --lookups 10000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from sqlalchemy import insert
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import db, Package
+from tracking_index import TrackingIndex
+
+
+def tracking_numbers(rng, count):
+    return [f"9{rng.choice('2345')}{rng.randrange(10**20):020d}" for _ in range(count)]
+
+
+def load(app, numbers, batch=50000):
+    with app.app_context():
+        for offset in range(0, len(numbers), batch):
+            rows = [{"tracking_number": n, "status": "Pending"} for n in numbers[offset:offset + batch]]
+            db.session.execute(insert(Package), rows)
+            db.session.commit()
+
+
+def orm_dict_bytes(app, sample):
+    """Bytes per entry of ``{tracking_number: Package}`` measured on ``sample`` rows."""
+    with app.app_context():
+        gc.collect()
+        tracemalloc.start()
+        packages = {p.tracking_number: p for p in Package.query.limit(sample)}
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size / len(packages)
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        samples.append(time.perf_counter() - started)
+    stats = summarize(samples)
+    return stats["p50_ms"] * 1000, stats["p99_ms"] * 1000
+
+
+def check(index, numbers, rng):
+    """Compare each lookup kind with a brute-force scan of ``numbers``."""
+    for number in rng.sample(numbers, 5):
+        assert len(index.exact(number)) == 1
+        for digits, kind in ((number[:8], "prefix"), (number[-5:], "suffix")):
+            ids, count = getattr(index, kind)(digits, limit=10**9)
+            test = str.startswith if kind == "prefix" else str.endswith
+            expected = sum(1 for n in numbers if test(n, digits))
+            assert count == len(ids) == expected, (kind, digits, count, expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--added", type=int, default=20000, help="Packages added after the build.")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    app, _ = temp_app()
+    seed(app, carriers=1, routes_per_carrier=1, scans_per_route=0)
+    numbers = tracking_numbers(rng, args.packages)
+    load(app, numbers)
+
+    index = TrackingIndex(refresh_interval=0, merge_rows=args.added)
+    with app.app_context():
+        index.refresh()
+    stats = index.stats()
+    per_orm = orm_dict_bytes(app, min(50000, args.packages))
+    print(f"{args.packages:,} packages: built in {stats['build_ms'] / 1000:.2f}s, "
+          f"index {stats['bytes'] / 2**20:.1f} MiB vs ~{per_orm * args.packages / 2**20:,.0f} MiB "
+          f"as a dict of ORM objects ({per_orm:.0f} B each, measured on a sample)\n")
+    check(index, numbers, rng)
+
+    existing = rng.sample(numbers, args.lookups)
+    rows = [
+        ["exact", *timed(index.exact, existing)],
+        ["prefix (8 digits)", *timed(lambda n: index.prefix(n[:8]), existing)],
+        ["suffix (5 digits)", *timed(lambda n: index.suffix(n[-5:]), existing)],
+        ["suffix (3 digits)", *timed(lambda n: index.suffix(n[-3:]), existing)],
+    ]
+
+    # Incremental: first a delta, then enough to trigger a merge
+    for label, count in (("refresh: delta", args.added // 2), ("refresh: merge", args.added)):
+        added = tracking_numbers(rng, count)
+        load(app, added)
+        numbers += added
+        with app.app_context():
+            started = time.perf_counter()
+            index.refresh()
+            rows.append([label, (time.perf_counter() - started) * 1e6, "-"])
+        check(index, numbers, rng)
+        rows.append([f"suffix after {label[9:]}", *timed(lambda n: index.suffix(n[-5:]), rng.sample(numbers, 1000))])
+    assert index.stats()["merges"] == 1, index.stats()
+
+    client = login(app.test_client(), "carrier0")
+    rows.append(["GET /packages/lookup?suffix=", *timed(
+        lambda n: client.get(f"/packages/lookup?suffix={n[-6:]}"), rng.sample(numbers, 1000)
+    )])
+    print_table(["operation", "p50 µs", "p99 µs"], rows)
+
+
+if __name__ == "__main__":
+    main()
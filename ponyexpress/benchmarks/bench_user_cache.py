@@ -0,0 +1,53 @@
+"""User-loader cache benchmark.
+
+Replays a rapid-fire scan session (authenticated POSTs to ``/scan/<id>``)
+with the user cache disabled and enabled, counting SQL statements per
+request and throughput.
+
+    python -m benchmarks.bench_user_cache --requests 2000
+"""
+import argparse
+import time
+
+from sqlalchemy import event
+
+from benchmarks.common import login, print_table, seed, temp_app
+from database.models import db
+
+
+def run(cache_size, args):
+    app, _ = temp_app(USER_CACHE_SIZE=cache_size)
+    route_ids = seed(app, carriers=2, routes_per_carrier=2, scans_per_route=10)
+    statements = [0]
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+    client = login(app.test_client(), "carrier0")
+    statements[0] = 0
+    started = time.perf_counter()
+    for n in range(args.requests):
+        client.post(f"/scan/{route_ids[0]}", json={"barcode": f"9405{n:018d}", "lat": 40.7, "lng": -74.0})
+    elapsed = time.perf_counter() - started
+    stats = app.extensions["user_cache"].stats()
+    return {
+        "statements_per_request": statements[0] / args.requests,
+        "requests_per_sec": args.requests / elapsed,
+        "hit_ratio": stats["hit_ratio"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    for label, size in [("no cache", 0), ("user cache", 1024)]:
+        result = run(size, args)
+        rows.append([label, result["statements_per_request"], result["requests_per_sec"], result["hit_ratio"]])
+    print_table(["loader", "SQL/request", "requests/s", "hit ratio"], rows)
+    print(f"\nDB round trips saved per request: {rows[0][1] - rows[1][1]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
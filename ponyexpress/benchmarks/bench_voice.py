@@ -0,0 +1,156 @@
+"""Voice intent matching benchmark.
+
+Expands the phrases of ``voice-commands.json`` with polite prefixes and
+trailing words into a few thousand variants, written to a temporary
+command file. Utterances are generated from the variants: some start with
+a wake word, some have a misheard word (one letter changed) or an extra
+word. Each is matched by :class:`IntentMatcher` and by a naive scan that
+compares the utterance with every phrase using ``difflib``; both report
+p50/p99 latency and the share of utterances given their intended intent.
+Finally the file is rewritten and the time until the new version is used
+is measured.
+
+    python -m benchmarks.bench_voice --utterances 5000
+"""
+import argparse
+import difflib
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import print_table, summarize
+from voice_intents import IntentMatcher, tokenize
+
+COMMANDS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "..", "voice-commands.json")
+PREFIXES = ["", "please", "can you", "could you please", "i need to", "i want to", "ok", "now"]
+SUFFIXES = ["", "please", "now", "for me", "thanks", "right away"]
+FILLERS = ["um", "uh", "so", "like", "okay"]
+
+
+def expand(data):
+    """``data`` with every phrase also under each prefix and suffix."""
+    expanded = {"wake_words": data["wake_words"], "commands": {}}
+    for category, intents in data["commands"].items():
+        expanded["commands"][category] = {
+            intent: [" ".join(filter(None, (p, phrase, s))) for phrase in phrases for p in PREFIXES for s in SUFFIXES]
+            for intent, phrases in intents.items()
+        }
+    return expanded
+
+
+def misheard(word, rng):
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz".replace(word[i], "")) + word[i + 1:]
+
+
+def utterances(data, rng, count):
+    """``(text, intent)`` pairs: variants with wake words, misheard words and fillers."""
+    variants = [
+        (phrase, intent)
+        for intents in data["commands"].values()
+        for intent, phrases in intents.items()
+        for phrase in phrases
+    ]
+    result = []
+    for _ in range(count):
+        phrase, intent = rng.choice(variants)
+        words = phrase.split()
+        if rng.random() < 0.3:
+            i = rng.randrange(len(words))
+            words[i] = misheard(words[i], rng)
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(FILLERS))
+        if rng.random() < 0.5:
+            words.insert(0, rng.choice(data["wake_words"]))
+        result.append((" ".join(words), intent))
+    return result
+
+
+def naive_matcher(data):
+    """Best intent by ``difflib`` ratio against every phrase."""
+    phrases = [
+        (" ".join(tokenize(phrase)), intent)
+        for intents in data["commands"].values()
+        for intent, variants in intents.items()
+        for phrase in variants
+    ]
+
+    def match(text):
+        text = " ".join(tokenize(text))
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(text)
+        best, best_ratio = None, 0.0
+        for phrase, intent in phrases:
+            matcher.set_seq1(phrase)
+            if matcher.real_quick_ratio() > best_ratio and matcher.quick_ratio() > best_ratio:
+                ratio = matcher.ratio()
+                if ratio > best_ratio:
+                    best, best_ratio = intent, ratio
+        return best
+
+    return match
+
+
+def measure(match, cases):
+    samples, correct = [], 0
+    for text, intent in cases:
+        started = time.perf_counter()
+        result = match(text)
+        samples.append(time.perf_counter() - started)
+        correct += result == intent
+    stats = summarize(samples)
+    return [stats["p50_ms"] * 1000, stats["p99_ms"] * 1000, correct / len(cases)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", default=COMMANDS)
+    parser.add_argument("--utterances", type=int, default=5000)
+    parser.add_argument("--naive", type=int, default=500, help="Utterances given to the naive scan.")
+    args = parser.parse_args()
+
+    with open(args.commands, encoding="utf-8") as fh:
+        base = json.load(fh)
+    data = expand(base)
+    rng = random.Random(11)
+    cases = utterances(data, rng, args.utterances)
+
+    fd, path = tempfile.mkstemp(prefix="ponyexpress-voice-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(data, fh)
+    try:
+        matcher = IntentMatcher(path, reload_interval=0)
+        matcher.reload()
+        stats = matcher.stats()
+        print(f"{stats['phrases']:,} phrase variants, {stats['tokens']} distinct words, "
+              f"compiled in {stats['compile_ms']:.1f} ms\n")
+
+        def compiled(text):
+            match = matcher.match(text)
+            return match.intent if match else None
+
+        rows = [["compiled index", *measure(compiled, cases)]]
+        rows.append([f"difflib scan ({args.naive} utterances)", *measure(naive_matcher(data), cases[:args.naive])])
+        print_table(["matcher", "p50 µs", "p99 µs", "correct"], rows)
+
+        # Hot reload: a new intent becomes matchable once the file changes
+        data["commands"]["delivery"]["leave_with_neighbour"] = ["left with neighbour", "gave it to the neighbour"]
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))  # a visible mtime change
+        started = time.perf_counter()
+        match = matcher.match("Hey Pony left with neighbour")
+        elapsed = (time.perf_counter() - started) * 1000
+        assert match and match.intent == "leave_with_neighbour", match
+        print(f"\nHot reload: first match after the file changed took {elapsed:.1f} ms "
+              f"(recompile {matcher.stats()['compile_ms']:.1f} ms)")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Scan ingestion benchmark: per-request commit versus write-behind.
+
+Carrier threads POST scans to ``/scan/<route_id>`` for ``--duration``
+seconds under each mode and the benchmark reports sustained scans/sec and
+request latency percentiles. After draining it checks that every
+acknowledged scan reached the database.
+
+    python -m benchmarks.bench_write_behind --duration 10 --carriers 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.common import login, print_table, seed, summarize, temp_app
+from database.models import PackageScan
+
+MODES = {
+    "commit per request": {"SCAN_WRITE_BEHIND": False},
+    "write-behind, memory": {"SCAN_WRITE_BEHIND": True, "SCAN_WRITE_BEHIND_LOG_DIR": None},
+    "write-behind, log": {"SCAN_WRITE_BEHIND": True, "SCAN_WRITE_BEHIND_FSYNC": False},
+    "write-behind, log+fsync": {"SCAN_WRITE_BEHIND": True, "SCAN_WRITE_BEHIND_FSYNC": True},
+}
+
+
+def run_mode(config, args):
+    config = dict(config)
+    if config["SCAN_WRITE_BEHIND"] and "SCAN_WRITE_BEHIND_LOG_DIR" not in config:
+        config["SCAN_WRITE_BEHIND_LOG_DIR"] = os.path.join(tempfile.mkdtemp(prefix="ponyxpress-log-"), "scan-log")
+    app, _ = temp_app(**config)
+    route_ids = seed(app, carriers=args.carriers, routes_per_carrier=1, scans_per_route=0)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def carrier(index):
+        client = login(app.test_client(), f"carrier{index}")
+        rng = random.Random(index)
+        mine = []
+        while not stop.is_set():
+            payload = {"barcode": f"9405{rng.randrange(10**18)}", "too_small": rng.random() < 0.2, "lat": 40.7, "lng": -74.0}
+            started = time.perf_counter()
+            response = client.post(f"/scan/{route_ids[index]}", json=payload)
+            elapsed = time.perf_counter() - started
+            if response.status_code == 200:
+                mine.append(elapsed)
+            else:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=carrier, args=(i,)) for i in range(args.carriers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    buffer = app.extensions.get("scan_buffer")
+    if buffer is not None:
+        buffer.close()
+    with app.app_context():
+        stored = PackageScan.query.count()
+    stats = summarize(latencies)
+    return [len(latencies) / args.duration, stats["p50_ms"], stats["p99_ms"], errors[0], stored == len(latencies)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--carriers", type=int, default=16)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    rows = [[mode, *run_mode(MODES[mode], args)] for mode in args.modes]
+    print_table(["mode", "scans/s", "p50 ms", "p99 ms", "errors", "all stored"], rows)
+
+
+if __name__ == "__main__":
+    main()
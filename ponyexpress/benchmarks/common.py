@@ -0,0 +1,122 @@
+"""Shared helpers for the PonyXpress benchmark scripts.
+
+Benchmarks are run from the ``ponyexpress/`` directory, e.g.::
+
+    python -m benchmarks.bench_storage
+"""
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from database.models import db, User, RouteTrace, PackageScan
+from database.rollups import create_rollups
+from database.spatial import create_spatial_index
+from database.sync import create_sync
+
+BENCH_PASSWORD = "bench"
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an iterable of numbers."""
+    ordered = sorted(samples)
+    if not ordered:
+        return float("nan")
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Count, mean and p50/p95/p99 of latency samples (seconds → ms)."""
+    samples = list(samples)
+    ms = [s * 1000 for s in samples]
+    return {
+        "count": len(ms),
+        "mean_ms": sum(ms) / len(ms) if ms else float("nan"),
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+    }
+
+
+def temp_app(**config):
+    """Create an app bound to a fresh SQLite file in a temporary directory."""
+    workdir = tempfile.mkdtemp(prefix="ponyxpress-bench-")
+    path = os.path.join(workdir, "bench.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", **config})
+    with app.app_context():
+        db.create_all()
+        create_spatial_index()
+        create_rollups()
+        create_sync()
+    return app, path
+
+
+def seed(app, carriers=10, routes_per_carrier=10, scans_per_route=50, batch=10000):
+    """Populate users, routes and scans with bulk inserts.
+
+    Carriers are named ``carrier0..N`` and an ``admin`` user is added; all
+    share the password ``BENCH_PASSWORD``. Returns the list of route ids.
+    """
+    rng = random.Random(42)
+    password_hash = generate_password_hash(BENCH_PASSWORD)  # hash once, reuse
+    start = datetime(2025, 1, 1, 7, 30)
+    with app.app_context():
+        users = [{"username": "admin", "role": "admin", "password_hash": password_hash}]
+        users += [
+            {"username": f"carrier{i}", "role": "carrier", "password_hash": password_hash}
+            for i in range(carriers)
+        ]
+        db.session.execute(insert(User), users)
+        carrier_ids = [u.id for u in User.query.filter_by(role="carrier").order_by(User.id)]
+
+        routes = [
+            {"carrier_id": cid, "date": date(2025, 1, 1) + timedelta(days=d), "geojson": "{}"}
+            for cid in carrier_ids
+            for d in range(routes_per_carrier)
+        ]
+        db.session.execute(insert(RouteTrace), routes)
+        route_ids = [r.id for r in RouteTrace.query.order_by(RouteTrace.id)]
+
+        rows = []
+        for route_id in route_ids:
+            for n in range(scans_per_route):
+                rows.append({
+                    "route_id": route_id,
+                    "barcode": f"94055{rng.randrange(10**16):016d}",
+                    "too_big": rng.random() < 0.05,
+                    "too_small": rng.random() < 0.2,
+                    "lat": 40.7 + rng.uniform(-0.2, 0.2),
+                    "lng": -74.0 + rng.uniform(-0.2, 0.2),
+                    "timestamp": start + timedelta(days=route_id % 365, seconds=n * 30),
+                })
+                if len(rows) >= batch:
+                    db.session.execute(insert(PackageScan), rows)
+                    rows = []
+        if rows:
+            db.session.execute(insert(PackageScan), rows)
+        db.session.commit()
+    return route_ids
+
+
+def login(client, username):
+    """Log a test client in as a seeded user."""
+    response = client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+    assert response.status_code == 302, f"login failed for {username}"
+    return client
+
+
+def print_table(headers, rows):
+    """Print rows as a fixed-width text table."""
+    widths = [max(len(str(h)), *(len(_fmt(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(_fmt(v).ljust(w) for v, w in zip(row, widths)))
+
+
+def _fmt(value):
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
@@ -0,0 +1,202 @@
+"""Typed, columnar scan exports for analysis (``flask export-scans``).
+
+The CSV export turns every boolean, float and datetime into text that has
+to be parsed back. This module writes the same rows
+(:func:`database.queries.scan_export_query`: route date, carrier, barcode,
+too-big/too-small flags, position and scan time) column by column with
+their real types:
+
+``parquet``
+    One row group per chunk, via ``pyarrow`` when it is installed.
+    Carrier names are dictionary-encoded.
+``npz``
+    A NumPy zip archive, always available. It loads with ``np.load``, one
+    array per column: ``date`` is ``datetime64[D]``, ``timestamp`` is
+    ``datetime64[us]``, the flags are ``bool``, the coordinates are
+    ``float64`` (``NaN`` when missing), and ``carrier``/``barcode`` are
+    UTF-8 byte strings sized to the longest value.
+
+Rows are fetched ``chunk_size`` at a time. For ``npz`` each chunk's
+columns are spooled to temporary files and written into the archive once
+the row count is known, so memory stays bounded by the chunk size either
+way.
+"""
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+from sqlalchemy import Integer, String, type_coerce
+
+from database.models import db, PackageScan, RouteTrace, User
+from database.queries import scan_export_query
+
+try:  # optional: Parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = pq = None
+
+DEFAULT_CHUNK_SIZE = 65536
+
+# (name, dtype) in query order; ``None`` marks a variable-width string column
+COLUMNS = (
+    ("date", np.dtype("datetime64[D]")),
+    ("carrier", None),
+    ("barcode", None),
+    ("too_big", np.dtype(bool)),
+    ("too_small", np.dtype(bool)),
+    ("lat", np.dtype(np.float64)),
+    ("lng", np.dtype(np.float64)),
+    ("timestamp", np.dtype("datetime64[us]")),
+)
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "npz": ("application/zip", ".npz"),
+}
+
+
+class ExportFormatError(ValueError):
+    """Unknown columnar format, or Parquet requested without pyarrow."""
+
+
+def available_formats():
+    """Formats that can be written in this environment, preferred first."""
+    return ("parquet", "npz") if pq is not None else ("npz",)
+
+
+def resolve_format(name=None):
+    """Validate ``name`` (default: the best available format)."""
+    if not name:
+        return available_formats()[0]
+    name = name.lower().lstrip(".")
+    if name not in FORMATS:
+        raise ExportFormatError(f"Unknown format {name!r}; choose from {', '.join(FORMATS)}")
+    if name not in available_formats():
+        raise ExportFormatError("Parquet export needs pyarrow (pip install pyarrow); use npz instead")
+    return name
+
+
+def _raw_query(start, end, carrier):
+    """:func:`scan_export_query` with dates, flags and times left as stored.
+
+    NumPy parses SQLite's ISO text far faster than the ORM builds
+    ``date``/``datetime`` objects.
+    """
+    return scan_export_query(start, end, carrier).with_entities(
+        type_coerce(RouteTrace.date, String),
+        User.username,
+        PackageScan.barcode,
+        type_coerce(PackageScan.too_big, Integer),
+        type_coerce(PackageScan.too_small, Integer),
+        PackageScan.lat,
+        PackageScan.lng,
+        type_coerce(PackageScan.timestamp, String),
+    )
+
+
+def _column_chunks(query, chunk_size):
+    """Yield ``(rows, [column values, ...])`` per ``chunk_size`` rows."""
+    result = db.session.execute(query.statement, execution_options={"yield_per": chunk_size})
+    for rows in result.partitions():
+        yield len(rows), list(zip(*rows))
+
+
+def _strings(values):
+    encoded = [v.encode("utf-8") if v is not None else b"" for v in values]
+    width = max(1, max(map(len, encoded), default=1))
+    return np.array(encoded, dtype=f"S{width}")
+
+
+def _arrays(columns):
+    """Convert one chunk's column tuples to NumPy arrays."""
+    return {
+        name: _strings(values) if dtype is None else np.array(values, dtype=dtype)
+        for (name, dtype), values in zip(COLUMNS, columns)
+    }
+
+
+def _write_npz(out, chunks):
+    rows = 0
+    widths = {name: 1 for name, dtype in COLUMNS if dtype is None}
+    chunk_widths = []  # per chunk: (rows, {string column: width})
+    with tempfile.TemporaryDirectory(prefix="ponyxpress-export-") as spool:
+        files = {name: open(f"{spool}/{name}", "w+b") for name, _ in COLUMNS}
+        try:
+            for count, columns in chunks:
+                arrays = _arrays(columns)
+                for name, array in arrays.items():
+                    files[name].write(array.tobytes())
+                sizes = {name: arrays[name].dtype.itemsize for name in widths}
+                for name, size in sizes.items():
+                    widths[name] = max(widths[name], size)
+                chunk_widths.append((count, sizes))
+                rows += count
+
+            with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+                for name, dtype in COLUMNS:
+                    spooled = files[name]
+                    spooled.seek(0)
+                    final = dtype if dtype is not None else np.dtype(f"S{widths[name]}")
+                    with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                        np.lib.format.write_array_header_1_0(
+                            member, {"descr": np.lib.format.dtype_to_descr(final), "fortran_order": False, "shape": (rows,)}
+                        )
+                        if dtype is not None:
+                            shutil.copyfileobj(spooled, member, 1 << 20)
+                            continue
+                        # Re-pad each chunk's strings to the archive-wide width
+                        for count, sizes in chunk_widths:
+                            chunk = np.frombuffer(spooled.read(count * sizes[name]), dtype=f"S{sizes[name]}")
+                            member.write(chunk.astype(final).tobytes())
+        finally:
+            for fh in files.values():
+                fh.close()
+    return rows
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("date", pa.date32()),
+        ("carrier", pa.dictionary(pa.int32(), pa.string())),
+        ("barcode", pa.string()),
+        ("too_big", pa.bool_()),
+        ("too_small", pa.bool_()),
+        ("lat", pa.float64()),
+        ("lng", pa.float64()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+
+
+def _write_parquet(out, chunks):
+    schema = _arrow_schema()
+    rows = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for count, columns in chunks:
+            arrays = []
+            for field, (_, dtype), values in zip(schema, COLUMNS, columns):
+                if dtype is None:
+                    array = pa.array(values, type=pa.string())
+                else:  # NaN/NaT become nulls
+                    array = pa.array(np.array(values, dtype=dtype), from_pandas=True)
+                if pa.types.is_dictionary(field.type):
+                    array = array.dictionary_encode()
+                arrays.append(array if array.type == field.type else array.cast(field.type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            rows += count
+    return rows
+
+
+def export_scans(out, fmt=None, start=None, end=None, carrier=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write scans matching the filters to ``out`` (a path or binary file).
+
+    ``start``/``end``/``carrier`` are as for :func:`scan_export_query`.
+    Returns the number of rows written. Raises :class:`ExportFormatError`
+    for an unusable ``fmt``.
+    """
+    fmt = resolve_format(fmt)
+    chunks = _column_chunks(_raw_query(start, end, carrier), chunk_size)
+    if fmt == "parquet":
+        return _write_parquet(out, chunks)
+    return _write_npz(out, chunks)
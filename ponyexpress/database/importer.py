@@ -0,0 +1,388 @@
+"""Bulk imports: historical delivery logs and dispatch package manifests.
+
+Delivery logs (``flask import-deliveries``)
+-------------------------------------------
+
+Input is the ``delivery-log-sample.csv`` layout. Each row becomes a
+``PackageScan`` (tracking number as barcode, GPS fix, delivery date and
+time as timestamp) on the carrier's ``RouteTrace`` for that day. Carriers
+are matched to ``User.username`` by ``carrier_name`` and created on first
+sight unless disabled. Routes are created as needed. Both lookups go
+through in-memory maps, so the database is only read once per import.
+
+The file is split into byte ranges that end on line boundaries, so
+records must not contain embedded newlines. Ranges are parsed in order,
+or by a process pool when ``workers > 1``, and each one is inserted and
+committed together with its ``ImportCheckpoint`` row. An interrupted
+import therefore resumes at the first uncommitted byte. Memory stays
+bounded by the chunk size times the number of chunks in flight.
+
+Package manifests (``flask import-packages``)
+---------------------------------------------
+Input is the ``sample-packages.json`` layout, either a top-level JSON array
+or one object per line. Items are decoded one at a time from a sliding
+text buffer (no ``json.load`` of the whole file) and upserted into
+``Package`` by tracking number in batches. Re-importing a manifest updates
+existing packages in place.
+"""
+import csv
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from sqlalchemy import insert, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.models import db, ImportCheckpoint, Package, PackageScan, RouteTrace, User
+from database.rollups import bulk_rollups
+from database.spatial import bulk_indexing
+from database.sync import bulk_versioning
+
+REQUIRED_COLUMNS = (
+    "delivery_id",
+    "tracking_number",
+    "carrier_name",
+    "delivery_date",
+    "delivery_time",
+    "gps_lat",
+    "gps_lng",
+)
+
+DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024  # ~30k rows of the sample layout
+
+# Order of the parameter tuples handed to the DB-API executemany
+_SCAN_COLUMNS = ("route_id", "barcode", "too_big", "too_small", "lat", "lng", "timestamp")
+
+
+DEFAULT_MANIFEST_BATCH = 5000
+
+# Order of the parameter tuples for the Package upsert
+_PACKAGE_COLUMNS = (
+    "tracking_number",
+    "package_type",
+    "weight",
+    "length",
+    "width",
+    "height",
+    "status",
+    "special_handling",
+    "recipient",
+    "address",
+    "city",
+    "state",
+    "zip",
+    "created_date",
+    "estimated_delivery",
+    "updated_at",
+)
+
+
+class DeliveryImportError(ValueError):
+    """Raised when a delivery log cannot be imported (e.g. missing columns)."""
+
+
+class ManifestImportError(ValueError):
+    """Raised when a package manifest is not a JSON array or stream of objects."""
+
+
+def _read_header(path):
+    """Column name → index map and the byte offset of the first data row."""
+    with open(path, "rb") as fh:
+        line = fh.readline()
+        offset = fh.tell()
+    header = next(csv.reader([line.decode("utf-8-sig")]), [])
+    columns = {name.strip(): i for i, name in enumerate(header)}
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise DeliveryImportError(f"{path}: missing column(s) {', '.join(missing)}")
+    return [columns[name] for name in REQUIRED_COLUMNS], offset
+
+
+def _byte_ranges(path, start, chunk_bytes):
+    """``(start, end)`` ranges of about ``chunk_bytes``, each ending after a newline."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        while start < size:
+            end = start + chunk_bytes
+            if end < size:
+                fh.seek(end)
+                fh.readline()
+                end = fh.tell()
+            yield start, min(end, size)
+            start = end
+
+
+def _parse_range(path, start, end, columns):
+    """Parse one byte range into scan tuples; runs in worker processes.
+
+    Returns ``(end, rows, rejected, last_delivery_id)`` where each row is
+    ``(carrier_name, delivery_date, barcode, lat, lng, timestamp)`` and the
+    timestamp is already in SQLAlchemy's SQLite ``DateTime`` text format.
+    """
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        text = fh.read(end - start).decode("utf-8")
+    i_id, i_tracking, i_carrier, i_date, i_time, i_lat, i_lng = columns
+    rows, rejected, last_id = [], 0, None
+    for record in csv.reader(io.StringIO(text)):
+        if not record:
+            continue
+        try:
+            day, clock = record[i_date], record[i_time] or "00:00:00"
+            lat, lng = record[i_lat], record[i_lng]
+            rows.append((
+                record[i_carrier].strip(),
+                day,
+                record[i_tracking],
+                float(lat) if lat else None,
+                float(lng) if lng else None,
+                datetime.fromisoformat(f"{day} {clock}").isoformat(" ", "microseconds"),
+            ))
+        except (IndexError, ValueError):
+            rejected += 1
+            continue
+        last_id = record[i_id]
+    return end, rows, rejected, last_id
+
+
+def _parsed_ranges(path, ranges, columns, workers):
+    """Parse ``ranges`` in order, keeping at most ``2 * workers`` in flight."""
+    if workers <= 1:
+        for start, end in ranges:
+            yield _parse_range(path, start, end, columns)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_parse_range, path, start, end, columns))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _Resolver:
+    """In-memory carrier-name → user id and (carrier, day) → route id maps.
+
+    Unknown carriers and routes of a chunk are created with one bulk
+    insert each and read back with one query.
+    """
+
+    def __init__(self, create_carriers):
+        self.create_carriers = create_carriers
+        self.carriers = dict(db.session.query(User.username, User.id))
+        self.routes = {}
+        for route_id, carrier_id, day in db.session.query(RouteTrace.id, RouteTrace.carrier_id, RouteTrace.date).order_by(
+            RouteTrace.id
+        ):
+            if day is not None:
+                self.routes.setdefault((carrier_id, day.isoformat()), route_id)
+        self.carriers_created = self.routes_created = 0
+
+    def add_carriers(self, names):
+        names = {name for name in names if name and name not in self.carriers}
+        if not names or not self.create_carriers:
+            return
+        # "!" never matches a password hash: imported carriers cannot log in
+        # until they are given a password
+        db.session.execute(insert(User), [{"username": n, "password_hash": "!", "role": "carrier"} for n in names])
+        self.carriers.update(db.session.query(User.username, User.id).filter(User.username.in_(names)))
+        self.carriers_created += len(names)
+
+    def add_routes(self, keys):
+        keys = {key for key in keys if key not in self.routes}
+        if not keys:
+            return
+        with bulk_versioning("route_trace"):
+            db.session.execute(
+                insert(RouteTrace), [{"carrier_id": c, "date": date.fromisoformat(d)} for c, d in keys]
+            )
+        created = (
+            db.session.query(RouteTrace.id, RouteTrace.carrier_id, RouteTrace.date)
+            .filter(tuple_(RouteTrace.carrier_id, RouteTrace.date).in_([(c, date.fromisoformat(d)) for c, d in keys]))
+            .order_by(RouteTrace.id)
+        )
+        for route_id, carrier_id, day in created:
+            self.routes.setdefault((carrier_id, day.isoformat()), route_id)
+        self.routes_created += len(keys)
+
+    def scans(self, parsed, skipped):
+        """``PackageScan`` parameter tuples for ``parsed`` rows; counts unknown carriers."""
+        self.add_carriers({row[0] for row in parsed})
+        carriers = self.carriers
+        self.add_routes({(carriers[row[0]], row[1]) for row in parsed if row[0] in carriers})
+        scans = []
+        for carrier_name, day, barcode, lat, lng, timestamp in parsed:
+            carrier_id = carriers.get(carrier_name)
+            if carrier_id is None:
+                skipped[0] += 1
+                continue
+            scans.append((self.routes[(carrier_id, day)], barcode, False, False, lat, lng, timestamp))
+        return scans
+
+
+def import_deliveries(path, chunk_bytes=DEFAULT_CHUNK_BYTES, workers=1, create_carriers=True, restart=False, progress=None):
+    """Import a delivery-log CSV into ``PackageScan``, resuming from its checkpoint.
+
+    ``restart`` ignores an existing checkpoint and imports from the top
+    (already-imported rows are then inserted again). ``progress`` is called
+    with the running stats after each committed chunk. Returns the stats.
+    """
+    source = os.path.abspath(path)
+    columns, data_start = _read_header(source)
+
+    checkpoint = ImportCheckpoint.query.filter_by(source=source).first()
+    if checkpoint is None:
+        checkpoint = ImportCheckpoint(source=source, offset=data_start, rows=0)
+        db.session.add(checkpoint)
+    elif restart:
+        checkpoint.offset, checkpoint.rows, checkpoint.last_delivery_id = data_start, 0, None
+    resumed_from = max(checkpoint.offset, data_start)
+
+    # Rows go to the DB-API cursor as plain tuples: at this volume the ORM's
+    # per-row bookkeeping costs more than SQLite itself
+    insert_sql = str(
+        insert(PackageScan.__table__).compile(dialect=db.engine.dialect, column_keys=_SCAN_COLUMNS)
+    )
+    resolver = _Resolver(create_carriers)
+    stats = {"rows": 0, "rejected": 0, "unknown_carrier": 0, "resumed_from": resumed_from}
+    skipped = [0]
+    started = time.perf_counter()
+    ranges = _byte_ranges(source, resumed_from, chunk_bytes)
+    for end, parsed, rejected, last_id in _parsed_ranges(source, ranges, columns, workers):
+        scans = resolver.scans(parsed, skipped)
+        if scans:
+            with bulk_indexing("package_scan"), bulk_rollups(), bulk_versioning("package_scan"):
+                db.session.connection().exec_driver_sql(insert_sql, scans)
+        checkpoint.offset = end
+        checkpoint.rows += len(scans)
+        checkpoint.last_delivery_id = last_id or checkpoint.last_delivery_id
+        db.session.commit()  # rows and checkpoint together
+
+        stats["rows"] += len(scans)
+        stats["rejected"] += rejected
+        stats["unknown_carrier"] = skipped[0]
+        if progress is not None:
+            progress(dict(stats, offset=end, seconds=time.perf_counter() - started))
+
+    db.session.commit()  # a fresh checkpoint for an empty file
+    stats.update(
+        offset=checkpoint.offset,
+        carriers_created=resolver.carriers_created,
+        routes_created=resolver.routes_created,
+        seconds=time.perf_counter() - started,
+    )
+    return stats
+
+
+# ----------------------------------------------------------------------
+# Package manifests
+# ----------------------------------------------------------------------
+_SEPARATORS = " \t\r\n,[]"
+
+
+def iter_json_items(fh, read_size=1 << 20):
+    """Yield the items of a top-level JSON array (or JSON lines) one by one.
+
+    Only the current item and at most ``read_size`` characters of lookahead
+    are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                return
+            buffer, pos = fh.read(read_size), 0
+            eof = not buffer
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as exc:
+            more = "" if eof else fh.read(read_size)
+            if not more:
+                raise ManifestImportError(f"Invalid JSON near character {exc.pos}: {exc.msg}") from None
+            # The item straddles the read boundary
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield item
+        pos = end
+
+
+def _timestamp(value):
+    """ISO-8601 text → SQLAlchemy's SQLite ``DateTime`` text, or None."""
+    return datetime.fromisoformat(value).isoformat(" ", "microseconds") if value else None
+
+
+def _package_row(item, now):
+    """Parameter tuple for one manifest item, in ``_PACKAGE_COLUMNS`` order."""
+    dimensions = item.get("dimensions") or {}
+    destination = item.get("destination") or {}
+    weight = item.get("weight")
+    return (
+        str(item["tracking_number"]),
+        item.get("package_type"),
+        float(weight) if weight is not None else None,
+        dimensions.get("length"),
+        dimensions.get("width"),
+        dimensions.get("height"),
+        item.get("status"),
+        item.get("special_handling"),
+        destination.get("name"),
+        destination.get("address"),
+        destination.get("city"),
+        destination.get("state"),
+        str(destination["zip"]) if destination.get("zip") is not None else None,
+        _timestamp(item.get("created_date")),
+        _timestamp(item.get("estimated_delivery")),
+        now,
+    )
+
+
+def import_packages(path, batch_size=DEFAULT_MANIFEST_BATCH, progress=None):
+    """Stream a package manifest into ``Package``, upserting by tracking number.
+
+    Items without a tracking number or with unparseable fields are counted
+    as rejected. Each batch is committed on its own; rerunning an
+    interrupted import is safe because every write is an upsert.
+    """
+    stmt = sqlite_insert(Package.__table__)
+    upsert_sql = str(
+        stmt.on_conflict_do_update(
+            index_elements=["tracking_number"],
+            set_={name: stmt.excluded[name] for name in _PACKAGE_COLUMNS[1:]},
+        ).compile(dialect=db.engine.dialect, column_keys=_PACKAGE_COLUMNS)
+    )
+    now = datetime.utcnow().isoformat(" ", "microseconds")
+    stats = {"packages": 0, "rejected": 0}
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        # Duplicates inside one statement batch are fine: later rows win
+        db.session.connection().exec_driver_sql(upsert_sql, batch)
+        db.session.commit()
+        stats["packages"] += len(batch)
+        batch.clear()
+        if progress is not None:
+            progress(dict(stats, seconds=time.perf_counter() - started))
+
+    with open(path, encoding="utf-8-sig") as fh:
+        for item in iter_json_items(fh):
+            try:
+                batch.append(_package_row(item, now))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                stats["rejected"] += 1
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
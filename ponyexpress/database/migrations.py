@@ -0,0 +1,121 @@
+"""In-place schema upgrades for existing ``ponyexpress.db`` files.
+
+``db.create_all()`` only creates tables that are missing; it never touches
+tables that already exist. ``upgrade_db`` fills that gap for additive
+changes (new tables, nullable columns, indexes, the R*Tree spatial
+index, the rollup and sync triggers) and then runs the data conversions
+below, so an old database can be brought up to date with
+``flask upgrade-db`` without dropping any data.
+"""
+from sqlalchemy import inspect, text
+
+from database.models import db, RouteTrace
+from database.rollups import create_rollups
+from database.spatial import create_spatial_index
+from database.sync import create_sync
+from geometry import GeometryError, decode_geometry, parse_legacy_geojson
+
+
+def upgrade_db():
+    """Create missing tables, columns and indexes, then convert legacy data.
+
+    Returns a list of human-readable descriptions of what changed.
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    changes = []
+    for table in db.metadata.sorted_tables:
+        existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                changes.append(f"column {table.name}.{column.name}")
+
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=db.engine)
+                changes.append(f"index {index.name}")
+
+    backfilled = create_spatial_index()
+    if backfilled is None:
+        changes.append("spatial index unavailable (SQLite built without R*Tree)")
+    changes += [f"spatial index {table}_rtree" for table in backfilled or []]
+
+    if create_rollups():
+        changes.append("scan rollups backfilled")
+
+    versioned = create_sync()
+    if versioned:
+        changes.append(f"sync versions assigned to {versioned} rows")
+
+    converted, cleared = convert_route_geometry()
+    if converted:
+        changes.append(f"converted {converted} route geometries")
+    if cleared:
+        shown = ", ".join(map(str, cleared[:20])) + (", ..." if len(cleared) > 20 else "")
+        changes.append(f"cleared {len(cleared)} unreadable route geometries (route ids {shown})")
+
+    if changes:
+        # Let SQLite's planner see the new indexes' selectivity
+        with db.engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return changes
+
+
+def convert_route_geometry(batch_size=500):
+    """Move legacy ``RouteTrace.geojson`` text into the binary ``geometry`` column.
+
+    Rows are converted in id order, one committed batch at a time, and get
+    their simplification levels built on the way. Rows whose text is not a
+    readable geometry (older versions stored ``str(None)``, i.e. ``"None"``)
+    are emptied, as there is nothing to recover. Returns the number
+    converted and the ids of the emptied routes.
+    """
+    converted, cleared, last_id = 0, [], 0
+    while True:
+        routes = (
+            RouteTrace.query.filter(
+                RouteTrace.id > last_id, RouteTrace.geometry.is_(None), RouteTrace.geojson.isnot(None)
+            )
+            .order_by(RouteTrace.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not routes:
+            return converted, cleared
+        for route in routes:
+            try:
+                route.set_geometry(parse_legacy_geojson(route.geojson))
+            except GeometryError:
+                route.geojson = None
+                cleared.append(route.id)
+                continue
+            converted += 1
+        db.session.commit()
+        last_id = routes[-1].id
+
+
+def rebuild_geometry_levels(batch_size=200):
+    """Recompute the simplification levels of every route with binary geometry.
+
+    Returns the number of routes processed.
+    """
+    rebuilt, last_id = 0, 0
+    while True:
+        routes = (
+            RouteTrace.query.filter(RouteTrace.id > last_id, RouteTrace.geometry.isnot(None))
+            .order_by(RouteTrace.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not routes:
+            return rebuilt
+        for route in routes:
+            route.set_geometry(decode_geometry(route.geometry))
+        db.session.commit()
+        rebuilt += len(routes)
+        last_id = routes[-1].id
@@ -3,14 +3,22 @@ from datetime import datetime, date
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.schema import FetchedValue
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from geometry import GeometryError, decode_geometry, encode_geojson, parse_legacy_geojson, simplification_levels
+
 # SQLAlchemy instance (initialised in app factory)
 db = SQLAlchemy()
 
 
+def sync_version_column():
+    """Change counter set by the sync triggers on insert and update (see database/sync.py)."""
+    return db.Column(db.BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue())
+
+
 class User(UserMixin, db.Model):
-    """Application user with role-based access (carrier, substitute, admin)."""
+    """Application user with role-based access (carrier, substitute, supervisor, admin)."""
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -28,37 +36,108 @@ class User(UserMixin, db.Model):
 
 
 class RouteTrace(db.Model):
-    """Daily route drawn by a carrier and stored as GeoJSON."""
+    """Daily route drawn by a carrier, stored in the compact geometry format."""
 
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, default=date.today)
+    date = db.Column(db.Date, default=date.today, index=True)  # admin dashboard ordering
     carrier_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    geojson = db.Column(db.Text)  # Route polyline as GeoJSON
+    geojson = db.Column(db.Text)  # Legacy text geometry, emptied by `flask upgrade-db`
+    geometry = db.deferred(db.Column(db.LargeBinary))  # see geometry.py; loaded on first access
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = sync_version_column()
 
     # Relationship back-refs
     carrier = db.relationship("User", backref="routes")
 
+    def to_geojson(self):
+        """Return the route as a GeoJSON FeatureCollection, decoding on demand.
+
+        Unreadable geometry (e.g. legacy rows holding ``"None"`` that
+        `flask upgrade-db` has not emptied yet) reads as no geometry.
+        """
+        try:
+            if self.geometry is not None:
+                return decode_geometry(self.geometry)
+            if self.geojson:
+                return parse_legacy_geojson(self.geojson)
+        except GeometryError:
+            pass
+        return None
+
+    def set_geometry(self, geojson):
+        """Store ``geojson`` in compact form and rebuild its simplification levels."""
+        self.geometry = encode_geojson(geojson)
+        self.geojson = None
+        # Update rows in place by zoom: replacing the collection would insert
+        # the new rows before deleting the old ones and trip the unique index.
+        existing = {level.zoom: level for level in self.geometry_levels}
+        levels = []
+        for zoom, data in simplification_levels(geojson):
+            level = existing.get(zoom) or RouteGeometryLevel(zoom=zoom)
+            level.geometry = data
+            levels.append(level)
+        self.geometry_levels = levels
+
+    def geometry_for_zoom(self, zoom=None):
+        """Encoded geometry detailed enough for ``zoom`` (full geometry when None)."""
+        if zoom is not None:
+            level = (
+                RouteGeometryLevel.query.filter(RouteGeometryLevel.route_id == self.id, RouteGeometryLevel.zoom >= zoom)
+                .order_by(RouteGeometryLevel.zoom)
+                .first()
+            )
+            if level is not None:
+                return level.geometry
+        return self.geometry
+
+    __table_args__ = (
+        # user.routes backref and per-carrier date filters
+        db.Index("ix_route_trace_carrier_id_date", "carrier_id", "date"),
+        # device sync: a carrier's routes changed since a version
+        db.Index("ix_route_trace_carrier_id_version", "carrier_id", "version"),
+    )
+
+
+class RouteGeometryLevel(db.Model):
+    """Simplified copy of a route's geometry for rendering at a given zoom."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    route_id = db.Column(db.Integer, db.ForeignKey("route_trace.id"), nullable=False)
+    zoom = db.Column(db.Integer, nullable=False)
+    geometry = db.Column(db.LargeBinary, nullable=False)  # same encoding as RouteTrace.geometry
+
+    route = db.relationship("RouteTrace", backref=db.backref("geometry_levels", cascade="all, delete-orphan"))
+
+    __table_args__ = (
+        db.Index("ix_route_geometry_level_route_id_zoom", "route_id", "zoom", unique=True),
+    )
+
 
 class MailboxStop(db.Model):
     """GPS point for a mailbox stop, optionally with photo attachment."""
 
     id = db.Column(db.Integer, primary_key=True)
-    route_id = db.Column(db.Integer, db.ForeignKey("route_trace.id"))
+    route_id = db.Column(db.Integer, db.ForeignKey("route_trace.id"), index=True)
     lat = db.Column(db.Float)
     lng = db.Column(db.Float)
     label = db.Column(db.String(120))
     photo = db.Column(db.String(150))
+    version = sync_version_column()
 
     route = db.relationship("RouteTrace", backref="mailboxes")
 
+    __table_args__ = (
+        # device sync: stops on a carrier's routes changed since a version
+        db.Index("ix_mailbox_stop_route_id_version", "route_id", "version"),
+    )
+
 
 class PackageScan(db.Model):
     """A single barcode scan event during delivery."""
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey("route_trace.id"))
-    barcode = db.Column(db.String(120))
+    barcode = db.Column(db.String(120), index=True)
 
     # Delivery options
     too_big = db.Column(db.Boolean, default=False)
@@ -67,9 +146,148 @@ class PackageScan(db.Model):
     # Geo-tagging
     lat = db.Column(db.Float)
     lng = db.Column(db.Float)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # export ordering
 
     # Optional photo
     photo = db.Column(db.String(150))
 
-    route = db.relationship("RouteTrace", backref="scans")
\ No newline at end of file
+    # Idempotency key: the client's, or barcode + time bucket (see scan_dedupe.py)
+    dedupe_key = db.Column(db.String(160))
+
+    version = sync_version_column()
+
+    route = db.relationship("RouteTrace", backref="scans")
+    # Manifest entry for the scanned barcode, if dispatch has sent one
+    package = db.relationship(
+        "Package",
+        primaryjoin="foreign(PackageScan.barcode) == Package.tracking_number",
+        viewonly=True,
+        uselist=False,
+    )
+
+    __table_args__ = (
+        # route.scans backref, returned in scan order
+        db.Index("ix_package_scan_route_id_timestamp", "route_id", "timestamp"),
+        # device sync: scans on a carrier's routes changed since a version
+        db.Index("ix_package_scan_route_id_version", "route_id", "version"),
+        # a scan is ingested once per route, however often it is sent
+        db.Index("ix_package_scan_route_id_dedupe_key", "route_id", "dedupe_key", unique=True),
+    )
+
+
+class Package(db.Model):
+    """A manifest entry from dispatch, joined to scans by tracking number.
+
+    Loaded by ``flask import-packages`` (``sample-packages.json`` layout);
+    re-importing a tracking number updates its row in place.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    tracking_number = db.Column(db.String(40), unique=True, nullable=False)
+    package_type = db.Column(db.String(40))
+    weight = db.Column(db.Float)  # lb
+
+    # Dimensions (in)
+    length = db.Column(db.Float)
+    width = db.Column(db.Float)
+    height = db.Column(db.Float)
+
+    status = db.Column(db.String(40))
+    special_handling = db.Column(db.String(60))
+
+    # Destination
+    recipient = db.Column(db.String(120))
+    address = db.Column(db.String(200))
+    city = db.Column(db.String(80))
+    state = db.Column(db.String(20))
+    zip = db.Column(db.String(10))
+
+    created_date = db.Column(db.DateTime)
+    estimated_delivery = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RouteRollup(db.Model):
+    """Running per-route scan totals, maintained by triggers (database/rollups.py)."""
+
+    route_id = db.Column(db.Integer, db.ForeignKey("route_trace.id"), primary_key=True)
+    scans = db.Column(db.Integer, nullable=False, default=0)
+    too_big = db.Column(db.Integer, nullable=False, default=0)
+    too_small = db.Column(db.Integer, nullable=False, default=0)
+    mailbox_stops = db.Column(db.Integer, nullable=False, default=0)
+    first_scan_at = db.Column(db.DateTime)
+    last_scan_at = db.Column(db.DateTime)
+
+
+class DailyCarrierRollup(db.Model):
+    """Running totals per carrier and route date, maintained by triggers."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    carrier_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)  # all-carrier date ranges
+    routes = db.Column(db.Integer, nullable=False, default=0)
+    scans = db.Column(db.Integer, nullable=False, default=0)
+    too_big = db.Column(db.Integer, nullable=False, default=0)
+    too_small = db.Column(db.Integer, nullable=False, default=0)
+    mailbox_stops = db.Column(db.Integer, nullable=False, default=0)
+    first_scan_at = db.Column(db.DateTime)
+    last_scan_at = db.Column(db.DateTime)
+
+    carrier = db.relationship("User")
+
+    __table_args__ = (
+        # Upsert target of the triggers; also serves one carrier's date range
+        db.Index("ix_daily_carrier_rollup_carrier_id_date", "carrier_id", "date", unique=True),
+    )
+
+
+class WriteBehindCheckpoint(db.Model):
+    """Scan-log segment already committed by the write-behind buffer.
+
+    Written in the same transaction as the segment's rows so crash recovery
+    never replays a segment twice; pruned once the segment file is gone.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    segment = db.Column(db.String(64), unique=True, nullable=False)
+
+
+class ImportCheckpoint(db.Model):
+    """How far a bulk import (``flask import-deliveries``) has got in a file.
+
+    Updated in the same transaction as each imported batch, so a rerun
+    resumes at ``offset`` without skipping or duplicating rows.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), unique=True, nullable=False)  # absolute file path
+    offset = db.Column(db.BigInteger, nullable=False, default=0)  # bytes consumed, header included
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    last_delivery_id = db.Column(db.String(64))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SyncClock(db.Model):
+    """Single-row counter that hands out sync versions (see database/sync.py)."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class SyncRef(db.Model):
+    """Row created by a device push, keyed by the device's own reference.
+
+    A retried push finds its references here and gets the same ids back
+    instead of creating duplicates.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    ref = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # routes, stops or scans
+    row_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_sync_ref_user_id_ref", "user_id", "ref", unique=True),
+    )
@@ -0,0 +1,306 @@
+"""Shared read queries for PonyXpress.
+
+Queries that are used by more than one view (or by the query-plan checks)
+live here so every caller hits the same, index-backed access path.
+"""
+import base64
+import json
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, tuple_
+
+from database.models import (
+    db,
+    User,
+    RouteTrace,
+    MailboxStop,
+    Package,
+    PackageScan,
+    DailyCarrierRollup,
+    RouteRollup,
+)
+
+
+def scan_export_query(start=None, end=None, carrier=None):
+    """Scans joined to their route date and carrier name, newest first.
+
+    ``start``/``end`` are inclusive dates matched against the scan timestamp;
+    ``carrier`` is a username.
+    """
+    query = (
+        db.session.query(
+            RouteTrace.date,
+            User.username,
+            PackageScan.barcode,
+            PackageScan.too_big,
+            PackageScan.too_small,
+            PackageScan.lat,
+            PackageScan.lng,
+            PackageScan.timestamp,
+        )
+        .join(RouteTrace, PackageScan.route_id == RouteTrace.id)
+        .join(User, RouteTrace.carrier_id == User.id)
+    )
+    if start:
+        query = query.filter(PackageScan.timestamp >= datetime.combine(start, datetime.min.time()))
+    if end:
+        query = query.filter(PackageScan.timestamp < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if carrier:
+        query = query.filter(User.username == carrier)
+    return query.order_by(PackageScan.timestamp.desc())
+
+
+def route_version_query(route_id):
+    """A route's sync version with the count and newest version of its mailbox stops."""
+    stops = MailboxStop.query.filter(MailboxStop.route_id == RouteTrace.id)
+    return db.session.query(
+        RouteTrace.version,
+        stops.with_entities(func.count()).scalar_subquery(),
+        stops.with_entities(func.max(MailboxStop.version)).scalar_subquery(),
+    ).filter(RouteTrace.id == route_id)
+
+
+def route_version_stamp(route_id):
+    """Version stamp of a route and its mailbox stops, or ``None`` if there is no such route.
+
+    Every insert or update of the route or a stop raises one of the
+    versions (see :mod:`database.sync`) and deleting a stop lowers the
+    count, so the stamp changes with anything a route page shows.
+    """
+    row = route_version_query(route_id).first()
+    return tuple(row) if row is not None else None
+
+
+# ----------------------------------------------------------------------
+# Keyset (seek) pagination
+# ----------------------------------------------------------------------
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page."""
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of :func:`encode_cursor`; returns ``None`` for a missing or bad cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _route_cursor(cursor):
+    """``(date or None, id)`` from a route page cursor; ``None`` for a missing or bad one."""
+    after = decode_cursor(cursor)
+    try:
+        return None if after[0] is None else date.fromisoformat(after[0]), int(after[1])
+    except (TypeError, ValueError, IndexError):
+        return None  # no (or unusable) cursor: first page
+
+
+def route_page_query(cursor=None, carrier=None, start=None, end=None, undated=False):
+    """Dated routes newest first, or with ``undated`` those without a date by id, seeking past ``cursor``.
+
+    See :func:`route_page`. Both are index seeks; a row comparison with a
+    NULL date is NULL, so the two are never mixed in one query.
+    """
+    query = db.session.query(RouteTrace.id, RouteTrace.date, User.username.label("carrier")).outerjoin(
+        User, RouteTrace.carrier_id == User.id
+    )
+    if carrier:
+        query = query.filter(User.username == carrier)
+    if start:
+        query = query.filter(RouteTrace.date >= start)
+    if end:
+        query = query.filter(RouteTrace.date <= end)
+    after = _route_cursor(cursor)
+    if undated:
+        query = query.filter(RouteTrace.date.is_(None))
+        if after is not None and after[0] is None:
+            query = query.filter(RouteTrace.id < after[1])
+        return query.order_by(RouteTrace.id.desc())
+    query = query.filter(RouteTrace.date.isnot(None))
+    if after is not None:
+        # Past a null-date cursor this matches nothing: no dated routes are left
+        query = query.filter(tuple_(RouteTrace.date, RouteTrace.id) < tuple_(*after))
+    return query.order_by(RouteTrace.date.desc(), RouteTrace.id.desc())
+
+
+def _route_rows(build, cursor, limit):
+    """Up to ``limit + 1`` rows from ``build(undated)``: dated routes, then undated ones."""
+    after = _route_cursor(cursor)
+    rows = [] if after is not None and after[0] is None else build(False).limit(limit + 1).all()
+    if len(rows) <= limit:
+        rows += build(True).limit(limit + 1 - len(rows)).all()
+    return rows
+
+
+def route_page(cursor=None, limit=50, carrier=None, start=None, end=None):
+    """One page of routes, newest first, with carrier name and scan count.
+
+    Pages seek past ``(date, id)`` of the previous page's last row, so every
+    page costs the same however deep it is. Routes without a date come
+    after the dated ones, newest id first, with a null date in their
+    cursor. ``carrier`` is a username;
+    ``start``/``end`` are inclusive route dates. Returns ``(items, next_cursor)``
+    where ``next_cursor`` is ``None`` on the last page.
+    """
+    rows = _route_rows(lambda undated: route_page_query(cursor, carrier, start, end, undated), cursor, limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    counts = dict(
+        db.session.query(PackageScan.route_id, func.count())
+        .filter(PackageScan.route_id.in_([r.id for r in rows]))
+        .group_by(PackageScan.route_id)
+        .all()
+    ) if rows else {}
+    items = [
+        {"id": r.id, "date": r.date.isoformat() if r.date else None, "carrier": r.carrier, "scans": counts.get(r.id, 0)}
+        for r in rows
+    ]
+    next_cursor = encode_cursor(rows[-1].date, rows[-1].id) if has_more else None
+    return items, next_cursor
+
+
+def user_page(cursor=None, limit=50, role=None):
+    """One page of users in id order; same contract as :func:`route_page`."""
+    query = db.session.query(User.id, User.username, User.role)
+    if role:
+        query = query.filter(User.role == role)
+    after = decode_cursor(cursor)
+    if after and isinstance(after[0], int):
+        query = query.filter(User.id > after[0])
+    rows = query.order_by(User.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{"id": r.id, "username": r.username, "role": r.role} for r in rows]
+    next_cursor = encode_cursor(rows[-1].id) if has_more else None
+    return items, next_cursor
+
+
+# ----------------------------------------------------------------------
+# Rollups (see database/rollups.py)
+# ----------------------------------------------------------------------
+ROLLUP_COUNTS = ("scans", "too_big", "too_small", "mailbox_stops")
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def daily_rollup_query(start, end, carrier=None):
+    """Carrier-day rollup rows with ``start <= date <= end``, newest first."""
+    query = (
+        db.session.query(
+            DailyCarrierRollup.date,
+            User.username.label("carrier"),
+            DailyCarrierRollup.routes,
+            *(getattr(DailyCarrierRollup, name) for name in ROLLUP_COUNTS),
+            DailyCarrierRollup.first_scan_at,
+            DailyCarrierRollup.last_scan_at,
+        )
+        .outerjoin(User, DailyCarrierRollup.carrier_id == User.id)
+        .filter(DailyCarrierRollup.date >= start, DailyCarrierRollup.date <= end)
+    )
+    if carrier:
+        query = query.filter(User.username == carrier)
+    return query.order_by(DailyCarrierRollup.date.desc(), DailyCarrierRollup.carrier_id)
+
+
+def daily_rollups(start, end, carrier=None):
+    """Per carrier-day and per-day totals between two route dates (inclusive).
+
+    Reads one rollup row per carrier and day, never the scans themselves.
+    Returns ``(items, days)``: carrier-day rows and their per-day sums,
+    both newest first.
+    """
+    totals = ("routes",) + ROLLUP_COUNTS
+    items, days = [], {}
+    for row in daily_rollup_query(start, end, carrier):
+        item = row._asdict()
+        item["date"] = row.date.isoformat()
+        item["first_scan_at"], item["last_scan_at"] = _iso(row.first_scan_at), _iso(row.last_scan_at)
+        items.append(item)
+        day = days.get(item["date"])
+        if day is None:
+            days[item["date"]] = {name: item[name] for name in totals + ("first_scan_at", "last_scan_at")}
+            continue
+        for name in totals:
+            day[name] += item[name]
+        for name, pick in (("first_scan_at", min), ("last_scan_at", max)):
+            known = [t for t in (day[name], item[name]) if t]
+            day[name] = pick(known) if known else None
+    return items, [{"date": d, **values} for d, values in days.items()]
+
+
+def route_rollup_page_query(cursor=None, carrier=None, start=None, end=None, undated=False):
+    """:func:`route_page_query` with each route's rollup columns added."""
+    return route_page_query(cursor, carrier, start, end, undated).outerjoin(
+        RouteRollup, RouteRollup.route_id == RouteTrace.id
+    ).add_columns(
+        *(getattr(RouteRollup, name) for name in ROLLUP_COUNTS),
+        RouteRollup.first_scan_at,
+        RouteRollup.last_scan_at,
+    )
+
+
+def route_rollup_page(cursor=None, limit=50, carrier=None, start=None, end=None):
+    """One keyset page of routes with their rollup totals; same contract as :func:`route_page`."""
+    rows = _route_rows(
+        lambda undated: route_rollup_page_query(cursor, carrier, start, end, undated), cursor, limit
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [
+        {
+            "id": r.id,
+            "date": _iso(r.date),
+            "carrier": r.carrier,
+            **{name: getattr(r, name) or 0 for name in ROLLUP_COUNTS},
+            "first_scan_at": _iso(r.first_scan_at),
+            "last_scan_at": _iso(r.last_scan_at),
+        }
+        for r in rows
+    ]
+    next_cursor = encode_cursor(rows[-1].date, rows[-1].id) if has_more else None
+    return items, next_cursor
+
+
+# ----------------------------------------------------------------------
+# Packages
+# ----------------------------------------------------------------------
+def package_details(ids):
+    """Manifest entries of the packages with ``ids``, in that order.
+
+    Items use the ``sample-packages.json`` layout; unknown ids are skipped.
+    """
+    if not ids:
+        return []
+    found = {package.id: package for package in Package.query.filter(Package.id.in_(ids))}
+    items = []
+    for package_id in ids:
+        package = found.get(package_id)
+        if package is None:
+            continue
+        items.append({
+            "tracking_number": package.tracking_number,
+            "package_type": package.package_type,
+            "weight": package.weight,
+            "dimensions": {"length": package.length, "width": package.width, "height": package.height},
+            "status": package.status,
+            "destination": {
+                "name": package.recipient,
+                "address": package.address,
+                "city": package.city,
+                "state": package.state,
+                "zip": package.zip,
+            },
+            "special_handling": package.special_handling,
+            "created_date": _iso(package.created_date),
+            "estimated_delivery": _iso(package.estimated_delivery),
+        })
+    return items
@@ -0,0 +1,99 @@
+"""``EXPLAIN QUERY PLAN`` regression checks for the app's hot queries.
+
+Each entry in ``HOT_QUERIES`` mirrors a query issued by a view. The check
+compiles it for the current engine, asks SQLite for its plan and reports
+any step that falls back to a full table scan (``SCAN <table>`` without an
+index). Ordered index scans (``SCAN ... USING INDEX``) are accepted: they
+read rows in index order and stop as soon as the caller stops fetching.
+
+Plans are taken from an empty in-memory database built from the models
+(``db.metadata.create_all``), not the configured one: ``ANALYZE`` statistics
+there (``flask upgrade-db`` gathers them) let the planner pick a scan over a
+small or unselective table, so the result would depend on the data rather
+than on the schema the check is meant to guard.
+"""
+import re
+from datetime import date
+
+from sqlalchemy import create_engine
+
+from database.models import db, User, RouteTrace, RouteGeometryLevel, MailboxStop, Package, PackageScan
+from database.queries import (
+    daily_rollup_query,
+    encode_cursor,
+    route_page_query,
+    route_rollup_page_query,
+    route_version_query,
+    scan_export_query,
+)
+from database.sync import route_changes_query, scan_changes_query, stop_changes_query
+
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b(?! USING)")
+
+# name -> callable returning a legacy Query, evaluated inside an app context
+HOT_QUERIES = {
+    "login": lambda: User.query.filter_by(username="admin"),
+    "admin_dashboard_routes": lambda: RouteTrace.query.order_by(RouteTrace.date.desc()),
+    "carrier_routes": lambda: RouteTrace.query.filter(RouteTrace.carrier_id == 1).order_by(RouteTrace.date),
+    "route_scans": lambda: PackageScan.query.filter(PackageScan.route_id == 1),
+    "route_geometry_level": lambda: RouteGeometryLevel.query.filter(
+        RouteGeometryLevel.route_id == 1, RouteGeometryLevel.zoom >= 12
+    ).order_by(RouteGeometryLevel.zoom),
+    "route_mailboxes": lambda: MailboxStop.query.filter(MailboxStop.route_id == 1),
+    "barcode_lookup": lambda: PackageScan.query.filter(PackageScan.barcode == "9405511206213100012345"),
+    "scan_package": lambda: Package.query.filter(Package.tracking_number == "9405511206213100012345"),
+    "admin_routes_page": lambda: route_page_query(cursor=encode_cursor(date(2025, 6, 1), 100)).limit(51),
+    "admin_routes_page_undated": lambda: route_page_query(cursor=encode_cursor(None, 100), undated=True).limit(51),
+    "admin_routes_page_undated_carrier": lambda: route_page_query(
+        cursor=encode_cursor(None, 100), carrier="admin", undated=True
+    ).limit(51),
+    "admin_routes_page_carrier": lambda: route_page_query(
+        cursor=encode_cursor(date(2025, 6, 1), 100), carrier="admin"
+    ).limit(51),
+    "admin_users_page": lambda: User.query.filter(User.id > 100).order_by(User.id).limit(51),
+    "rollup_daily": lambda: daily_rollup_query(date(2025, 6, 1), date(2025, 6, 30)),
+    "rollup_daily_carrier": lambda: daily_rollup_query(date(2025, 6, 1), date(2025, 6, 30), carrier="admin"),
+    "rollup_routes_page": lambda: route_rollup_page_query(cursor=encode_cursor(date(2025, 6, 1), 100)).limit(51),
+    "export": lambda: scan_export_query(),
+    "export_date_range": lambda: scan_export_query(start=date(2025, 6, 1), end=date(2025, 6, 30)),
+    "export_carrier": lambda: scan_export_query(carrier="admin"),
+    "sync_routes": lambda: route_changes_query(1, 1000, 2000).limit(501),
+    "sync_stops": lambda: stop_changes_query(1, 1000, 2000).limit(501),
+    "sync_scans": lambda: scan_changes_query(1, 1000, 2000).limit(501),
+    "route_version": lambda: route_version_query(1),
+}
+
+
+def explain(query, engine=None):
+    """Return the ``EXPLAIN QUERY PLAN`` detail lines for a legacy Query.
+
+    Runs against ``engine``, by default the app's own database.
+    """
+    engine = engine or db.engine
+    compiled = query.statement.compile(dialect=engine.dialect)
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional).all()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans(queries=None):
+    """Explain every hot query against a fresh schema and collect full-table-scan offenders.
+
+    Returns ``(plans, failures)`` where ``plans`` maps query name to its plan
+    lines and ``failures`` maps query name to the tables it scans in full.
+    """
+    engine = create_engine("sqlite://")
+    try:
+        db.metadata.create_all(engine)
+        plans, failures = {}, {}
+        for name, build in (queries or HOT_QUERIES).items():
+            plan = explain(build(), engine)
+            plans[name] = plan
+            scanned = [m.group(1) for m in map(FULL_SCAN.match, plan) if m]
+            if scanned:
+                failures[name] = scanned
+        return plans, failures
+    finally:
+        engine.dispose()
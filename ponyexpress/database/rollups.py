@@ -0,0 +1,227 @@
+"""Incrementally maintained scan rollups per route and per carrier-day.
+
+``RouteRollup`` and ``DailyCarrierRollup`` hold running totals (scans,
+too-big/too-small counts, mailbox stops, first/last scan time, and routes
+per carrier-day). As with the spatial index, SQLite triggers on
+``route_trace``, ``package_scan`` and ``mailbox_stop`` keep them current,
+so every write path (ORM, bulk ``insert()``, write-behind, raw SQL) is
+covered without app code. Reports then read a row per day or per route
+instead of aggregating every scan ever recorded.
+
+Carrier-days are keyed by the route's date. Besides inserts, the
+triggers follow the updates the app makes (device sync can change a
+scan's ``too_big``/``too_small`` and a route's date): a changed scan flag
+adjusts the counts, and a route moving to another carrier-day takes its
+totals along. Deletes and other hand edits are not followed; after
+those, run ``flask rebuild-rollups``.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from database.models import db
+
+_COUNTS = ("scans", "too_big", "too_small", "mailbox_stops")
+
+_ROUTE_UPSERT = (
+    "INSERT INTO route_rollup (route_id, scans, too_big, too_small, mailbox_stops, first_scan_at, last_scan_at) "
+    "{select} ON CONFLICT (route_id) DO UPDATE SET {merge}"
+)
+_DAILY_UPSERT = (
+    "INSERT INTO daily_carrier_rollup "
+    "(carrier_id, date, routes, scans, too_big, too_small, mailbox_stops, first_scan_at, last_scan_at) "
+    "{select} ON CONFLICT (carrier_id, date) DO UPDATE SET {merge}"
+)
+
+
+def _merge(counts):
+    """SET clause adding ``excluded`` counts and widening the scan-time window."""
+    parts = [f"{c} = {c} + excluded.{c}" for c in counts]
+    parts += [
+        "first_scan_at = coalesce(min(first_scan_at, excluded.first_scan_at), first_scan_at, excluded.first_scan_at)",
+        "last_scan_at = coalesce(max(last_scan_at, excluded.last_scan_at), last_scan_at, excluded.last_scan_at)",
+    ]
+    return ", ".join(parts)
+
+
+def _route_upsert(select):
+    return _ROUTE_UPSERT.format(select=select, merge=_merge(_COUNTS))
+
+
+def _daily_upsert(select):
+    return _DAILY_UPSERT.format(select=select, merge=_merge(("routes",) + _COUNTS))
+
+
+# Change in the too-big and too-small counts made by a scan update
+_FLAG_DELTAS = (
+    "coalesce(NEW.too_big, 0) - coalesce(OLD.too_big, 0), coalesce(NEW.too_small, 0) - coalesce(OLD.too_small, 0)"
+)
+
+
+def _route_total(column):
+    """The updated route's ``route_rollup`` total of ``column`` (0 without a rollup row)."""
+    return f"coalesce((SELECT {column} FROM route_rollup WHERE route_id = NEW.id), 0)"
+
+
+# Every SELECT feeding an upsert has a WHERE clause, which SQLite's UPSERT
+# grammar requires to tell ON CONFLICT apart from a join constraint.
+_TRIGGERS = {
+    "route_trace_rollup_insert": (
+        "CREATE TRIGGER IF NOT EXISTS route_trace_rollup_insert AFTER INSERT ON route_trace "
+        "WHEN NEW.carrier_id IS NOT NULL AND NEW.date IS NOT NULL BEGIN "
+        + _daily_upsert("SELECT NEW.carrier_id, NEW.date, 1, 0, 0, 0, 0, NULL, NULL WHERE true")
+        + "; END"
+    ),
+    "package_scan_rollup_insert": (
+        "CREATE TRIGGER IF NOT EXISTS package_scan_rollup_insert AFTER INSERT ON package_scan "
+        "WHEN NEW.route_id IS NOT NULL BEGIN "
+        + _route_upsert(
+            "SELECT NEW.route_id, 1, coalesce(NEW.too_big, 0), coalesce(NEW.too_small, 0), 0, "
+            "NEW.timestamp, NEW.timestamp WHERE true"
+        )
+        + "; "
+        + _daily_upsert(
+            "SELECT carrier_id, date, 0, 1, coalesce(NEW.too_big, 0), coalesce(NEW.too_small, 0), 0, "
+            "NEW.timestamp, NEW.timestamp FROM route_trace "
+            "WHERE id = NEW.route_id AND carrier_id IS NOT NULL AND date IS NOT NULL"
+        )
+        + "; END"
+    ),
+    "package_scan_rollup_update": (
+        "CREATE TRIGGER IF NOT EXISTS package_scan_rollup_update AFTER UPDATE OF too_big, too_small ON package_scan "
+        "WHEN NEW.route_id IS NOT NULL AND NEW.route_id IS OLD.route_id "
+        "AND (NEW.too_big IS NOT OLD.too_big OR NEW.too_small IS NOT OLD.too_small) BEGIN "
+        + _route_upsert(f"SELECT NEW.route_id, 0, {_FLAG_DELTAS}, 0, NULL, NULL WHERE true")
+        + "; "
+        + _daily_upsert(
+            f"SELECT carrier_id, date, 0, 0, {_FLAG_DELTAS}, 0, NULL, NULL FROM route_trace "
+            "WHERE id = NEW.route_id AND carrier_id IS NOT NULL AND date IS NOT NULL"
+        )
+        + "; END"
+    ),
+    # A route moving to another carrier-day: take its totals out of the old
+    # day (recomputing the old day's scan-time window from the routes left,
+    # and dropping the day once no route is left), then add them to the new one
+    "route_trace_rollup_update": (
+        "CREATE TRIGGER IF NOT EXISTS route_trace_rollup_update AFTER UPDATE OF carrier_id, date ON route_trace "
+        "WHEN NEW.carrier_id IS NOT OLD.carrier_id OR NEW.date IS NOT OLD.date BEGIN "
+        "UPDATE daily_carrier_rollup SET routes = routes - 1, "
+        + ", ".join(f"{c} = {c} - {_route_total(c)}" for c in _COUNTS)
+        + ", "
+        + ", ".join(
+            f"{column} = (SELECT {fn}(rr.{column}) FROM route_rollup rr JOIN route_trace r ON r.id = rr.route_id "
+            "WHERE r.carrier_id = OLD.carrier_id AND r.date = OLD.date)"
+            for column, fn in (("first_scan_at", "min"), ("last_scan_at", "max"))
+        )
+        + " WHERE carrier_id = OLD.carrier_id AND date = OLD.date; "
+        "DELETE FROM daily_carrier_rollup WHERE carrier_id = OLD.carrier_id AND date = OLD.date AND routes <= 0; "
+        + _daily_upsert(
+            "SELECT NEW.carrier_id, NEW.date, 1, "
+            + ", ".join(_route_total(c) for c in _COUNTS)
+            + ", (SELECT first_scan_at FROM route_rollup WHERE route_id = NEW.id), "
+            "(SELECT last_scan_at FROM route_rollup WHERE route_id = NEW.id) "
+            "WHERE NEW.carrier_id IS NOT NULL AND NEW.date IS NOT NULL"
+        )
+        + "; END"
+    ),
+    "mailbox_stop_rollup_insert": (
+        "CREATE TRIGGER IF NOT EXISTS mailbox_stop_rollup_insert AFTER INSERT ON mailbox_stop "
+        "WHEN NEW.route_id IS NOT NULL BEGIN "
+        + _route_upsert("SELECT NEW.route_id, 0, 0, 0, 1, NULL, NULL WHERE true")
+        + "; "
+        + _daily_upsert(
+            "SELECT carrier_id, date, 0, 0, 0, 0, 1, NULL, NULL FROM route_trace "
+            "WHERE id = NEW.route_id AND carrier_id IS NOT NULL AND date IS NOT NULL"
+        )
+        + "; END"
+    ),
+}
+
+
+def _grouped_scans_sql(where="true"):
+    """Upserts folding the scans matching ``where`` (alias ``s``) into both rollups."""
+    totals = (
+        "count(*), sum(coalesce(s.too_big, 0)), sum(coalesce(s.too_small, 0)), 0, min(s.timestamp), max(s.timestamp)"
+    )
+    return (
+        _route_upsert(
+            f"SELECT s.route_id, {totals} FROM package_scan s "
+            f"WHERE s.route_id IS NOT NULL AND {where} GROUP BY s.route_id"
+        ),
+        _daily_upsert(
+            f"SELECT r.carrier_id, r.date, 0, {totals} FROM package_scan s JOIN route_trace r ON r.id = s.route_id "
+            f"WHERE r.carrier_id IS NOT NULL AND r.date IS NOT NULL AND {where} GROUP BY r.carrier_id, r.date"
+        ),
+    )
+
+
+def _installed():
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'package_scan_rollup_insert'")
+    ).first() is not None
+
+
+def create_rollups(backfill=True):
+    """Install the rollup triggers; backfill from existing rows on first install.
+
+    Idempotent. Returns ``True`` when the rollups were backfilled.
+    """
+    installed = _installed()
+    for statement in _TRIGGERS.values():
+        db.session.execute(text(statement))
+    db.session.commit()
+    if installed or not backfill:
+        return False
+    rebuild_rollups()
+    return True
+
+
+def rebuild_rollups():
+    """Recompute both rollup tables from ``route_trace``, scans and mailbox stops.
+
+    Runs in one transaction. Returns ``(route_rows, daily_rows)``.
+    """
+    statements = [
+        "DELETE FROM route_rollup",
+        "DELETE FROM daily_carrier_rollup",
+        _daily_upsert(
+            "SELECT carrier_id, date, count(*), 0, 0, 0, 0, NULL, NULL FROM route_trace "
+            "WHERE carrier_id IS NOT NULL AND date IS NOT NULL GROUP BY carrier_id, date"
+        ),
+        *_grouped_scans_sql(),
+        _route_upsert(
+            "SELECT route_id, 0, 0, 0, count(*), NULL, NULL FROM mailbox_stop WHERE route_id IS NOT NULL GROUP BY route_id"
+        ),
+        _daily_upsert(
+            "SELECT r.carrier_id, r.date, 0, 0, 0, 0, count(*), NULL, NULL "
+            "FROM mailbox_stop m JOIN route_trace r ON r.id = m.route_id "
+            "WHERE r.carrier_id IS NOT NULL AND r.date IS NOT NULL GROUP BY r.carrier_id, r.date"
+        ),
+    ]
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+    return (
+        db.session.execute(text("SELECT count(*) FROM route_rollup")).scalar(),
+        db.session.execute(text("SELECT count(*) FROM daily_carrier_rollup")).scalar(),
+    )
+
+
+@contextmanager
+def bulk_rollups():
+    """Fold scans inserted inside the block into the rollups with one grouped pass.
+
+    Works like :func:`database.spatial.bulk_indexing`. Inside the session's
+    transaction, the per-row scan trigger is dropped. The new scans are then
+    aggregated by route and by carrier-day, and the trigger is recreated.
+    The caller must commit.
+    """
+    if not _installed():
+        yield
+        return
+    last_id = db.session.execute(text("SELECT coalesce(max(id), 0) FROM package_scan")).scalar()
+    db.session.execute(text("DROP TRIGGER IF EXISTS package_scan_rollup_insert"))
+    yield
+    for statement in _grouped_scans_sql("s.id > :last_id"):
+        db.session.execute(text(statement), {"last_id": last_id})
+    db.session.execute(text(_TRIGGERS["package_scan_rollup_insert"]))
@@ -0,0 +1,169 @@
+"""R*Tree spatial index and nearest-neighbour queries for geo-tagged rows.
+
+SQLite's R*Tree module keeps a bounding-box index per table
+(``<table>_rtree``). Triggers on the base table keep it in sync, so every
+write path (ORM, bulk ``insert()``, raw SQL) is covered without app code.
+Queries use the index to fetch candidates inside a bounding box (split in
+two where it crosses the antimeridian) and then rank them by exact
+great-circle distance.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database.models import db
+from geo import bounding_boxes, haversine_many
+
+# table name -> extra columns returned with each hit
+SPATIAL_TABLES = {
+    "mailbox_stop": ("route_id", "label"),
+    "package_scan": ("route_id", "barcode", "timestamp"),
+}
+
+# Radius that seeds the expanding search, and the largest radius searched
+_INITIAL_SEARCH_M = 250.0
+MAX_SEARCH_M = 20037508.0  # half the equator; the whole globe
+
+_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {t}_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    """CREATE TRIGGER IF NOT EXISTS {t}_rtree_insert AFTER INSERT ON {t}
+    WHEN NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL
+    BEGIN
+        INSERT INTO {t}_rtree VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lng, NEW.lng);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {t}_rtree_update AFTER UPDATE OF lat, lng ON {t}
+    BEGIN
+        DELETE FROM {t}_rtree WHERE id = OLD.id;
+        INSERT INTO {t}_rtree SELECT NEW.id, NEW.lat, NEW.lat, NEW.lng, NEW.lng
+        WHERE NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {t}_rtree_delete AFTER DELETE ON {t}
+    BEGIN
+        DELETE FROM {t}_rtree WHERE id = OLD.id;
+    END""",
+)
+
+
+def create_spatial_index():
+    """Create the R*Tree tables and triggers, backfilling existing rows.
+
+    Idempotent. Returns the tables whose index was backfilled, or ``None``
+    when the SQLite build lacks the R*Tree module (queries then fall back
+    to an unindexed bounding-box filter).
+    """
+    backfilled = []
+    with db.engine.begin() as conn:
+        for table in SPATIAL_TABLES:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": f"{table}_rtree"}
+            ).first()
+            try:
+                for statement in _DDL:
+                    conn.exec_driver_sql(statement.format(t=table))
+            except OperationalError as exc:
+                if "no such module" in str(exc):
+                    return None
+                raise
+            if not exists:
+                conn.exec_driver_sql(
+                    f"INSERT INTO {table}_rtree SELECT id, lat, lat, lng, lng FROM {table} "
+                    "WHERE lat IS NOT NULL AND lng IS NOT NULL"
+                )
+                backfilled.append(table)
+    return backfilled
+
+
+def _has_spatial_index(table):
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": f"{table}_rtree"}
+    ).first() is not None
+
+
+@contextmanager
+def bulk_indexing(table):
+    """Index rows inserted inside the block in one pass instead of per row.
+
+    Within the session's transaction, the row-by-row insert trigger is
+    dropped, and on exit the new rows (ids above the previous maximum) are
+    added to the R*Tree with a single ``INSERT … SELECT``. The trigger is then
+    recreated. That halves the cost of indexing large imports. Everything
+    is part of one transaction, so a rollback restores the trigger and
+    other connections never see it missing. The caller must commit.
+    """
+    if not _has_spatial_index(table):
+        yield
+        return
+    last_id = db.session.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar()
+    db.session.execute(text(f"DROP TRIGGER IF EXISTS {table}_rtree_insert"))
+    yield
+    db.session.execute(
+        text(
+            f"INSERT INTO {table}_rtree SELECT id, lat, lat, lng, lng FROM {table} "
+            "WHERE id > :last_id AND lat IS NOT NULL AND lng IS NOT NULL"
+        ),
+        {"last_id": last_id},
+    )
+    db.session.execute(text(_DDL[1].format(t=table)))
+
+
+def _candidates(table, boxes, route_id=None, carrier_id=None):
+    """Rows of ``table`` inside any of ``boxes``, via the R*Tree when available."""
+    extra = ", ".join(f"t.{c}" for c in SPATIAL_TABLES[table])
+    indexed = _has_spatial_index(table)
+    params, conditions = {}, []
+    for i, (min_lat, max_lat, min_lng, max_lng) in enumerate(boxes):
+        params.update({f"min_lat{i}": min_lat, f"max_lat{i}": max_lat, f"min_lng{i}": min_lng, f"max_lng{i}": max_lng})
+        if indexed:
+            conditions.append(
+                f"(r.max_lat >= :min_lat{i} AND r.min_lat <= :max_lat{i} "
+                f"AND r.max_lng >= :min_lng{i} AND r.min_lng <= :max_lng{i})"
+            )
+        else:
+            conditions.append(
+                f"(t.lat BETWEEN :min_lat{i} AND :max_lat{i} AND t.lng BETWEEN :min_lng{i} AND :max_lng{i})"
+            )
+    if indexed:
+        sql = f"SELECT t.id, t.lat, t.lng, {extra} FROM {table}_rtree r JOIN {table} t ON t.id = r.id "
+    else:
+        sql = f"SELECT t.id, t.lat, t.lng, {extra} FROM {table} t "
+    sql += f"WHERE ({' OR '.join(conditions)})"
+    if route_id is not None:
+        sql += " AND t.route_id = :route_id"
+        params["route_id"] = route_id
+    if carrier_id is not None:
+        sql += " AND t.route_id IN (SELECT id FROM route_trace WHERE carrier_id = :carrier_id)"
+        params["carrier_id"] = carrier_id
+    return db.session.execute(text(sql), params).mappings().all()
+
+
+def nearest(table, lat, lng, k=10, radius_m=None, route_id=None, carrier_id=None):
+    """The ``k`` rows of ``table`` closest to ``(lat, lng)``.
+
+    The search box doubles from 250 m until ``k`` hits lie inside the
+    searched circle or it reaches ``radius_m`` (at most ``MAX_SEARCH_M``, the
+    default), so a dense area is answered from a small box whatever the
+    radius. Only rows within ``radius_m`` are returned. Each hit is a dict
+    of the row's columns plus ``distance_m``.
+    """
+    if table not in SPATIAL_TABLES:
+        raise ValueError(f"No spatial index for {table!r}")
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    if radius_m is not None and not 0 < radius_m <= MAX_SEARCH_M:
+        raise ValueError(f"radius_m must be in (0, {MAX_SEARCH_M}]")
+    limit_m = MAX_SEARCH_M if radius_m is None else radius_m
+    search_m = min(_INITIAL_SEARCH_M, limit_m)
+    while True:
+        rows = _candidates(table, bounding_boxes(lat, lng, search_m), route_id, carrier_id)
+        distances = haversine_many(lat, lng, [r["lat"] for r in rows], [r["lng"] for r in rows])
+        hits = [
+            {**row, "distance_m": round(float(distance), 2)}
+            for row, distance in zip(rows, distances)
+            if distance <= search_m
+        ]
+        # Only hits inside the circle are guaranteed to beat anything outside the box
+        if len(hits) >= k or search_m >= limit_m:
+            hits.sort(key=lambda hit: hit["distance_m"])
+            return hits[:k]
+        search_m = min(search_m * 2, limit_m)
@@ -0,0 +1,52 @@
+"""SQLite storage profiles applied to every pooled connection.
+
+A profile is a mapping of ``PRAGMA`` name to value. ``apply_storage_profile``
+installs a ``connect`` listener on the app's engines so each new DBAPI
+connection is configured before the pool hands it out.
+"""
+from sqlalchemy import event
+
+from database.models import db
+
+STORAGE_PROFILES = {
+    # SQLite's built-in behaviour: rollback journal, no busy timeout
+    "default": {},
+    # Concurrent carriers + admin exports: readers never block the writer
+    # and writers wait for the lock instead of failing immediately.
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,  # ms
+        "mmap_size": 268435456,  # 256 MiB
+        "cache_size": -65536,  # negative = KiB, i.e. 64 MiB
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def storage_pragmas(app):
+    """Resolve the PRAGMA mapping for the app's configured profile."""
+    name = app.config["STORAGE_PROFILE"]
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile {name!r}; choose from {', '.join(STORAGE_PROFILES)}")
+    pragmas = dict(STORAGE_PROFILES[name])
+    pragmas.update(app.config.get("SQLITE_PRAGMAS") or {})
+    return pragmas
+
+
+def apply_storage_profile(app):
+    """Install the configured PRAGMAs on every SQLite engine of ``app``."""
+    pragmas = storage_pragmas(app)
+    if not pragmas:
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", set_pragmas)
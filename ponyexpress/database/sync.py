@@ -0,0 +1,538 @@
+"""Delta sync of routes, mailbox stops and scans for offline carrier devices.
+
+Change tracking
+---------------
+``RouteTrace``, ``MailboxStop`` and ``PackageScan`` rows carry a ``version``
+taken from one database-wide counter (``SyncClock``). As with the spatial
+index and the rollups, SQLite triggers bump it on every insert and update,
+whichever code path made the change. SQLite runs one writer at a time, so
+versions are committed in increasing order. A device that has seen every
+change up to version N therefore only needs rows with ``version > N``.
+The app never deletes these rows, so deletions are not tracked.
+
+Pull (:func:`changes_since`)
+----------------------------
+This returns one carrier's changed rows in version order, a page at a
+time, as compact column/row arrays. Pages are capped at the counter value
+read before the row queries, so a write committed while a page is being
+built is never skipped. The returned cursor is the version to ask from
+next time. Once a device is caught up, re-syncing after a shift costs the
+shift's rows only.
+
+Push (:func:`apply_changes`)
+----------------------------
+This takes a device's offline edits. New rows carry a device reference
+(``ref``), and stops and scans may name a route by its ``ref``. A
+retried push gets the same ids back instead of creating duplicates.
+Updates carry the ``base_version`` they were made against. An update is
+applied only if the row still has that version, otherwise it is
+reported as a conflict along with the server's copy.
+
+Created scans get the same ``dedupe_key`` as ``POST /scan`` (see
+scan_dedupe.py) and are inserted with ``ON CONFLICT DO NOTHING``. A scan
+already recorded, online before the device lost signal or under another
+ref, is not inserted again: its ref is answered with the existing row.
+"""
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import undefer
+
+from database.models import db, MailboxStop, PackageScan, RouteTrace, SyncRef
+from geometry import GeometryError
+from scan_dedupe import ScanDeduper, ScanKeyError
+
+SYNCED_TABLES = ("route_trace", "mailbox_stop", "package_scan")
+
+_BUMP = (
+    "UPDATE sync_clock SET version = version + 1 WHERE id = 1; "
+    "UPDATE {table} SET version = (SELECT version FROM sync_clock WHERE id = 1) WHERE id = NEW.id; "
+)
+
+
+def _triggers(table):
+    return {
+        f"{table}_sync_insert": (
+            f"CREATE TRIGGER IF NOT EXISTS {table}_sync_insert AFTER INSERT ON {table} "
+            f"BEGIN {_BUMP.format(table=table)}END"
+        ),
+        # The WHEN clause skips the trigger's own version writes
+        f"{table}_sync_update": (
+            f"CREATE TRIGGER IF NOT EXISTS {table}_sync_update AFTER UPDATE ON {table} "
+            f"WHEN NEW.version IS OLD.version BEGIN {_BUMP.format(table=table)}END"
+        ),
+    }
+
+
+_TRIGGERS = {name: ddl for table in SYNCED_TABLES for name, ddl in _triggers(table).items()}
+
+# Columns of each kind in pull pages, conflict reports and push results
+COLUMNS = {
+    "routes": ("id", "version", "date", "created_at", "geometry"),
+    "stops": ("id", "version", "route_id", "lat", "lng", "label", "photo"),
+    "scans": ("id", "version", "route_id", "barcode", "too_big", "too_small", "lat", "lng", "timestamp", "photo"),
+}
+_MODELS = {"routes": RouteTrace, "stops": MailboxStop, "scans": PackageScan}
+
+# Fields a device may change on an existing row
+_UPDATABLE = {
+    "routes": ("date", "geojson"),
+    "stops": ("lat", "lng", "label", "photo"),
+    "scans": ("too_big", "too_small", "photo"),
+}
+
+
+class SyncError(ValueError):
+    """The push payload is malformed as a whole."""
+
+
+class _Rejected(ValueError):
+    """One pushed item is invalid; reported back, the rest still apply."""
+
+
+# ----------------------------------------------------------------------
+# Change tracking
+# ----------------------------------------------------------------------
+def _installed():
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'package_scan_sync_insert'")
+    ).first() is not None
+
+
+def current_version():
+    """Latest version handed out."""
+    return db.session.execute(text("SELECT coalesce(max(version), 0) FROM sync_clock")).scalar()
+
+
+def create_sync(backfill=True):
+    """Install the version triggers; version existing rows on first install.
+
+    Idempotent. Returns the number of rows backfilled.
+    """
+    installed = _installed()
+    db.session.execute(text("INSERT OR IGNORE INTO sync_clock (id, version) VALUES (1, 0)"))
+    backfilled = 0
+    if not installed and backfill:
+        # Existing rows get consecutive versions, table by table in id order
+        for table in SYNCED_TABLES:
+            clock = current_version()
+            backfilled += db.session.execute(
+                text(f"UPDATE {table} SET version = :clock + id WHERE version IS NULL"), {"clock": clock}
+            ).rowcount
+            db.session.execute(
+                text(f"UPDATE sync_clock SET version = :clock + (SELECT coalesce(max(id), 0) FROM {table}) WHERE id = 1"),
+                {"clock": clock},
+            )
+    for statement in _TRIGGERS.values():
+        db.session.execute(text(statement))
+    db.session.commit()
+    return backfilled
+
+
+@contextmanager
+def bulk_versioning(table):
+    """Version the rows inserted inside the block in one pass.
+
+    Works like :func:`database.spatial.bulk_indexing`. Inside the session's
+    transaction, the per-row insert trigger is dropped. The new rows then
+    get consecutive versions, and the trigger is recreated. The caller must
+    commit.
+    """
+    if not _installed():
+        yield
+        return
+    last_id = db.session.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar()
+    db.session.execute(text(f"DROP TRIGGER IF EXISTS {table}_sync_insert"))
+    yield
+    params = {"clock": current_version(), "last_id": last_id}
+    db.session.execute(text(f"UPDATE {table} SET version = :clock + id - :last_id WHERE id > :last_id"), params)
+    db.session.execute(
+        text(
+            f"UPDATE sync_clock SET version = :clock + (SELECT coalesce(max(id), :last_id) FROM {table}) - :last_id "
+            "WHERE id = 1"
+        ),
+        params,
+    )
+    db.session.execute(text(_TRIGGERS[f"{table}_sync_insert"]))
+
+
+# ----------------------------------------------------------------------
+# Pull
+# ----------------------------------------------------------------------
+def _carrier_routes(carrier_id):
+    return db.session.query(RouteTrace.id).filter(RouteTrace.carrier_id == carrier_id)
+
+
+def route_changes_query(carrier_id, after, upto):
+    """A carrier's routes with ``after < version <= upto``, in version order."""
+    return (
+        RouteTrace.query.options(undefer(RouteTrace.geometry))
+        .filter(RouteTrace.carrier_id == carrier_id, RouteTrace.version > after, RouteTrace.version <= upto)
+        .order_by(RouteTrace.version)
+    )
+
+
+def stop_changes_query(carrier_id, after, upto):
+    """Mailbox stops on a carrier's routes with ``after < version <= upto``."""
+    return (
+        db.session.query(*(getattr(MailboxStop, c) for c in COLUMNS["stops"]))
+        .filter(
+            MailboxStop.route_id.in_(_carrier_routes(carrier_id)),
+            MailboxStop.version > after,
+            MailboxStop.version <= upto,
+        )
+        .order_by(MailboxStop.version)
+    )
+
+
+def scan_changes_query(carrier_id, after, upto):
+    """Scans on a carrier's routes with ``after < version <= upto``."""
+    return (
+        db.session.query(*(getattr(PackageScan, c) for c in COLUMNS["scans"]))
+        .filter(
+            PackageScan.route_id.in_(_carrier_routes(carrier_id)),
+            PackageScan.version > after,
+            PackageScan.version <= upto,
+        )
+        .order_by(PackageScan.version)
+    )
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _route_row(route):
+    return [
+        route.id,
+        route.version,
+        _value(route.date),
+        _value(route.created_at),
+        route.to_geojson(),
+    ]
+
+
+def _server_copy(kind, obj):
+    """A row as a ``{column: value}`` dict, for conflict reports."""
+    if kind == "routes":
+        return dict(zip(COLUMNS[kind], _route_row(obj)))
+    return {column: _value(getattr(obj, column)) for column in COLUMNS[kind]}
+
+
+def changes_since(carrier_id, cursor=0, limit=500):
+    """One page of a carrier's changes after version ``cursor``.
+
+    Returns ``{"cursor", "has_more", "routes"?, "stops"?, "scans"?}``. Each
+    non-empty kind is ``{"columns": [...], "rows": [[...], ...]}``. Pass
+    ``cursor`` back until ``has_more`` is false.
+    """
+    upto = current_version()
+    pending = [
+        (route.version, "routes", route)
+        for route in route_changes_query(carrier_id, cursor, upto).limit(limit + 1)
+    ]
+    pending += [(row.version, "stops", row) for row in stop_changes_query(carrier_id, cursor, upto).limit(limit + 1)]
+    pending += [(row.version, "scans", row) for row in scan_changes_query(carrier_id, cursor, upto).limit(limit + 1)]
+    pending.sort(key=lambda item: item[0])
+
+    has_more = len(pending) > limit
+    page = pending[:limit]
+    result = {"cursor": page[-1][0] if has_more else max(cursor, upto), "has_more": has_more}
+    for version, kind, row in page:
+        rows = result.setdefault(kind, {"columns": COLUMNS[kind], "rows": []})["rows"]
+        rows.append(_route_row(row) if kind == "routes" else [_value(v) for v in row])
+    return result
+
+
+# ----------------------------------------------------------------------
+# Push
+# ----------------------------------------------------------------------
+def _float(item, field):
+    value = item.get(field)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise _Rejected(f"Invalid {field}") from None
+
+
+def _flag(item, field):
+    """A JSON boolean; absent or null is false. ``"false"`` or ``0`` are refused, not coerced."""
+    value = item.get(field)
+    if value is None:
+        return False
+    if not isinstance(value, bool):
+        raise _Rejected(f"{field} must be true or false")
+    return value
+
+
+def _text(item, field, length, required=False):
+    value = item.get(field)
+    if value is None or value == "":
+        if required:
+            raise _Rejected(f"Missing {field}")
+        return None
+    value = str(value)
+    if len(value) > length:
+        raise _Rejected(f"{field} longer than {length} characters")
+    return value
+
+
+def _ref(item):
+    """A created item's device reference: a non-empty string of up to 64 characters."""
+    ref = item.get("ref")
+    if ref is None or ref == "":
+        raise _Rejected("Missing ref")
+    if not isinstance(ref, str) or len(ref) > 64:
+        raise _Rejected("ref must be a string of up to 64 characters")
+    return ref
+
+
+def _date(item):
+    try:
+        return date.fromisoformat(item["date"])
+    except (TypeError, ValueError):
+        raise _Rejected("Invalid date") from None
+
+
+def _timestamp(item, default):
+    if not item.get("timestamp"):
+        return default
+    try:
+        timestamp = datetime.fromisoformat(item["timestamp"])
+    except (TypeError, ValueError):
+        raise _Rejected("Invalid timestamp") from None
+    if timestamp.tzinfo is not None:
+        # Stored timestamps are naive UTC, like datetime.utcnow()
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _updates(kind, item):
+    """Validated values of the updatable fields present in ``item``."""
+    values = {}
+    for field in _UPDATABLE[kind]:
+        if field not in item or field == "geojson":
+            continue
+        if field in ("lat", "lng"):
+            values[field] = _float(item, field)
+        elif field in ("too_big", "too_small"):
+            values[field] = _flag(item, field)
+        elif field == "date":
+            values[field] = _date(item)
+        else:
+            values[field] = _text(item, field, 120 if field == "label" else 150)
+    return values
+
+
+def _apply(obj, item, values):
+    """Set validated ``values`` (and any ``geojson``) on ``obj``, all or nothing."""
+    if "geojson" in item:
+        try:
+            obj.set_geometry(item["geojson"])  # raises before changing anything
+        except GeometryError as exc:
+            raise _Rejected(str(exc)) from None
+    for field, value in values.items():
+        setattr(obj, field, value)
+
+
+def _row_id(obj):
+    return obj if isinstance(obj, int) else obj.id
+
+
+def _items(changes, kind):
+    items = changes.get(kind) or []
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise SyncError(f"'{kind}' must be a list of objects")
+    return items
+
+
+def apply_changes(carrier, changes, max_items=1000, on_commit=None, deduper=None):
+    """Apply a device push for ``carrier`` in one transaction.
+
+    ``changes`` is ``{"routes": [...], "stops": [...], "scans": [...]}``.
+    Items with ``id`` are updates and need ``base_version``. Items without
+    one are creations and need a ``ref``. A too-small scan also gets an
+    automatic mailbox stop, as with ``POST /scan``, whether it is created
+    that way or updated to it. ``on_commit(scan_rows,
+    carriers)`` is called with the created scans after commit.
+    ``deduper`` (a :class:`ScanDeduper`, default window if omitted)
+    derives the scans' ``dedupe_key``, from an optional ``key`` field as
+    for ``POST /scan/<id>/batch``, and remembers the new ones.
+
+    Returns ``{"created", "updated", "conflicts", "rejected"}``. Created
+    and updated rows are reported with their new version. Raises
+    :class:`SyncError` if the payload is malformed as a whole.
+    """
+    if not isinstance(changes, dict):
+        raise SyncError("Expected a JSON object")
+    items = {kind: _items(changes, kind) for kind in _MODELS}
+    if sum(map(len, items.values())) > max_items:
+        raise SyncError(f"More than {max_items} changes in one push")
+    deduper = deduper or ScanDeduper()
+
+    # Take SQLite's write lock before reading anything, so no other writer
+    # can commit between a base_version check and the write it guards.
+    db.session.execute(text("UPDATE sync_clock SET version = version WHERE id = 1"))
+
+    # Refs of created items, and of routes that stops and scans name. Only
+    # strings are looked up; other refs are rejected item by item below.
+    item_refs = {
+        item["ref"] for kind_items in items.values() for item in kind_items
+        if "id" not in item and isinstance(item.get("ref"), str)
+    }
+    route_refs = {
+        item["route_id"] for kind in ("stops", "scans") for item in items[kind] if isinstance(item.get("route_id"), str)
+    }
+    found = {
+        r.ref: (r.kind, r.row_id)
+        for r in SyncRef.query.filter(SyncRef.user_id == carrier.id, SyncRef.ref.in_(item_refs | route_refs)).all()
+    } if item_refs or route_refs else {}
+    known = {ref: found[ref] for ref in item_refs if ref in found}
+    owned = {}  # route id -> belongs to the carrier
+
+    def owns(route_id):
+        if route_id not in owned:
+            route = db.session.get(RouteTrace, route_id) if isinstance(route_id, int) else None
+            owned[route_id] = route is not None and route.carrier_id == carrier.id
+        return owned[route_id]
+
+    created, updated, conflicts, rejected, scan_rows = {}, [], [], [], []
+    new_scans = []  # (ref, row, photo), inserted together after the loop
+    received_at = datetime.utcnow()
+
+    def route_id_for(item):
+        route_id = item.get("route_id")
+        if isinstance(route_id, str):  # a route created by this or an earlier push
+            kind, row = created.get(route_id) or found.get(route_id) or (None, None)
+            if kind != "routes":
+                raise _Rejected(f"Unknown route ref {route_id!r}")
+            return row if isinstance(row, int) else row.id
+        if not owns(route_id):
+            raise _Rejected("Unknown route")
+        return route_id
+
+    def create(kind, item):
+        if kind == "routes":
+            route = RouteTrace(carrier_id=carrier.id, date=_date(item) if item.get("date") else date.today())
+            _apply(route, item, {})
+            return route
+        route_id = route_id_for(item)
+        if kind == "stops":
+            return MailboxStop(
+                route_id=route_id,
+                lat=_float(item, "lat"),
+                lng=_float(item, "lng"),
+                label=_text(item, "label", 120),
+                photo=_text(item, "photo", 150),
+            )
+        row = {
+            "route_id": route_id,
+            "barcode": _text(item, "barcode", 120, required=True),
+            "too_big": _flag(item, "too_big"),
+            "too_small": _flag(item, "too_small"),
+            "lat": _float(item, "lat"),
+            "lng": _float(item, "lng"),
+            "timestamp": _timestamp(item, received_at),
+        }
+        try:
+            row["dedupe_key"] = deduper.key(row["barcode"], row["timestamp"], item.get("key"))
+        except ScanKeyError as exc:
+            raise _Rejected(str(exc)) from None
+        return row, _text(item, "photo", 150)
+
+    def insert_scans():
+        """Insert the created scans, skipping those already recorded; returns ref -> scan id."""
+        stmt = (
+            sqlite_insert(PackageScan)
+            .on_conflict_do_nothing(index_elements=["route_id", "dedupe_key"])
+            .returning(PackageScan.id, PackageScan.route_id, PackageScan.dedupe_key)
+        )
+        ids = {(route_id, key): scan_id for scan_id, route_id, key in db.session.execute(
+            stmt, [{**row, "photo": photo} for _, row, photo in new_scans]
+        )}
+        new = set(ids)
+        missing = {(row["route_id"], row["dedupe_key"]) for _, row, _ in new_scans} - new
+        if missing:
+            ids.update(
+                ((route_id, key), scan_id)
+                for scan_id, route_id, key in db.session.query(
+                    PackageScan.id, PackageScan.route_id, PackageScan.dedupe_key
+                ).filter(tuple_(PackageScan.route_id, PackageScan.dedupe_key).in_(missing))
+            )
+        refs = {}
+        for ref, row, _ in new_scans:
+            key = (row["route_id"], row["dedupe_key"])
+            refs[ref] = ids[key]
+            if key not in new:
+                continue
+            new.discard(key)  # a later item with the same key is a duplicate
+            # Same rule as the single-scan view: small packages go to the mailbox
+            if row["too_small"]:
+                db.session.add(MailboxStop(route_id=row["route_id"], lat=row["lat"], lng=row["lng"], label="Auto stop"))
+            scan_rows.append(row)
+        return refs
+
+    def update(kind, item):
+        obj = db.session.get(_MODELS[kind], item["id"]) if isinstance(item["id"], int) else None
+        if obj is None or not owns(obj.id if kind == "routes" else obj.route_id):
+            raise _Rejected("Unknown row")
+        if obj.version != item.get("base_version"):
+            server = _server_copy(kind, obj)
+            conflicts.append({"kind": kind, "id": obj.id, "base_version": item.get("base_version"), "server": server})
+            return
+        values = _updates(kind, item)
+        # A scan marked too small after the fact also goes to the mailbox
+        if kind == "scans" and values.get("too_small") and not obj.too_small:
+            db.session.add(MailboxStop(route_id=obj.route_id, lat=obj.lat, lng=obj.lng, label="Auto stop"))
+        _apply(obj, item, values)
+        updated.append((kind, obj))
+
+    # Routes first so stops and scans can refer to routes created here
+    for kind in ("routes", "stops", "scans"):
+        for index, item in enumerate(items[kind]):
+            try:
+                if "id" in item:
+                    update(kind, item)
+                    continue
+                ref = _ref(item)
+                if ref in known or ref in created:
+                    continue  # already applied, e.g. by a retried push
+                obj = create(kind, item)
+                if kind == "scans":
+                    new_scans.append((ref, *obj))
+                    obj = None  # id assigned by insert_scans()
+                else:
+                    db.session.add(obj)
+                created[ref] = (kind, obj)
+            except _Rejected as exc:
+                rejected.append({"kind": kind, "index": index, "error": str(exc)})
+        db.session.flush()  # assigns ids, e.g. to routes that later items refer to
+    # Scans are inserted by statement, so they are kept as ids
+    created.update((ref, ("scans", scan_id)) for ref, scan_id in (insert_scans() if new_scans else {}).items())
+    db.session.add_all(
+        SyncRef(user_id=carrier.id, ref=ref, kind=kind, row_id=_row_id(obj)) for ref, (kind, obj) in created.items()
+    )
+    db.session.commit()
+    deduper.remember(scan_rows)
+
+    if scan_rows and on_commit is not None:
+        on_commit(scan_rows, {row["route_id"]: carrier.username for row in scan_rows})
+
+    # Versions were set by the triggers; committed objects reload them on access
+    versions = {}
+    for ref, (kind, obj) in [*created.items(), *known.items()]:
+        if isinstance(obj, int):
+            row = db.session.get(_MODELS[kind], obj)
+            versions[ref] = {"kind": kind, "id": obj, "version": row.version if row else None}
+        else:
+            versions[ref] = {"kind": kind, "id": obj.id, "version": obj.version}
+    return {
+        "created": versions,
+        "updated": [{"kind": kind, "id": obj.id, "version": obj.version} for kind, obj in updated],
+        "conflicts": conflicts,
+        "rejected": rejected,
+    }
@@ -0,0 +1,229 @@
+"""Geodesic helpers shared by the spatial queries and route tooling.
+
+Scalar functions take plain floats; the vectorised ones take anything
+``numpy.asarray`` accepts (lists, tuples, arrays) in degrees and return
+NumPy arrays of metres.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8  # mean Earth radius
+METERS_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_M / 180
+
+# Rows per block when building an N×N matrix; bounds the temporaries to
+# a few MATRIX_BLOCK×N arrays however large N gets
+MATRIX_BLOCK = 512
+# Total size of the memoised distance matrices (a 1000-stop matrix is 8 MB)
+MATRIX_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _haversine_rad(phi1, lmb1, cos1, phi2, lmb2, cos2):
+    """Vectorised haversine on pre-converted radians (broadcasts)."""
+    a = np.sin((phi2 - phi1) / 2) ** 2 + cos1 * cos2 * np.sin((lmb2 - lmb1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_many(lat: float, lng: float, lats, lngs):
+    """Distances in metres from one point to each of many points."""
+    phi2 = np.radians(np.asarray(lats, dtype=float))
+    lmb2 = np.radians(np.asarray(lngs, dtype=float))
+    phi1, lmb1 = math.radians(lat), math.radians(lng)
+    return _haversine_rad(phi1, lmb1, math.cos(phi1), phi2, lmb2, np.cos(phi2))
+
+
+def haversine_pairwise(lats1, lngs1, lats2, lngs2):
+    """Element-wise distances between two equally long point arrays."""
+    phi1, lmb1 = np.radians(np.asarray(lats1, dtype=float)), np.radians(np.asarray(lngs1, dtype=float))
+    phi2, lmb2 = np.radians(np.asarray(lats2, dtype=float)), np.radians(np.asarray(lngs2, dtype=float))
+    return _haversine_rad(phi1, lmb1, np.cos(phi1), phi2, lmb2, np.cos(phi2))
+
+
+def distance_matrix(lats, lngs, dtype=np.float64):
+    """Full N×N matrix of great-circle distances in metres.
+
+    Built in blocks of ``MATRIX_BLOCK`` rows; pass ``dtype=np.float32`` to
+    halve the result's memory for very large point sets.
+    """
+    phi = np.radians(np.asarray(lats, dtype=float))
+    lmb = np.radians(np.asarray(lngs, dtype=float))
+    cos = np.cos(phi)
+    n = phi.shape[0]
+    out = np.empty((n, n), dtype=dtype)
+    for start in range(0, n, MATRIX_BLOCK):
+        rows = slice(start, min(start + MATRIX_BLOCK, n))
+        out[rows] = _haversine_rad(
+            phi[rows, None], lmb[rows, None], cos[rows, None], phi[None, :], lmb[None, :], cos[None, :]
+        )
+    return out
+
+
+class _MatrixCache:
+    """Thread-safe LRU of distance matrices keyed by sorted stop set, bounded by total ``nbytes``."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            matrix = self._entries.get(key)
+            if matrix is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return matrix
+
+    def put(self, key, matrix):
+        if matrix.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = matrix
+            self.bytes += matrix.nbytes
+            self._evict()
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_matrix_cache = _MatrixCache(MATRIX_CACHE_BYTES)
+
+
+def cached_distance_matrix(points):
+    """Distance matrix for a route's stops, memoised on the set of stops.
+
+    ``points`` is a sequence of ``(lat, lng)`` pairs; row/column ``i`` is
+    ``points[i]``. Matrices are cached in sorted point order, so the same
+    stops listed in another order hit the cache and get its rows and
+    columns permuted (a copy; cheap next to the haversine work). The
+    returned array is read-only because it may be shared.
+    Statistics are available from :func:`matrix_cache_info`.
+    """
+    points = [(float(lat), float(lng)) for lat, lng in points]
+    order = sorted(range(len(points)), key=points.__getitem__)
+    key = tuple(points[i] for i in order)
+    matrix = _matrix_cache.get(key)
+    if matrix is None:
+        lats, lngs = zip(*key) if key else ((), ())
+        matrix = distance_matrix(lats, lngs)
+        matrix.flags.writeable = False  # shared between callers
+        _matrix_cache.put(key, matrix)
+    if order == list(range(len(order))):
+        return matrix
+    position = np.empty(len(order), dtype=np.intp)
+    position[order] = np.arange(len(order))  # points[i] is row position[i] of the cached matrix
+    permuted = matrix[np.ix_(position, position)]
+    permuted.flags.writeable = False
+    return permuted
+
+
+def set_matrix_cache_bytes(max_bytes):
+    """Change the distance-matrix cache budget, evicting down to it."""
+    _matrix_cache.resize(max_bytes)
+
+
+def matrix_cache_info():
+    """Entry count, bytes and hit/miss/eviction counts of :func:`cached_distance_matrix`."""
+    return _matrix_cache.stats()
+
+
+def clear_matrix_cache():
+    """Drop every memoised distance matrix."""
+    _matrix_cache.clear()
+
+
+def polyline_length_m(lats, lngs) -> float:
+    """Length of a polyline in metres."""
+    lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+    if lats.shape[0] < 2:
+        return 0.0
+    return float(haversine_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).sum())
+
+
+def geojson_length_m(geojson) -> float:
+    """Total length of the line geometries in a GeoJSON FeatureCollection."""
+    total = 0.0
+    for feature in geojson.get("features", []):
+        geometry = feature.get("geometry") or {}
+        kind, coords = geometry.get("type"), geometry.get("coordinates") or []
+        lines = [coords] if kind == "LineString" else coords if kind == "MultiLineString" else []
+        for line in lines:
+            if len(line) > 1:
+                lngs, lats = zip(*((c[0], c[1]) for c in line))
+                total += polyline_length_m(lats, lngs)
+    return total
+
+
+def within_radius(lat: float, lng: float, lats, lngs, radius_m: float):
+    """Boolean mask of points within ``radius_m`` of ``(lat, lng)`` (geo-fencing)."""
+    return haversine_many(lat, lng, lats, lngs) <= radius_m
+
+
+def bounding_box(lat: float, lng: float, radius_m: float):
+    """Lat/lng box ``(min_lat, max_lat, min_lng, max_lng)`` enclosing a circle.
+
+    The box is conservative (it always contains the circle); callers filter
+    candidates by exact distance afterwards. A circle reaching a pole spans
+    every longitude; otherwise the longitudes may run past ±180° (see
+    :func:`bounding_boxes`).
+    """
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    if lat + dlat >= 90.0 or lat - dlat <= -90.0:
+        return max(lat - dlat, -90.0), min(lat + dlat, 90.0), -180.0, 180.0
+    # Widest point of the circle: asin(sin(d) / cos(lat)), d in radians
+    ratio = math.sin(math.radians(dlat)) / math.cos(math.radians(lat))
+    dlng = math.degrees(math.asin(min(1.0, ratio)))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def bounding_boxes(lat: float, lng: float, radius_m: float):
+    """:func:`bounding_box` split at the antimeridian into one or two boxes within ±180°."""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_m)
+    if max_lng - min_lng >= 360.0:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    if min_lng < -180.0:
+        return [(min_lat, max_lat, min_lng + 360.0, 180.0), (min_lat, max_lat, -180.0, max_lng)]
+    if max_lng > 180.0:
+        return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360.0)]
+    return [(min_lat, max_lat, min_lng, max_lng)]
@@ -0,0 +1,292 @@
+"""Compact binary encoding for route geometry.
+
+Routes drawn in Leaflet arrive as GeoJSON ``FeatureCollection`` objects with
+full double-precision coordinates. Stored verbatim they are dominated by
+decimal digits, so ``RouteTrace`` keeps them in this binary form instead:
+
+* a header byte with the format version and a byte with the decimal
+  precision (coordinates are quantised to ``10 ** -precision`` degrees),
+* a varint feature count, then per feature a geometry type code and its
+  coordinate structure (varint lengths, nested for rings/multi-parts),
+* every coordinate as the zig-zag varint *delta* from the previous one,
+  carried across the whole collection, so neighbouring vertices cost a
+  few bytes instead of ~40 characters.
+
+Feature properties are not kept; Leaflet-draw does not produce any.
+"""
+import ast
+import json
+import math
+
+FORMAT_VERSION = 1
+DEFAULT_PRECISION = 5  # ~1.1 m, the Google polyline precision
+
+GEOMETRY_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+}
+GEOMETRY_NAMES = {code: name for name, code in GEOMETRY_TYPES.items()}
+
+# Nesting depth of the coordinate arrays below each geometry type
+_DEPTH = {"Point": 0, "LineString": 1, "MultiPoint": 1, "Polygon": 2, "MultiLineString": 2, "MultiPolygon": 3}
+
+
+class GeometryError(ValueError):
+    """Raised for GeoJSON that cannot be encoded or bytes that cannot be decoded."""
+
+
+# ----------------------------------------------------------------------
+# Varint primitives
+# ----------------------------------------------------------------------
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int):
+    result = shift = 0
+    while True:
+        try:
+            byte = data[pos]
+        except IndexError:
+            raise GeometryError("Truncated geometry") from None
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+# ----------------------------------------------------------------------
+# Encoding
+# ----------------------------------------------------------------------
+def _features(geojson):
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        return [f.get("geometry") for f in geojson.get("features", [])]
+    if kind == "Feature":
+        return [geojson.get("geometry")]
+    if kind in GEOMETRY_TYPES:
+        return [geojson]
+    raise GeometryError(f"Unsupported GeoJSON type {kind!r}")
+
+
+def encode_geojson(geojson, precision: int = DEFAULT_PRECISION) -> bytes:
+    """Encode a GeoJSON mapping into the compact binary format."""
+    if not isinstance(geojson, dict):
+        raise GeometryError("GeoJSON must be an object")
+    geometries = [g for g in _features(geojson) if g]
+    scale = 10 ** precision
+    out = bytearray([FORMAT_VERSION, precision])
+    _write_varint(out, len(geometries))
+    last = [0, 0]
+
+    def write_coords(coords, depth):
+        if depth == 0:
+            for axis in (0, 1):
+                value = round(float(coords[axis]) * scale)
+                _write_varint(out, _zigzag(value - last[axis]))
+                last[axis] = value
+            return
+        _write_varint(out, len(coords))
+        for part in coords:
+            write_coords(part, depth - 1)
+
+    for geometry in geometries:
+        kind = geometry.get("type")
+        if kind not in GEOMETRY_TYPES:
+            raise GeometryError(f"Unsupported geometry type {kind!r}")
+        out.append(GEOMETRY_TYPES[kind])
+        try:
+            write_coords(geometry["coordinates"], _DEPTH[kind])
+        except (KeyError, IndexError, TypeError, ValueError) as exc:
+            raise GeometryError(f"Malformed {kind} coordinates") from exc
+    return bytes(out)
+
+
+# ----------------------------------------------------------------------
+# Decoding
+# ----------------------------------------------------------------------
+def decode_geometry(data: bytes) -> dict:
+    """Decode bytes from :func:`encode_geojson` into a FeatureCollection."""
+    if len(data) < 2 or data[0] != FORMAT_VERSION:
+        raise GeometryError("Unknown geometry format")
+    precision = data[1]
+    scale = 10 ** precision
+    count, pos = _read_varint(data, 2)
+    last = [0, 0]
+
+    def read_coords(depth):
+        nonlocal pos
+        if depth == 0:
+            point = []
+            for axis in (0, 1):
+                delta, pos = _read_varint(data, pos)
+                last[axis] += _unzigzag(delta)
+                point.append(round(last[axis] / scale, precision))
+            return point
+        length, pos = _read_varint(data, pos)
+        return [read_coords(depth - 1) for _ in range(length)]
+
+    features = []
+    for _ in range(count):
+        if pos >= len(data):
+            raise GeometryError("Truncated geometry")
+        kind = GEOMETRY_NAMES.get(data[pos])
+        if kind is None:
+            raise GeometryError(f"Unknown geometry type code {data[pos]}")
+        pos += 1
+        coordinates = read_coords(_DEPTH[kind])
+        features.append({"type": "Feature", "properties": {}, "geometry": {"type": kind, "coordinates": coordinates}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def dumps_geojson(geojson) -> str:
+    """Serialise GeoJSON without whitespace for the wire."""
+    return json.dumps(geojson, separators=(",", ":"))
+
+
+def parse_legacy_geojson(text: str):
+    """Parse the ``geojson`` text of rows saved before the binary format.
+
+    Older rows were stored with ``str(dict)`` (a Python repr, not JSON), so
+    accept both forms without evaluating arbitrary code.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError) as exc:
+        raise GeometryError("Unreadable legacy geometry") from exc
+    if not isinstance(value, dict):
+        raise GeometryError("Legacy geometry is not an object")
+    return value
+
+
+# ----------------------------------------------------------------------
+# Multi-resolution simplification
+# ----------------------------------------------------------------------
+# Zoom levels at which a simplified copy of every route is precomputed.
+# A request for zoom z is served the coarsest level that is still at least
+# as detailed as z, or the full geometry above the last level.
+SIMPLIFICATION_ZOOMS = (6, 9, 12, 15)
+MAX_ZOOM = 22  # deepest zoom a client may ask for (Leaflet's practical limit)
+
+
+def zoom_tolerance(zoom: float, pixels: float = 1.0) -> float:
+    """Degrees covered by ``pixels`` screen pixels at a web-mercator zoom level."""
+    return pixels * 360.0 / (256 * 2 ** zoom)
+
+
+def simplification_level(zoom):
+    """The precomputed level serving ``zoom``, or ``None`` for the full geometry."""
+    if zoom is None:
+        return None
+    return next((level for level in SIMPLIFICATION_ZOOMS if level >= zoom), None)
+
+
+def tolerance_zoom(tolerance: float, pixels: float = 1.0) -> float:
+    """Inverse of :func:`zoom_tolerance`: the zoom at which ``pixels`` span ``tolerance`` degrees."""
+    return math.log2(pixels * 360.0 / (256 * tolerance))
+
+
+def _simplify_line(points, tolerance):
+    """Douglas-Peucker on a list of [lng, lat] pairs (iterative)."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = points[first][0], points[first][1]
+        bx, by = points[last][0], points[last][1]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        worst, worst_sq = None, tolerance_sq
+        for i in range(first + 1, last):
+            px, py = points[i][0], points[i][1]
+            if length_sq:
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+                ex, ey = px - (ax + t * dx), py - (ay + t * dy)
+            else:
+                ex, ey = px - ax, py - ay
+            dist_sq = ex * ex + ey * ey
+            if dist_sq > worst_sq:
+                worst, worst_sq = i, dist_sq
+        if worst is not None:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [p for p, kept in zip(points, keep) if kept]
+
+
+def _simplify_ring(ring, tolerance):
+    simplified = _simplify_line(ring, tolerance)
+    # A closed ring needs at least 4 positions (3 distinct + closing)
+    return simplified if len(simplified) >= 4 else list(ring)
+
+
+def simplify_geojson(geojson, tolerance: float) -> dict:
+    """Return a simplified copy of any GeoJSON as a FeatureCollection; points are kept as-is.
+
+    Features without a geometry are dropped, as by :func:`encode_geojson`.
+    """
+    features = []
+    for geometry in _features(geojson):
+        if not geometry:
+            continue
+        kind, coords = geometry.get("type"), geometry.get("coordinates")
+        if kind == "LineString":
+            coords = _simplify_line(coords, tolerance)
+        elif kind == "MultiLineString":
+            coords = [_simplify_line(line, tolerance) for line in coords]
+        elif kind == "Polygon":
+            coords = [_simplify_ring(ring, tolerance) for ring in coords]
+        elif kind == "MultiPolygon":
+            coords = [[_simplify_ring(ring, tolerance) for ring in polygon] for polygon in coords]
+        features.append({"type": "Feature", "properties": {}, "geometry": {"type": kind, "coordinates": coords}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def count_vertices(geojson) -> int:
+    """Number of positions in any GeoJSON object."""
+
+    def count(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            return 1
+        return sum(count(part) for part in coords)
+
+    return sum(count(geometry.get("coordinates") or []) for geometry in _features(geojson) if geometry)
+
+
+def simplification_levels(geojson, zooms=SIMPLIFICATION_ZOOMS):
+    """Encode a simplified copy of ``geojson`` for each zoom level.
+
+    Returns ``(zoom, encoded_bytes)`` pairs, omitting levels that would not
+    drop any vertices compared to the full geometry.
+    """
+    full = count_vertices(geojson)
+    levels = []
+    for zoom in zooms:
+        simplified = simplify_geojson(geojson, zoom_tolerance(zoom))
+        if count_vertices(simplified) < full:
+            levels.append((zoom, encode_geojson(simplified)))
+    return levels
@@ -0,0 +1,160 @@
+"""In-memory fan-out of committed scans for the supervisor live view.
+
+Every committed scan (and the mailbox stop it may create) is published
+once into a fixed-size ring buffer. Its Server-Sent Events frame is
+serialised at publish time. Each ``/live/scans`` subscriber then walks
+the ring from its own position, so N supervisors cost one DB write and one
+``json.dumps`` per scan instead of N polling queries.
+
+Event ids are ``<epoch>-<sequence>``. The epoch changes whenever the process
+restarts. A client reconnecting with ``Last-Event-ID`` gets every buffered
+event after that id. If the id is from an earlier epoch or has already
+rolled out of the ring, it gets a ``reset`` event and should reload its
+view. Like the user cache, the feed is per process: in a multi-worker
+deployment a subscriber only sees scans committed by its own worker.
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from database.models import db, RouteTrace, User
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class LiveFeed:
+    """Thread-safe ring buffer of SSE frames plus the subscriber loop."""
+
+    def __init__(self, size=10000, heartbeat=15.0):
+        self.heartbeat = heartbeat
+        self.epoch = format(time.time_ns() // 1000, "x")
+        self._events = deque(maxlen=size)  # (seq, route_id, carrier, frame)
+        self._seq = 0
+        self._changed = threading.Condition()
+        self.published = self.subscribers = self.replayed = self.resets = 0
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+    def publish(self, kind, route_id, carrier, data):
+        """Append one event; ``data`` must be JSON-serialisable."""
+        self.publish_many([(kind, route_id, carrier, data)])
+
+    def publish_many(self, events):
+        """Append ``(kind, route_id, carrier, data)`` events and wake subscribers once."""
+        with self._changed:
+            for kind, route_id, carrier, data in events:
+                self._seq += 1
+                payload = json.dumps(dict(data, route_id=route_id, carrier=carrier), default=_json_default)
+                frame = f"id: {self.epoch}-{self._seq}\nevent: {kind}\ndata: {payload}\n\n"
+                self._events.append((self._seq, route_id, carrier, frame))
+                self.published += 1
+            self._changed.notify_all()
+
+    def publish_scan_rows(self, rows, carriers=None):
+        """Publish ``PackageScan`` column dicts and their auto mailbox stops.
+
+        ``carriers`` maps route id → carrier username. Routes missing from it
+        are looked up in one query, which needs an app context.
+        """
+        carriers = dict(carriers or {})
+        missing = {r["route_id"] for r in rows} - carriers.keys()
+        if missing:
+            carriers.update(
+                db.session.query(RouteTrace.id, User.username)
+                .outerjoin(User, RouteTrace.carrier_id == User.id)
+                .filter(RouteTrace.id.in_(missing))
+            )
+        events = []
+        for row in rows:
+            route_id, carrier = row["route_id"], carriers.get(row["route_id"])
+            events.append(("scan", route_id, carrier, {k: v for k, v in row.items() if k not in ("route_id", "dedupe_key")}))
+            # Same rule as scan(): small packages go to the mailbox
+            if row.get("too_small"):
+                events.append(("mailbox", route_id, carrier, {"lat": row["lat"], "lng": row["lng"], "label": "Auto stop"}))
+        self.publish_many(events)
+
+    # ------------------------------------------------------------------
+    # Subscribing
+    # ------------------------------------------------------------------
+    def _start(self, last_event_id):
+        """Sequence to resume after, plus whether the client missed events."""
+        with self._changed:
+            latest = self._seq
+            oldest = self._events[0][0] if self._events else latest + 1
+        if not last_event_id:
+            return latest, False
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > latest:
+            return latest, True
+        if int(seq) < oldest - 1:
+            return latest, True
+        return int(seq), False
+
+    def _after(self, seq):
+        """Buffered events newer than ``seq`` (caller holds the lock)."""
+        if not self._events or seq >= self._seq:
+            return []
+        start = max(0, seq + 1 - self._events[0][0])
+        return [self._events[i] for i in range(start, len(self._events))]
+
+    def stream(self, last_event_id=None, route_id=None, carrier=None):
+        """Generator of SSE frames for one subscriber, starting after ``last_event_id``."""
+        position, missed = self._start(last_event_id)
+        with self._changed:
+            self.subscribers += 1
+            if missed:
+                self.resets += 1
+        try:
+            yield "retry: 3000\n\n"
+            if missed:
+                yield f"id: {self.epoch}-{position}\nevent: reset\ndata: {{}}\n\n"
+            elif last_event_id:
+                with self._changed:
+                    self.replayed += len(self._after(position))
+            while True:
+                with self._changed:
+                    events = self._after(position)
+                    if not events:
+                        self._changed.wait(self.heartbeat)
+                        events = self._after(position)
+                if not events:
+                    # Doubles as a keepalive and moves a filtered client's
+                    # Last-Event-ID past events it skipped
+                    yield f"id: {self.epoch}-{position}\n\n"
+                    continue
+                if events[0][0] != position + 1:
+                    # Fell more than a ring behind while writing to a slow client
+                    position = events[-1][0]
+                    with self._changed:
+                        self.resets += 1
+                    yield f"id: {self.epoch}-{position}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+                position = events[-1][0]
+                frames = [
+                    frame
+                    for _, event_route, event_carrier, frame in events
+                    if (route_id is None or event_route == route_id)
+                    and (carrier is None or event_carrier == carrier)
+                ]
+                if frames:
+                    yield "".join(frames)
+        finally:
+            with self._changed:
+                self.subscribers -= 1
+
+    def stats(self):
+        """Counters for the metrics endpoint."""
+        with self._changed:
+            return {
+                "published": self.published,
+                "buffered": len(self._events),
+                "capacity": self._events.maxlen,
+                "subscribers": self.subscribers,
+                "replayed": self.replayed,
+                "resets": self.resets,
+            }
@@ -0,0 +1,352 @@
+"""Stop ordering for delivery routes.
+
+Takes a route in the ``sample-routes.json`` layout (stops with
+``coordinates``, ``time_window`` and ``estimated_duration``) and returns
+the stops in a good delivery order with ETAs:
+
+1. nearest-neighbour construction that prefers stops whose time window is
+   still reachable,
+2. 2-opt and Or-opt local search restricted to each stop's nearest
+   neighbours, where every candidate move is first screened on travel time
+   alone (O(1)) and only then re-scheduled in full for time windows.
+
+The cost of an order is the finish time of the route plus a heavy
+per-minute penalty for arriving after a stop's window closes, so feasible
+orders always win over infeasible ones.
+
+Several routes are solved in parallel: :class:`OptimizerPool` keeps one
+process pool per app, started on first use, so requests do not pay for
+starting worker processes.
+"""
+import atexit
+import math
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from geo import cached_distance_matrix, set_matrix_cache_bytes
+
+DEFAULT_SPEED_KMH = 30.0
+DEFAULT_START = "08:00"
+DEFAULT_TIME_LIMIT = 2.0  # seconds of local search per route
+LATE_PENALTY = 1000.0  # cost per minute late; dwarfs any travel saving
+NEIGHBOURS = 12  # candidate list size for 2-opt / Or-opt
+OR_OPT_SEGMENTS = (1, 2, 3)
+_EPS = 1e-9
+
+
+class RouteOptimizationError(ValueError):
+    """Raised when a route's stop list or the solver options cannot be parsed."""
+
+
+def _number(value, what):
+    """``value`` as a finite float; :class:`RouteOptimizationError` naming ``what`` otherwise."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise RouteOptimizationError(f"{what} must be a number")
+    try:
+        value = float(value)
+    except ValueError:
+        raise RouteOptimizationError(f"{what} must be a number") from None
+    if not math.isfinite(value):
+        raise RouteOptimizationError(f"{what} must be a finite number")
+    return value
+
+
+def _minutes(clock):
+    """``"08:30"`` or ``"08:30:00"`` → minutes after midnight."""
+    try:
+        parts = [int(p) for p in str(clock).strip().split(":")]
+        return parts[0] * 60 + parts[1] + (parts[2] / 60 if len(parts) > 2 else 0)
+    except (ValueError, IndexError):
+        raise RouteOptimizationError(f"Invalid time {clock!r}") from None
+
+
+def _clock(minutes):
+    """Minutes after midnight → ``"HH:MM"``."""
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class _Problem:
+    """Travel-time matrix, time windows and service times for one route."""
+
+    def __init__(self, points, windows, service, start, speed_kmh):
+        self.n = len(points)
+        self.windows = windows
+        self.service = service
+        self.start = start
+        self.distance = cached_distance_matrix(points)
+        metres_per_minute = speed_kmh * 1000 / 60
+        # Nested lists: the search loops index single cells, which is much
+        # faster on Python floats than on NumPy scalars
+        self.travel = (self.distance / metres_per_minute).tolist()
+        k = min(NEIGHBOURS, self.n - 1)
+        if k > 0:
+            order = np.argpartition(self.distance, k, axis=1)[:, : k + 1]
+            self.neighbours = [
+                [j for j in sorted(row, key=self.travel[i].__getitem__) if j != i][:k] for i, row in enumerate(order)
+            ]
+        else:
+            self.neighbours = [[] for _ in range(self.n)]
+
+    def schedule(self, tour):
+        """Arrival, service start and lateness per stop, plus the tour cost."""
+        t, late_total, rows, prev = self.start, 0.0, [], None
+        for node in tour:
+            if prev is not None:
+                t += self.travel[prev][node]
+            arrival = t
+            opens, closes = self.windows[node]
+            t = max(t, opens)
+            late = max(0.0, t - closes)
+            late_total += late
+            rows.append((node, arrival, t, late))
+            t += self.service[node]
+            prev = node
+        return rows, t + LATE_PENALTY * late_total
+
+    def cost(self, tour):
+        t, late_total, prev = self.start, 0.0, None
+        travel, windows, service = self.travel, self.windows, self.service
+        for node in tour:
+            if prev is not None:
+                t += travel[prev][node]
+            opens, closes = windows[node]
+            if t < opens:
+                t = opens
+            elif t > closes:
+                late_total += t - closes
+            t += service[node]
+            prev = node
+        return t + LATE_PENALTY * late_total
+
+    def edge(self, a, b):
+        # Open path: the route ends at its last stop, so a missing successor is free
+        return 0.0 if a is None or b is None else self.travel[a][b]
+
+
+def _nearest_neighbour(problem):
+    tour, unvisited = [0], set(range(1, problem.n))
+    t = max(problem.start, problem.windows[0][0]) + problem.service[0]
+    while unvisited:
+        here = tour[-1]
+        row = problem.travel[here]
+        best, best_key = None, None
+        for node in unvisited:
+            arrival = t + row[node]
+            opens, closes = problem.windows[node]
+            begin = max(arrival, opens)
+            # Reachable stops first, then soonest service start, then earliest deadline
+            key = (begin > closes, begin, closes)
+            if best_key is None or key < best_key:
+                best, best_key = node, key
+        unvisited.remove(best)
+        tour.append(best)
+        t = max(t + row[best], problem.windows[best][0]) + problem.service[best]
+    return tour
+
+
+def _two_opt(problem, tour, cost, deadline):
+    n, edge = len(tour), problem.edge
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        pos = {node: i for i, node in enumerate(tour)}
+        for i in range(n - 1):
+            a = tour[i]
+            for c in problem.neighbours[a]:
+                j = pos[c]
+                lo, hi = min(i, j), max(i, j)
+                if hi - lo < 2:
+                    continue
+                # Reverse tour[lo+1 .. hi]: edges (p, q), (r, s) become (p, r), (q, s)
+                p, q, r = tour[lo], tour[lo + 1], tour[hi]
+                s = tour[hi + 1] if hi + 1 < n else None
+                delta = edge(p, r) + edge(q, s) - edge(p, q) - edge(r, s)
+                if delta >= -_EPS:
+                    continue
+                candidate = tour[: lo + 1] + tour[hi:lo:-1] + tour[hi + 1:]
+                candidate_cost = problem.cost(candidate)
+                if candidate_cost < cost - _EPS:
+                    tour, cost, improved = candidate, candidate_cost, True
+                    pos = {node: k for k, node in enumerate(tour)}
+                    break  # tour[i] may have changed; move on with a fresh candidate list
+            if time.perf_counter() >= deadline:
+                break
+    return tour, cost
+
+
+def _or_opt(problem, tour, cost, deadline):
+    n, edge = len(tour), problem.edge
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in OR_OPT_SEGMENTS:
+            s = 1  # position 0 is the fixed starting point
+            while s + length <= n:
+                segment = tour[s:s + length]
+                first, last = segment[0], segment[-1]
+                prev, nxt = tour[s - 1], tour[s + length] if s + length < n else None
+                removal = edge(prev, first) + edge(last, nxt) - edge(prev, nxt)
+                rest = tour[:s] + tour[s + length:]
+                rest_pos = {node: k for k, node in enumerate(rest)}
+                moved = False
+                for c in problem.neighbours[first]:
+                    k = rest_pos.get(c)
+                    if k is None or c == prev:
+                        continue
+                    d = rest[k + 1] if k + 1 < len(rest) else None
+                    for x, y, block in ((first, last, segment), (last, first, segment[::-1])):
+                        insertion = edge(c, x) + edge(y, d) - edge(c, d)
+                        if insertion - removal >= -_EPS:
+                            continue
+                        candidate = rest[: k + 1] + block + rest[k + 1:]
+                        candidate_cost = problem.cost(candidate)
+                        if candidate_cost < cost - _EPS:
+                            tour, cost, improved, moved = candidate, candidate_cost, True, True
+                            break
+                    if moved:
+                        break
+                if time.perf_counter() >= deadline:
+                    return tour, cost
+                s += 1
+    return tour, cost
+
+
+def optimize_route(route, speed_kmh=DEFAULT_SPEED_KMH, time_limit=DEFAULT_TIME_LIMIT, depot=None):
+    """Order a route's stops and compute ETAs.
+
+    ``route`` follows ``sample-routes.json``; ``depot`` is an optional
+    ``{"lat", "lng"}`` start location (otherwise the first listed stop is
+    where the carrier starts). Returns a JSON-serialisable dict; raises
+    :class:`RouteOptimizationError` for unusable input.
+    """
+    speed_kmh = _number(speed_kmh, "speed_kmh")
+    if speed_kmh <= 0:
+        raise RouteOptimizationError("speed_kmh must be greater than zero")
+    if depot and not isinstance(depot, dict):
+        raise RouteOptimizationError("depot must be an object with lat and lng")
+    stops = route.get("stops") or []
+    if not isinstance(stops, list) or not all(isinstance(stop, dict) for stop in stops):
+        raise RouteOptimizationError(f"Route {route.get('route_id')!r} stops must be a list of objects")
+    if not stops:
+        return {"route_id": route.get("route_id"), "stops": [], "total_distance_m": 0.0, "finish": None,
+                "late_stops": 0, "late_minutes": 0.0, "solve_seconds": 0.0}
+
+    points, windows, service = [], [], []
+    if depot:
+        points.append((_number(depot.get("lat"), "Depot lat"), _number(depot.get("lng"), "Depot lng")))
+        windows.append((float("-inf"), float("inf")))
+        service.append(0.0)
+    for stop in stops:
+        name = f"Stop {stop.get('stop_id')!r}"
+        coords = stop.get("coordinates")
+        if not isinstance(coords, dict) or "lat" not in coords or "lng" not in coords:
+            raise RouteOptimizationError(f"{name} has no coordinates")
+        points.append((_number(coords["lat"], f"{name} lat"), _number(coords["lng"], f"{name} lng")))
+        window = stop.get("time_window")
+        if window:
+            opens, _, closes = str(window).partition("-")
+            windows.append((_minutes(opens), _minutes(closes)))
+        else:
+            windows.append((float("-inf"), float("inf")))
+        duration = _number(stop.get("estimated_duration") or 0, f"{name} estimated_duration")
+        if duration < 0:
+            raise RouteOptimizationError(f"{name} estimated_duration must not be negative")
+        service.append(duration)
+
+    started = time.perf_counter()
+    problem = _Problem(points, windows, service, _minutes(route.get("start_time") or DEFAULT_START), speed_kmh)
+    tour = _nearest_neighbour(problem)
+    cost = problem.cost(tour)
+    deadline = started + time_limit
+    while time.perf_counter() < deadline:
+        before = cost
+        tour, cost = _two_opt(problem, tour, cost, deadline)
+        tour, cost = _or_opt(problem, tour, cost, deadline)
+        if cost >= before - _EPS:
+            break
+
+    rows, _ = problem.schedule(tour)
+    offset = 1 if depot else 0
+    ordered, distance, late_stops, late_total, prev = [], 0.0, 0, 0.0, None
+    for sequence, (node, arrival, begin, late) in enumerate(r for r in rows if r[0] >= offset):
+        stop = stops[node - offset]
+        if prev is not None:
+            distance += float(problem.distance[prev, node])
+        prev = node
+        late_stops += late > 0
+        late_total += late
+        ordered.append({
+            "sequence": sequence + 1,
+            "stop_id": stop.get("stop_id"),
+            "address": stop.get("address"),
+            "eta": _clock(arrival),
+            "service_start": _clock(begin),
+            "late_minutes": round(late, 1),
+        })
+    return {
+        "route_id": route.get("route_id"),
+        "stops": ordered,
+        "total_distance_m": round(distance, 1),
+        "finish": _clock(rows[-1][2] + problem.service[rows[-1][0]]),
+        "late_stops": late_stops,
+        "late_minutes": round(late_total, 1),
+        "solve_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _optimize_kwargs(args):
+    route, kwargs = args
+    return optimize_route(route, **kwargs)
+
+
+def optimize_routes(routes, workers=None, **kwargs):
+    """Optimise several routes, in parallel on a process pool when there are many.
+
+    ``workers`` caps the pool size (``1`` runs everything in-process).
+    Results are returned in input order.
+    """
+    if workers == 1 or len(routes) < 2:
+        return [optimize_route(route, **kwargs) for route in routes]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_optimize_kwargs, [(route, kwargs) for route in routes]))
+
+
+class OptimizerPool:
+    """A process pool shared by an app's optimisation requests, started on first use."""
+
+    def __init__(self, workers=None, matrix_cache_bytes=None):
+        self.workers = workers
+        if matrix_cache_bytes is not None:
+            # Workers are started later and, where they fork, inherit this
+            set_matrix_cache_bytes(matrix_cache_bytes)
+        self._lock = threading.Lock()  # guards _pool
+        self._pool = None
+        atexit.register(self.close)
+
+    def optimize_routes(self, routes, **kwargs):
+        """:func:`optimize_routes` on the shared pool."""
+        if self.workers == 1 or len(routes) < 2:
+            return [optimize_route(route, **kwargs) for route in routes]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            pool = self._pool
+        try:
+            return list(pool.map(_optimize_kwargs, [(route, kwargs) for route in routes]))
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None  # start a fresh pool on the next request
+            raise
+
+    def close(self):
+        """Stop the pool, dropping queued work."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
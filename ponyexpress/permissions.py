@@ -0,0 +1,249 @@
+"""Role permissions compiled from ``roles-permissions.json``.
+
+The file gives each role a list of permissions and restrictions. A
+permission entry may also name a ``permission_groups`` entry (all of its
+permissions) or be ``all_<role>_permissions`` / ``all_<group>_permissions``
+(everything that role or group has; restrictions are not inherited).
+:class:`PermissionEngine` compiles the file once into a bit per
+permission and an integer bitset per role, so a check is a dict lookup
+and a mask test: no JSON and no database on the request path.
+
+The file is re-read when its modification time changes, checked at most
+every ``reload_interval`` seconds. A file that fails to compile is logged
+and the previous version stays in use; with no usable version at all,
+every check is denied.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+from flask import abort, flash, redirect, url_for
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+_INHERIT = re.compile(r"^all_(\w+)_permissions$")
+
+
+class PermissionsError(ValueError):
+    """The permissions file is missing, malformed, or names something undefined."""
+
+
+class _Compiled:
+    """Bit assignments and role bitsets from one version of the permissions file."""
+
+    def __init__(self, data):
+        if not isinstance(data, dict) or not isinstance(data.get("roles"), dict):
+            raise PermissionsError("Expected an object with a 'roles' mapping")
+        roles = data["roles"]
+        groups = data.get("permission_groups") or {}
+        if not isinstance(groups, dict):
+            raise PermissionsError("'permission_groups' must map group names to permission lists")
+        for name, entry in roles.items():
+            if not isinstance(entry, dict):
+                raise PermissionsError(f"Role {name!r} must be an object")
+        self.groups = {name: tuple(members or ()) for name, members in groups.items()}
+
+        # One bit per concrete permission, in file order
+        self.bits = {}
+        for name in [p for entry in roles.values() for p in entry.get("permissions") or ()] + [
+            p for members in self.groups.values() for p in members
+        ]:
+            if not _INHERIT.match(name) and name not in self.groups:
+                self.bits.setdefault(name, 1 << len(self.bits))
+        self.restriction_bits = {}
+        for entry in roles.values():
+            for name in entry.get("restrictions") or ():
+                self.restriction_bits.setdefault(name, 1 << len(self.restriction_bits))
+
+        self._roles = roles
+        self.masks = {}
+        for name in roles:
+            self._role_mask(name, ())
+        self.restrictions = {
+            name: self._mask(self.restriction_bits, entry.get("restrictions") or ()) for name, entry in roles.items()
+        }
+        del self._roles
+
+    def _role_mask(self, role, visiting):
+        if role in self.masks:
+            return self.masks[role]
+        if role in visiting:
+            raise PermissionsError(f"Roles inherit from each other in a cycle: {' -> '.join(visiting + (role,))}")
+        mask = 0
+        for name in self._roles[role].get("permissions") or ():
+            mask |= self._expand(name, visiting + (role,))
+        self.masks[role] = mask
+        return mask
+
+    def _expand(self, name, visiting):
+        """Bits granted by one permission entry of a role."""
+        if name in self.bits:
+            return self.bits[name]
+        if name in self.groups:
+            return self._mask(self.bits, self.groups[name])
+        inherited = _INHERIT.match(name)
+        if inherited and inherited.group(1) in self._roles:
+            return self._role_mask(inherited.group(1), visiting)
+        if inherited and inherited.group(1) in self.groups:
+            return self._mask(self.bits, self.groups[inherited.group(1)])
+        raise PermissionsError(f"{name!r} names no role or permission group")
+
+    @staticmethod
+    def _mask(bits, names):
+        mask = 0
+        for name in names:
+            mask |= bits[name]
+        return mask
+
+    def requirement(self, names):
+        """Mask of the permissions (or groups) in ``names``; ``None`` if one is undefined."""
+        mask = 0
+        for name in names:
+            if name in self.bits:
+                mask |= self.bits[name]
+            elif name in self.groups:
+                mask |= self._mask(self.bits, self.groups[name])
+            else:
+                return None
+        return mask
+
+
+class PermissionEngine:
+    """Permission checks for the roles in a ``roles-permissions.json`` file, reloaded when it changes."""
+
+    def __init__(self, path, reload_interval=2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._compiled = None
+        self._mtime = None
+        self._checked = None  # monotonic time of the last look at the file
+        self._lock = threading.Lock()  # one reload at a time
+        self.checks = self.denied = self.reloads = self.reload_errors = 0
+        self.compile_ms = 0.0
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def reload(self, force=False):
+        """Recompile the permissions file if it changed; return ``True`` if it was (re)loaded.
+
+        Raises :class:`PermissionsError` if there is no usable version at
+        all; later failures are logged and the last good version is kept.
+        """
+        now = time.monotonic()
+        # Also throttled while nothing has loaded: a missing file is not
+        # looked for on every request
+        if not force and self._checked is not None and now - self._checked < self.reload_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if not force and mtime == self._mtime:
+                    return False
+                started = time.perf_counter()
+                with open(self.path, encoding="utf-8") as fh:
+                    compiled = _Compiled(json.load(fh))
+            except (OSError, ValueError) as exc:
+                self.reload_errors += 1
+                if self._compiled is None:
+                    raise PermissionsError(f"Cannot load {self.path}: {exc}") from exc
+                logger.error("Keeping the previous permissions; reloading %s failed: %s", self.path, exc)
+                return False
+            self._compiled, self._mtime = compiled, mtime
+            self.compile_ms = (time.perf_counter() - started) * 1000
+            self.reloads += 1
+            return True
+
+    def _current(self):
+        """The compiled version in use, or ``None`` if the file has never loaded."""
+        try:
+            self.reload()
+        except PermissionsError as exc:
+            logger.error("Denying permission checks: %s", exc)
+        return self._compiled
+
+    # ------------------------------------------------------------------
+    # Checks
+    # ------------------------------------------------------------------
+    def permissions(self, role):
+        """Sorted permission names of ``role`` (empty for an unknown role)."""
+        compiled = self._current()
+        if compiled is None:
+            return []
+        mask = compiled.masks.get(role, 0)
+        return sorted(name for name, bit in compiled.bits.items() if mask & bit)
+
+    def has(self, role, *names):
+        """``True`` if ``role`` holds every permission (or group) in ``names``."""
+        compiled = self._current()
+        need = compiled.requirement(names) if compiled is not None else None
+        return self._allowed(compiled, role, need)
+
+    def restricted(self, role, restriction):
+        """``True`` if ``role`` lists ``restriction`` (e.g. ``"cannot_edit_routes"``)."""
+        compiled = self._current()
+        if compiled is None:
+            return True
+        bit = compiled.restriction_bits.get(restriction, 0)
+        return bool(compiled.restrictions.get(role, 0) & bit)
+
+    def _allowed(self, compiled, role, need):
+        self.checks += 1
+        if need is None or (compiled.masks.get(role, 0) & need) != need:
+            self.denied += 1
+            return False
+        return True
+
+    def required(self, *names):
+        """Decorator: the current user's role must hold every permission in ``names``.
+
+        Others are redirected to the index with a flash. The names are
+        checked against the file now and resolved to a mask once per loaded
+        version. Without a usable file,
+        or if a reload dropped one of the names, the answer is 503: a
+        redirect could loop back to the same page.
+        """
+        compiled = self._current()
+        if compiled is not None and compiled.requirement(names) is None:
+            raise PermissionsError(f"Undefined permission in {names!r}")
+        resolved = [None, None]  # compiled version, mask
+
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                compiled = self._current()
+                if resolved[0] is not compiled:
+                    resolved[:] = [compiled, compiled.requirement(names) if compiled is not None else None]
+                if resolved[1] is None:
+                    logger.error("Cannot check %r: no permissions file defines them", names)
+                    abort(503)
+                role = current_user.role if current_user.is_authenticated else None
+                if not self._allowed(compiled, role, resolved[1]):
+                    flash("You do not have permission to access this page.", "danger")
+                    return redirect(url_for("index"))
+                return f(*args, **kwargs)
+
+            return decorated_function
+
+        return decorator
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+    def stats(self):
+        compiled = self._compiled
+        return {
+            "roles": len(compiled.masks) if compiled else 0,
+            "permissions": len(compiled.bits) if compiled else 0,
+            "checks": self.checks,
+            "denied": self.denied,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "compile_ms": round(self.compile_ms, 2),
+        }
@@ -0,0 +1,304 @@
+"""Content-addressed photo storage with background thumbnails.
+
+Proof-of-delivery photos are posted as raw request bodies. They are
+streamed to a temporary file in ``PHOTO_CHUNK_BYTES`` pieces and hashed
+on the way, never held in memory whole. The file is then renamed to
+``<sha256>.<ext>`` under ``UPLOAD_FOLDER/photos/<first two hex digits>/``,
+so uploading the same photo again (a retry after a dropped connection,
+or the same image attached to a scan and a mailbox stop) keeps a single
+copy.
+
+Downscaled JPEG variants (``PHOTO_VARIANTS``, e.g. a thumbnail and a
+screen-sized copy) are rendered on a small process pool running at a
+lower CPU priority. Image decoding therefore never holds up the
+request threads that serve scans. At most ``PHOTO_QUEUE_SIZE`` photos
+wait for the pool. A photo that does not fit is rendered when one of its
+variants is first requested, and until its variants exist the original
+is served instead.
+
+Variants need Pillow (``pip install Pillow``). Without it, only originals
+are stored and served.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:  # optional: thumbnails and resized variants
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {"thumb": 320, "medium": 1280}
+
+# Leading bytes of the accepted formats -> (extension, MIME type)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"RIFF", "webp", "image/webp"),  # confirmed by bytes 8-12 below
+)
+MIMETYPES = {ext: mimetype for _, ext, mimetype in _SIGNATURES}
+
+_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png|webp)$")
+
+
+class PhotoError(ValueError):
+    """The upload is empty, too large or not a supported image."""
+
+
+def _sniff(head):
+    for signature, ext, _ in _SIGNATURES:
+        if head.startswith(signature) and (ext != "webp" or head[8:12] == b"WEBP"):
+            return ext
+    return None
+
+
+def _lower_priority():
+    """Pool initializer: let request threads win the CPU."""
+    try:
+        os.nice(10)
+    except OSError:  # pragma: no cover - not permitted on this platform
+        pass
+
+
+def render_variants(source, targets):
+    """Write downscaled JPEG copies of ``source``.
+
+    ``targets`` maps output paths to the longest side in pixels. Runs in
+    a pool worker. The decoder is asked for a reduced-size draft where the
+    format allows, then each variant is cut from the previous larger one.
+    Returns the paths written.
+    """
+    with Image.open(source) as image:
+        largest = max(targets.values())
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        written = []
+        for path, side in sorted(targets.items(), key=lambda item: -item[1]):
+            image.thumbnail((side, side), Image.Resampling.BICUBIC, reducing_gap=2.0)
+            partial = f"{path}.{os.getpid()}.tmp"
+            image.save(partial, "JPEG", quality=82, optimize=True)
+            os.replace(partial, path)
+            written.append(path)
+    return written
+
+
+class PhotoStore:
+    """Photo files on disk plus the pool that renders their variants.
+
+    ``workers=0`` renders variants inline, on the uploading thread.
+    """
+
+    def __init__(
+        self,
+        root,
+        variants=None,
+        workers=1,
+        queue_size=64,
+        max_bytes=20 * 1024 * 1024,
+        chunk_bytes=64 * 1024,
+        fsync=True,
+    ):
+        self.root = root
+        self.variants = dict(DEFAULT_VARIANTS if variants is None else variants)
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()  # guards _pool and _pending
+        self._slots = threading.BoundedSemaphore(max(1, queue_size))
+        self._pool = None
+        self._pending = set()  # digests queued or rendering
+
+        self.stored = self.deduplicated = self.bytes_stored = 0
+        self.rendered = self.dropped = self.failed = 0
+
+        os.makedirs(root, exist_ok=True)
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------------------
+    def path(self, name, variant=None):
+        """Absolute path of a stored photo or one of its variants.
+
+        Raises :class:`PhotoError` for names that are not ``<sha256>.<ext>``
+        or unknown variants.
+        """
+        match = _NAME.match(name or "")
+        if match is None:
+            raise PhotoError(f"Invalid photo name {name!r}")
+        digest = match.group(1)
+        if variant is None:
+            filename = name
+        elif variant in self.variants:
+            filename = f"{digest}-{variant}.jpg"
+        else:
+            raise PhotoError(f"Unknown variant {variant!r}; choose from {', '.join(self.variants)}")
+        return os.path.join(self.root, digest[:2], filename)
+
+    def _missing_variants(self, name):
+        if Image is None or not self.variants:
+            return {}
+        targets = {self.path(name, label): side for label, side in self.variants.items()}
+        return {path: side for path, side in targets.items() if not os.path.exists(path)}
+
+    # ------------------------------------------------------------------
+    # Upload
+    # ------------------------------------------------------------------
+    def save(self, stream):
+        """Store the image read from ``stream``; return ``(name, created)``.
+
+        ``created`` is false when an identical photo was already stored.
+        """
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        fd, partial = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(self.chunk_bytes)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise PhotoError(f"Photo exceeds {self.max_bytes // 2**20} MiB")
+                    if len(head) < 12:
+                        head += chunk[: 12 - len(head)]
+                    digest.update(chunk)
+                    out.write(chunk)
+                if self.fsync:
+                    out.flush()
+                    os.fsync(out.fileno())
+            if size == 0:
+                raise PhotoError("Empty upload")
+            ext = _sniff(head)
+            if ext is None:
+                raise PhotoError("Unsupported image type (expected JPEG, PNG or WebP)")
+
+            name = f"{digest.hexdigest()}.{ext}"
+            final = self.path(name)
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            created = not os.path.exists(final)
+            if created:
+                os.replace(partial, final)  # identical content, so racing uploads are harmless
+            else:
+                os.unlink(partial)
+        except BaseException:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+
+        with self._lock:
+            if created:
+                self.stored += 1
+                self.bytes_stored += size
+            else:
+                self.deduplicated += 1
+        self.schedule(name)
+        return name, created
+
+    # ------------------------------------------------------------------
+    # Variants
+    # ------------------------------------------------------------------
+    def schedule(self, name):
+        """Queue rendering of any missing variants; return ``True`` if queued."""
+        targets = self._missing_variants(name)
+        if not targets:
+            return False
+        source = self.path(name)
+        if self.workers == 0:
+            self._render_inline(source, targets)
+            return False
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1  # rendered on first request instead
+            return False
+        with self._lock:
+            if name in self._pending:
+                self._slots.release()
+                return True
+            self._pending.add(name)
+            try:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority)
+                future = self._pool.submit(render_variants, source, targets)
+            except BaseException:
+                self._pending.discard(name)
+                self._slots.release()
+                raise
+        future.add_done_callback(lambda f: self._rendered(name, f))
+        return True
+
+    def _render_inline(self, source, targets):
+        try:
+            render_variants(source, targets)
+        except Exception:  # noqa: BLE001 - a bad image must not fail the upload
+            logger.exception("Rendering variants of %s failed", source)
+            with self._lock:
+                self.failed += 1
+        else:
+            with self._lock:
+                self.rendered += 1
+
+    def _rendered(self, name, future):
+        self._slots.release()
+        with self._lock:
+            self._pending.discard(name)
+            exc = future.exception()
+            if exc is None:
+                self.rendered += 1
+                return
+            self.failed += 1
+            if isinstance(exc, BrokenProcessPool):
+                self._pool = None  # start a fresh pool on the next upload
+        logger.error("Rendering variants of %s failed: %s", name, exc)
+
+    def locate(self, name, variant=None):
+        """Path to serve for ``name``/``variant`` and whether it is final.
+
+        Falls back to the original (and queues rendering) while a variant
+        does not exist yet. Returns ``(None, False)`` for unknown photos.
+        """
+        original = self.path(name)
+        if not os.path.exists(original):
+            return None, False
+        if variant is None:
+            return original, True
+        path = self.path(name, variant)
+        if os.path.exists(path):
+            return path, True
+        self.schedule(name)
+        return original, False
+
+    # ------------------------------------------------------------------
+    # Lifecycle & metrics
+    # ------------------------------------------------------------------
+    def close(self):
+        """Stop the render pool, dropping queued work."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "bytes_stored": self.bytes_stored,
+                "pending": len(self._pending),
+                "rendered": self.rendered,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "variants": Image is not None,
+            }
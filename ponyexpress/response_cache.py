@@ -0,0 +1,178 @@
+"""Per-process cache of rendered route pages and route geometry.
+
+Substitutes reopen the same route many times per shift, often over poor
+cellular links. Each cached response is keyed by what it shows (e.g.
+``("geometry", route_id, zoom)``) and stamped with the route's version
+stamp (:func:`database.queries.route_version_stamp`). The stamp changes
+whenever the route or one of its mailbox stops is inserted, updated or
+deleted, so a stale entry is never served. It is re-rendered on its next
+lookup instead, and other workers notice the change through the database
+without any signalling.
+
+The strong ETag is derived from the key and the stamp alone, so an
+``If-None-Match`` revalidation is answered with a 304 before anything is
+rendered or even looked up. Bodies are compressed once when they are
+cached, with gzip and, when the ``brotli`` package is installed, brotli.
+They are then served in the best encoding the client accepts
+(``Vary: Accept-Encoding``). Each encoding has its own ETag, as a strong
+validator must.
+
+Entries are evicted least recently used first once their bodies exceed
+``maxbytes`` in total.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+try:  # optional: brotli-compressed bodies
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Bodies smaller than this are only stored uncompressed
+MIN_COMPRESS_BYTES = 512
+
+# Content-Encoding -> ETag suffix, preferred first
+ENCODINGS = (("br", "-br"), ("gzip", "-gz"), ("identity", ""))
+
+
+class ResponseCache:
+    """Thread-safe LRU of key → (stamp, ETag, MIME type, encoded bodies).
+
+    ``salt`` is mixed into every ETag. It should change whenever the code
+    that renders the responses does (templates, geometry format), so
+    clients do not revalidate stale copies across a deploy. With
+    ``maxbytes=0`` nothing is cached or compressed, but ETags still work.
+    """
+
+    def __init__(self, maxbytes=32 * 1024 * 1024, salt="", gzip_level=9, brotli_quality=9):
+        self.maxbytes = maxbytes
+        self.salt = salt
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.not_modified = 0
+        self.stale = self.evictions = 0
+        self.bytes_sent = self.bytes_uncompressed = 0
+
+    def etag(self, key, stamp):
+        """ETag of the uncompressed body for ``key`` at ``stamp``."""
+        return hashlib.sha1(repr((self.salt, key, stamp)).encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Entries
+    # ------------------------------------------------------------------
+    def get(self, key, stamp):
+        """The entry for ``key`` if it was rendered at ``stamp``, else ``None``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                if entry is not None:
+                    self._drop(key)
+                    self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, stamp, body, mimetype):
+        """Compress ``body`` and cache it; return the new entry."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        bodies = {"identity": body}
+        if self.maxbytes > 0 and len(body) >= MIN_COMPRESS_BYTES:
+            bodies["gzip"] = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+            if brotli is not None:
+                bodies["br"] = brotli.compress(body, quality=self.brotli_quality)
+            # Keep an encoding only where it actually saves bytes
+            bodies = {enc: data for enc, data in bodies.items() if enc == "identity" or len(data) < len(body)}
+        entry = (stamp, self.etag(key, stamp), mimetype, bodies)
+        size = sum(map(len, bodies.values()))
+        if size > self.maxbytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.maxbytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key):
+        """Remove ``key``; the caller holds the lock."""
+        self.bytes -= sum(map(len, self._entries.pop(key)[3].values()))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    # ------------------------------------------------------------------
+    # Responses
+    # ------------------------------------------------------------------
+    def respond(self, key, stamp, render, mimetype):
+        """Response for ``key`` at ``stamp`` in the current request.
+
+        ``render()`` returns the body (``str`` or ``bytes``) and is only
+        called on a cache miss. Answers a matching ``If-None-Match`` with a
+        304 without looking at the cache at all.
+        """
+        etag = self.etag(key, stamp)
+        for _, suffix in ENCODINGS:
+            if request.if_none_match.contains(etag + suffix):
+                with self._lock:
+                    self.not_modified += 1
+                response = Response(status=304)
+                response.set_etag(etag + suffix)
+                return self._headers(response)
+
+        entry = self.get(key, stamp)
+        if entry is None:
+            entry = self.put(key, stamp, render(), mimetype)
+        _, etag, mimetype, bodies = entry
+        for encoding, suffix in ENCODINGS:
+            if encoding in bodies and (encoding == "identity" or request.accept_encodings[encoding]):
+                break
+        body = bodies[encoding]
+        with self._lock:
+            self.bytes_sent += len(body)
+            self.bytes_uncompressed += len(bodies["identity"])
+        response = Response(body, mimetype=mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag + suffix)
+        return self._headers(response)
+
+    @staticmethod
+    def _headers(response):
+        # Always revalidate; unchanged responses cost a bodyless 304
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.not_modified
+            return {
+                "size": len(self._entries),
+                "bytes": self.bytes,
+                "maxbytes": self.maxbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                # share of requests answered without rendering
+                "hit_ratio": (self.hits + self.not_modified) / requests if requests else 0.0,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "bytes_sent": self.bytes_sent,
+                "compression_ratio": self.bytes_sent / self.bytes_uncompressed if self.bytes_uncompressed else 1.0,
+                "brotli": brotli is not None,
+            }
@@ -0,0 +1,298 @@
+"""Write-behind buffer that group-commits scan inserts.
+
+With ``SCAN_WRITE_BEHIND`` enabled, ``scan()`` hands each scan to
+:class:`ScanWriteBuffer` and answers as soon as it is recorded. A
+background thread then inserts everything received in the last
+``SCAN_WRITE_BEHIND_FLUSH_MS`` (or as soon as ``SCAN_WRITE_BEHIND_FLUSH_ROWS``
+are waiting) in a single transaction.
+
+Durability comes from an append-only log split into segments, one per
+flush. A segment is sealed when the flusher takes its rows, and deleted
+after they are committed. The segment name is committed with its rows
+(``WriteBehindCheckpoint``), so on restart a leftover segment is either
+known-committed (deleted) or replayed, never applied twice. Without a log
+directory the buffer is memory-only and a crash loses what has not been
+flushed yet.
+
+Rows are inserted through a :class:`scan_dedupe.ScanDeduper`, so a scan
+already in the database (or twice in one batch) is skipped. Their keys are
+remembered only once committed: a row that is later rejected must not turn
+the client's retry into a "duplicate". ``on_commit``
+is called with the rows each committed batch actually inserted (inside an
+app context), e.g. to publish them to the live feed.
+
+A batch that fails with ``OperationalError`` (typically "database is
+locked") is retried as a whole on the next flush, as is anything else a
+flush raises (a failed checkpoint insert or segment removal): the flusher
+thread logs it, counts it in ``failures`` and carries on. Any other failure means
+some row can never be stored, so the batch is retried row by row and the
+rows that still fail are set aside in ``rejected.jsonl`` in the log
+directory (or only logged without one), so the scans behind them are not
+held up. Rows of a batch split like this that were committed before a
+crash are skipped on replay by their ``dedupe_key``.
+
+A log directory must belong to a single process: another process would
+replay segments this one is still appending to. The buffer takes an
+exclusive lock on ``write-behind.lock`` in the directory and raises
+:class:`LogDirLocked` if another process (or buffer) holds it, so only one
+of several workers sharing a directory gets write-behind.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import OperationalError
+
+from database.models import db, WriteBehindCheckpoint
+from scan_dedupe import ScanDeduper
+
+
+REJECTED_LOG = "rejected.jsonl"
+LOCK_FILE = "write-behind.lock"
+
+
+class LogDirLocked(RuntimeError):
+    """The log directory is owned by another process, or cannot be locked here."""
+
+
+def _encode(row):
+    return json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()})
+
+
+class ScanWriteBuffer:
+    """Queue of pending scan rows plus the thread that group-commits them."""
+
+    def __init__(
+        self, app, log_dir=None, flush_interval=0.05, flush_rows=500, fsync=True, on_commit=None, deduper=None
+    ):
+        self.app = app
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self.deduper = deduper if deduper is not None else ScanDeduper()
+
+        self._lock = threading.Lock()  # guards _pending and _segment
+        self._flush_lock = threading.Lock()  # one flusher at a time
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._pending = []
+        self._segment = None  # (name, file) receiving appends
+        self._sealed = []  # [(name or None, rows)] awaiting commit, oldest first
+        self._pruned = []  # committed segments whose files are gone
+        self._sequence = 0
+        self._thread = None
+
+        self.submitted = self.flushed = self.flushes = self.failures = self.recovered = self.rejected = 0
+        self.last_flush_ms = 0.0
+
+        self._lock_file = None
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            self._lock_file = self._lock_log_dir()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def _lock_log_dir(self):
+        """Hold an exclusive lock on the log directory for the life of the process."""
+        if fcntl is None:
+            raise LogDirLocked(f"Cannot lock {self.log_dir} on this platform")
+        fh = open(os.path.join(self.log_dir, LOCK_FILE), "a")
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            raise LogDirLocked(f"{self.log_dir} is in use by another process") from None
+        return fh
+
+    def start(self):
+        """Recover leftover log segments, then start the flusher thread."""
+        if self._thread is not None:
+            return
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="scan-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop the flusher and drain everything still buffered."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # noqa: BLE001 - the flusher must outlive any one failure
+                self.failures += 1
+                self.app.logger.exception("Write-behind flusher failed; will retry")
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def submit(self, row):
+        """Record one scan row (``PackageScan`` column values) for the next group commit."""
+        if self._thread is None:
+            self.start()
+        line = _encode(row)
+        with self._lock:
+            if self.log_dir:
+                if self._segment is None:
+                    self._segment = self._open_segment()
+                fh = self._segment[1]
+                fh.write(line + "\n")
+                fh.flush()
+                if self.fsync:
+                    os.fsync(fh.fileno())
+            self._pending.append(row)
+            self.submitted += 1
+            waiting = len(self._pending)
+        if waiting >= self.flush_rows:
+            self._wakeup.set()
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = f"{time.time_ns():020d}-{self._sequence:06d}.log"
+        return name, open(os.path.join(self.log_dir, name), "a", encoding="utf-8")
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+    def flush(self):
+        """Commit every sealed and pending row; batches the database was too busy for are retried next time."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                segment, self._segment = self._segment, None
+            if segment is not None:
+                segment[1].close()
+                self._sealed.append((segment[0], rows))
+            elif rows:
+                self._sealed.append((None, rows))
+
+            while self._sealed:
+                name, rows = self._sealed[0]
+                try:
+                    try:
+                        self._commit(name, rows)
+                    except OperationalError:
+                        raise
+                    except Exception:  # a row that can never be stored
+                        self.failures += 1
+                        self.app.logger.exception("Write-behind batch failed; retrying its rows one by one")
+                        self._commit_each(name, rows)
+                except OperationalError:  # keep the rows; the DB is busy
+                    self.failures += 1
+                    self.app.logger.exception("Write-behind flush failed; will retry")
+                    return
+                self._sealed.pop(0)
+                if name is not None:
+                    os.remove(os.path.join(self.log_dir, name))
+                    self._pruned.append(name)
+
+            if self._pruned:
+                try:
+                    self._commit(None, [])  # just drop stale checkpoints
+                except Exception:
+                    self.app.logger.exception("Pruning write-behind checkpoints failed; will retry")
+
+    def _commit(self, name, rows):
+        started = time.perf_counter()
+        with self.app.app_context():
+            inserted = self.deduper.insert(rows) if rows else []
+            if name is not None:
+                db.session.execute(insert(WriteBehindCheckpoint), [{"segment": name}])
+            pruned = self._pruned
+            if pruned:
+                db.session.execute(delete(WriteBehindCheckpoint).where(WriteBehindCheckpoint.segment.in_(pruned)))
+            db.session.commit()
+            if rows:
+                self.deduper.remember(rows)
+            if inserted and self.on_commit is not None:
+                try:
+                    self.on_commit(inserted)
+                except Exception:  # rows are committed; never retry them for this
+                    self.app.logger.exception("Write-behind on_commit callback failed")
+        self._pruned = self._pruned[len(pruned):]
+        if rows:
+            self.flushes += 1
+            self.flushed += len(rows)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def _commit_each(self, name, rows):
+        """Commit ``rows`` one at a time, setting aside those that fail, then checkpoint ``name``."""
+        for row in rows:
+            try:
+                self._commit(None, [row])
+            except OperationalError:
+                raise
+            except Exception:
+                self.rejected += 1
+                self.app.logger.exception("Write-behind scan rejected: %s", _encode(row))
+                if self.log_dir:
+                    with open(os.path.join(self.log_dir, REJECTED_LOG), "a", encoding="utf-8") as fh:
+                        fh.write(_encode(row) + "\n")
+        self._commit(name, [])
+
+    # ------------------------------------------------------------------
+    # Crash recovery
+    # ------------------------------------------------------------------
+    def _recover(self):
+        if not self.log_dir:
+            return
+        names = sorted(n for n in os.listdir(self.log_dir) if n.endswith(".log"))
+        if not names:
+            return
+        with self.app.app_context():
+            committed = {
+                c.segment for c in WriteBehindCheckpoint.query.filter(WriteBehindCheckpoint.segment.in_(names))
+            }
+        for name in names:
+            path = os.path.join(self.log_dir, name)
+            if name in committed:
+                os.remove(path)
+                self._pruned.append(name)
+                continue
+            rows = []
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        break  # torn final write from the crash
+                    if row.get("timestamp"):
+                        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                    rows.append(row)
+            self._sealed.append((name, rows))
+            self.recovered += len(rows)
+        self.flush()
+
+    def stats(self):
+        """Counters for the metrics endpoint."""
+        return {
+            "submitted": self.submitted,
+            "flushed": self.flushed,
+            "pending": len(self._pending) + sum(len(rows) for _, rows in self._sealed),
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "recovered": self.recovered,
+            "rejected": self.rejected,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
@@ -0,0 +1,150 @@
+"""Idempotent scan ingestion.
+
+Quagga reports the same label several times while it stays in view, and
+devices resend scans they are not sure were saved. Every scan therefore
+carries a ``dedupe_key``, unique per route (``ix_package_scan_route_id_dedupe_key``):
+
+- the client's idempotency key (a ``key`` field or ``Idempotency-Key``
+  header), when it sends one;
+- otherwise the barcode and the ``SCAN_DEDUPE_WINDOW``-second bucket of the
+  scan time, so repeats of a label within the same bucket collapse into
+  one scan.
+
+The unique index is the source of truth: rows are inserted with
+``ON CONFLICT DO NOTHING`` and a duplicate creates neither a scan nor an
+"Auto stop". In front of it, :class:`ScanDeduper` keeps the keys committed
+on each recently active route (an LRU of routes, each an LRU of keys), so
+most duplicates are answered without touching the database. The set is
+exact, so a key it has not seen always goes on to the database. It is per
+process; other workers' duplicates are caught by the index.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.models import db, MailboxStop, PackageScan
+
+MAX_CLIENT_KEY = 64
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ScanKeyError(ValueError):
+    """A client idempotency key that is not a short string."""
+
+
+class ScanDeduper:
+    """Recently committed scan keys per route, plus the deduplicating insert."""
+
+    def __init__(self, window=60, routes=1024, keys_per_route=4096):
+        self.window = window
+        self.routes = routes
+        self.keys_per_route = keys_per_route
+        self._routes = OrderedDict()  # route id -> OrderedDict of keys
+        self._lock = threading.Lock()
+        self.accepted = self.duplicates = self.duplicates_db = 0
+
+    def key(self, barcode, timestamp, client_key=None):
+        """``dedupe_key`` for a scan of ``barcode`` at ``timestamp`` (naive UTC)."""
+        if client_key is not None:
+            if not isinstance(client_key, str) or not 0 < len(client_key) <= MAX_CLIENT_KEY:
+                raise ScanKeyError(f"Scan key must be a string of 1 to {MAX_CLIENT_KEY} characters")
+            return f"k:{client_key}"
+        bucket = int((timestamp - _EPOCH).total_seconds() // self.window)
+        return f"b:{barcode}:{bucket}"
+
+    # ------------------------------------------------------------------
+    # In-memory front
+    # ------------------------------------------------------------------
+    def seen(self, route_id, key):
+        """``True`` if ``key`` is known to be committed on ``route_id``."""
+        with self._lock:
+            keys = self._routes.get(route_id)
+            if keys is None or key not in keys:
+                return False
+            keys.move_to_end(key)
+            self._routes.move_to_end(route_id)
+            self.duplicates += 1
+            return True
+
+    def remember(self, rows):
+        """Record the keys of scan rows that are committed (or durably queued)."""
+        if self.routes <= 0 or self.keys_per_route <= 0:
+            return
+        with self._lock:
+            for row in rows:
+                if row.get("dedupe_key") is None:
+                    continue
+                keys = self._routes.get(row["route_id"])
+                if keys is None:
+                    keys = self._routes[row["route_id"]] = OrderedDict()
+                    while len(self._routes) > self.routes:
+                        self._routes.popitem(last=False)
+                else:
+                    self._routes.move_to_end(row["route_id"])
+                keys[row["dedupe_key"]] = None
+                keys.move_to_end(row["dedupe_key"])
+                while len(keys) > self.keys_per_route:
+                    keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    # ------------------------------------------------------------------
+    # Database
+    # ------------------------------------------------------------------
+    def insert(self, rows):
+        """Insert scan rows, skipping duplicates, and auto stops for the new small packages.
+
+        Returns the rows actually inserted, in order. The caller commits
+        and then passes ``rows`` to :meth:`remember`.
+        """
+        unique, keys = [], set()
+        for row in rows:
+            key = (row["route_id"], row.get("dedupe_key"))
+            if key[1] is not None:
+                if key in keys:
+                    continue
+                keys.add(key)
+            unique.append({**row, "dedupe_key": key[1]})
+        inserted = []
+        if unique:
+            stmt = (
+                sqlite_insert(PackageScan)
+                .on_conflict_do_nothing(index_elements=["route_id", "dedupe_key"])
+                .returning(PackageScan.route_id, PackageScan.dedupe_key)
+            )
+            new = set(map(tuple, db.session.execute(stmt, unique)))
+            inserted = [row for row in unique if row["dedupe_key"] is None or (row["route_id"], row["dedupe_key"]) in new]
+            # Small packages go to the mailbox
+            mailboxes = [
+                {"route_id": r["route_id"], "lat": r["lat"], "lng": r["lng"], "label": "Auto stop"}
+                for r in inserted
+                if r.get("too_small")
+            ]
+            if mailboxes:
+                db.session.execute(insert(MailboxStop), mailboxes)
+        with self._lock:
+            self.accepted += len(inserted)
+            self.duplicates += len(rows) - len(unique)
+            self.duplicates_db += len(unique) - len(inserted)
+        return inserted
+
+    def stats(self):
+        with self._lock:
+            duplicates = self.duplicates + self.duplicates_db
+            received = self.accepted + duplicates
+            return {
+                "accepted": self.accepted,
+                "duplicates": duplicates,
+                # caught in memory vs by the unique index
+                "duplicates_memory": self.duplicates,
+                "duplicates_db": self.duplicates_db,
+                "duplicate_ratio": duplicates / received if received else 0.0,
+                "routes": len(self._routes),
+                "keys": sum(map(len, self._routes.values())),
+            }
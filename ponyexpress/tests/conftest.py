@@ -0,0 +1,72 @@
+"""Shared fixtures: an app on a fresh SQLite file, seeded users and logged-in clients.
+
+Run from the ``ponyexpress/`` directory::
+
+    python -m pytest
+"""
+from datetime import date
+
+import pytest
+
+from app import create_app
+from database.models import db, User, RouteTrace
+from database.rollups import create_rollups
+from database.spatial import create_spatial_index
+from database.sync import create_sync
+
+PASSWORD = "secret"
+USERS = (("carrier", "carrier"), ("other", "carrier"), ("supervisor", "supervisor"), ("admin", "admin"))
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+        "SCAN_WRITE_BEHIND_LOG_DIR": str(tmp_path / "scan-log"),
+    })
+    with app.app_context():
+        db.create_all()
+        create_spatial_index()
+        create_rollups()
+        create_sync()
+        for username, role in USERS:
+            user = User(username=username, role=role)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+    yield app
+    app.extensions["photo_store"].close()
+    app.extensions["optimizer_pool"].close()
+
+
+@pytest.fixture
+def users(app):
+    """Seeded user ids by username."""
+    with app.app_context():
+        return {user.username: user.id for user in User.query}
+
+
+@pytest.fixture
+def route(app, users):
+    """Id of a route belonging to ``carrier``."""
+    with app.app_context():
+        route = RouteTrace(carrier_id=users["carrier"], date=date(2025, 6, 1))
+        db.session.add(route)
+        db.session.commit()
+        return route.id
+
+
+@pytest.fixture
+def login(app):
+    """``login(username)`` returns a test client logged in as that user."""
+
+    def login(username):
+        client = app.test_client()
+        response = client.post("/login", data={"username": username, "password": PASSWORD})
+        assert response.status_code == 302
+        client.get("/")  # the login flash
+        return client
+
+    return login
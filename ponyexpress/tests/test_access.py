@@ -0,0 +1,48 @@
+import io
+
+import pytest
+from PIL import Image
+
+from database.models import db, PackageScan
+
+
+@pytest.fixture
+def scan(app, route):
+    """Id of a scan on ``carrier``'s route."""
+    with app.app_context():
+        scan = PackageScan(route_id=route, barcode="B1")
+        db.session.add(scan)
+        db.session.commit()
+        return scan.id
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_no_view_is_guarded_by_role(app):
+    # Every page is guarded by permissions_required (or only login_required)
+    import app as module
+
+    assert "roles_required" not in open(module.__file__, encoding="utf-8").read()
+
+
+@pytest.mark.parametrize("username, allowed", [
+    ("carrier", True), ("supervisor", True), ("admin", True), ("other", False),
+])
+def test_photos_attach_to_own_routes_or_with_edit_routes(login, scan, username, allowed):
+    client = login(username)
+    response = client.post(f"/photos?scan={scan}", data=png(), content_type="image/png")
+    assert response.status_code == (201 if allowed else 403)
+
+
+@pytest.mark.parametrize("username", ["carrier", "supervisor", "admin"])
+def test_route_pages_need_navigate_routes(login, route, username):
+    assert login(username).get(f"/route/{route}/geometry").status_code == 200
+
+
+@pytest.mark.parametrize("username, status", [("carrier", 200), ("admin", 200), ("supervisor", 302)])
+def test_sync_needs_offline_maps(login, username, status):
+    assert login(username).get("/sync").status_code == status
@@ -0,0 +1,77 @@
+import pytest
+
+from geometry import (
+    GeometryError,
+    decode_geometry,
+    encode_geojson,
+    parse_legacy_geojson,
+    simplification_level,
+    simplification_levels,
+)
+
+LINE = [[-74.0 + i * 0.0001, 40.7 + (i % 7) * 0.00001] for i in range(200)]
+COLLECTION = {
+    "type": "FeatureCollection",
+    "features": [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": LINE}},
+        {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [-74.00123, 40.70456]}},
+        {"type": "Feature", "properties": {}, "geometry": {
+            "type": "Polygon", "coordinates": [[[-74, 40], [-73.9, 40], [-73.9, 40.1], [-74, 40]]],
+        }},
+    ],
+}
+
+
+def test_encode_decode_round_trip():
+    decoded = decode_geometry(encode_geojson(COLLECTION))
+    assert [f["geometry"]["type"] for f in decoded["features"]] == ["LineString", "Point", "Polygon"]
+    for original, copy in zip(COLLECTION["features"], decoded["features"]):
+        flat = lambda c: [c] if isinstance(c[0], (int, float)) else [p for part in c for p in flat(part)]  # noqa: E731
+        for a, b in zip(flat(original["geometry"]["coordinates"]), flat(copy["geometry"]["coordinates"])):
+            assert a == pytest.approx(b, abs=1e-5)
+
+
+def test_round_trip_is_stable():
+    once = encode_geojson(COLLECTION)
+    assert encode_geojson(decode_geometry(once)) == once
+
+
+def test_bare_geometry_is_encoded():
+    decoded = decode_geometry(encode_geojson({"type": "LineString", "coordinates": LINE[:3]}))
+    assert decoded["features"][0]["geometry"]["coordinates"][2] == pytest.approx(LINE[2], abs=1e-5)
+
+
+@pytest.mark.parametrize("data", [b"", b"\xff\x05", encode_geojson(COLLECTION)[:-3]])
+def test_bad_bytes_raise_geometry_error(data):
+    with pytest.raises(GeometryError):
+        decode_geometry(data)
+
+
+def test_legacy_repr_is_parsed_without_eval():
+    assert parse_legacy_geojson(repr({"type": "Point", "coordinates": [1, 2]}))["type"] == "Point"
+    with pytest.raises(GeometryError):
+        parse_legacy_geojson("__import__('os')")
+    with pytest.raises(GeometryError):
+        parse_legacy_geojson("None")
+
+
+def test_levels_drop_vertices():
+    levels = simplification_levels(COLLECTION)
+    assert levels and all(len(data) < len(encode_geojson(COLLECTION)) for _, data in levels)
+
+
+@pytest.mark.parametrize("geojson", [
+    {"type": "LineString", "coordinates": LINE},
+    {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": LINE}},
+    {"type": "FeatureCollection", "features": [*COLLECTION["features"], {"type": "Feature", "geometry": None}]},
+])
+def test_levels_accept_any_geojson_and_skip_null_geometries(geojson):
+    levels = simplification_levels(geojson)
+    assert levels
+    for _, data in levels:
+        assert all(f["geometry"]["type"] for f in decode_geometry(data)["features"])
+
+
+@pytest.mark.parametrize("zoom, level", [(None, None), (-3, 6), (6, 6), (6.5, 9), (15, 15), (15.1, None), (22, None)])
+def test_simplification_level(zoom, level):
+    assert simplification_level(zoom) == level
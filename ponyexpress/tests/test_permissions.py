@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from permissions import PermissionEngine, PermissionsError
+
+ROLES = {
+    "permission_groups": {"mapping": ["navigate_routes", "access_offline_maps"]},
+    "roles": {
+        "carrier": {"permissions": ["scan_packages", "take_photos", "mapping"], "restrictions": ["cannot_edit_routes"]},
+        "supervisor": {"permissions": ["scan_packages", "edit_routes"], "restrictions": []},
+        "admin": {"permissions": ["all_carrier_permissions", "all_supervisor_permissions", "manage_users"]},
+    },
+}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "roles.json"
+    path.write_text(json.dumps(ROLES))
+    engine = PermissionEngine(str(path), reload_interval=0)
+    engine.reload()
+    return engine
+
+
+def test_roles_hold_their_permissions_and_groups(engine):
+    assert engine.has("carrier", "take_photos", "navigate_routes")
+    assert engine.has("carrier", "mapping")
+    assert not engine.has("carrier", "edit_routes")
+    assert engine.has("supervisor", "edit_routes")
+
+
+def test_inheritance_grants_permissions_but_not_restrictions(engine):
+    assert engine.permissions("admin") == sorted(
+        {"scan_packages", "take_photos", "navigate_routes", "access_offline_maps", "edit_routes", "manage_users"}
+    )
+    assert engine.restricted("carrier", "cannot_edit_routes")
+    assert not engine.restricted("admin", "cannot_edit_routes")
+
+
+def test_unknown_roles_and_permissions_are_denied(engine):
+    assert not engine.has("nobody", "scan_packages")
+    assert not engine.has("admin", "launch_rockets")
+    assert engine.stats()["denied"] == 2
+
+
+def test_broken_reload_keeps_the_previous_version(engine):
+    with open(engine.path, "w", encoding="utf-8") as fh:
+        fh.write("{not json")
+    os.utime(engine.path, ns=(0, 10**9))  # a visible mtime change
+    assert engine.reload() is False
+    assert engine.has("carrier", "take_photos")
+    assert engine.stats()["reload_errors"] >= 1
+
+
+def test_reload_picks_up_changes(engine):
+    changed = json.loads(json.dumps(ROLES))
+    changed["roles"]["carrier"]["permissions"].append("edit_routes")
+    with open(engine.path, "w", encoding="utf-8") as fh:
+        json.dump(changed, fh)
+    os.utime(engine.path, ns=(0, 10**9))
+    assert engine.reload() is True
+    assert engine.has("carrier", "edit_routes")
+
+
+@pytest.mark.parametrize("roles", [
+    {"a": {"permissions": ["all_b_permissions"]}, "b": {"permissions": ["all_a_permissions"]}},
+    {"a": {"permissions": ["all_nothing_permissions"]}},
+])
+def test_invalid_files_are_refused(tmp_path, roles):
+    path = tmp_path / "roles.json"
+    path.write_text(json.dumps({"roles": roles}))
+    with pytest.raises(PermissionsError):
+        PermissionEngine(str(path)).reload()
+
+
+def test_repository_file_compiles():
+    engine = PermissionEngine(os.path.join(os.path.dirname(__file__), "..", "..", "roles-permissions.json"))
+    engine.reload()
+    assert engine.has("admin", "take_photos", "access_live_tracking", "manage_users")
+    assert engine.has("supervisor", "take_photos", "capture_signatures", "edit_routes")
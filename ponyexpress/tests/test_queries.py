@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+import pytest
+
+from database.models import db, RouteTrace
+from database.queries import decode_cursor, encode_cursor, route_page, route_rollup_page, user_page
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(date(2025, 6, 1), 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ["2025-06-01", 42]
+
+
+def test_bad_cursor_decodes_to_none():
+    assert decode_cursor(None) is None
+    assert decode_cursor("not base64!") is None
+    assert decode_cursor("eyJhIjoxfQ") is None  # {"a":1}: not a list
+
+
+def test_route_pages_cover_every_route_once(app, users):
+    with app.app_context():
+        # Several routes share each date, so ties are broken by id
+        db.session.add_all(
+            RouteTrace(carrier_id=users["carrier"], date=date(2025, 6, 1) + timedelta(days=n // 3)) for n in range(25)
+        )
+        db.session.commit()
+        seen, cursor = [], None
+        while True:
+            items, cursor = route_page(cursor=cursor, limit=4)
+            seen += [item["id"] for item in items]
+            if cursor is None:
+                break
+        expected = [r.id for r in RouteTrace.query.order_by(RouteTrace.date.desc(), RouteTrace.id.desc())]
+    assert seen == expected
+
+
+@pytest.mark.parametrize("page", [route_page, route_rollup_page])
+@pytest.mark.parametrize("limit", [1, 3, 50])
+def test_undated_routes_come_last_and_once(app, users, page, limit):
+    with app.app_context():
+        routes = [RouteTrace(carrier_id=users["carrier"], date=date(2025, 6, 1) + timedelta(days=n)) for n in range(4)]
+        routes += [RouteTrace(carrier_id=users["carrier"], date=None) for _ in range(4)]
+        db.session.add_all(routes)
+        db.session.commit()
+        for route in routes[4:]:
+            route.date = None  # the column default would date them
+        db.session.commit()
+        seen, cursor = [], None
+        while True:
+            items, cursor = page(cursor=cursor, limit=limit, carrier="carrier")
+            seen += [(item["id"], item["date"]) for item in items]
+            if cursor is None:
+                break
+        expected = [r.id for r in [*reversed(routes[:4]), *reversed(routes[4:])]]
+    assert [id for id, _ in seen] == expected
+    assert [d for _, d in seen[4:]] == [None] * 4
+
+
+def test_user_pages_cover_every_user_once(app, users):
+    with app.app_context():
+        seen, cursor = [], None
+        while True:
+            items, cursor = user_page(cursor=cursor, limit=3)
+            seen += [item["id"] for item in items]
+            if cursor is None:
+                break
+    assert seen == sorted(users.values())
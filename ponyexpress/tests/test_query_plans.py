@@ -0,0 +1,8 @@
+from database.query_plans import HOT_QUERIES, check_query_plans
+
+
+def test_hot_queries_are_index_backed(app):
+    with app.app_context():
+        plans, failures = check_query_plans()
+    assert set(plans) == set(HOT_QUERIES)
+    assert failures == {}
@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from database.models import db, PackageScan, WriteBehindCheckpoint
+from scan_buffer import REJECTED_LOG, LogDirLocked, ScanWriteBuffer
+
+
+def row(route, barcode):
+    return {"route_id": route, "barcode": barcode, "too_big": False, "too_small": False, "lat": None, "lng": None,
+            "timestamp": datetime(2025, 6, 1, 8), "dedupe_key": f"k:{barcode}"}
+
+
+def write_segment(log_dir, name, rows):
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, name), "w", encoding="utf-8") as fh:
+        for r in rows:
+            fh.write(json.dumps({**r, "timestamp": r["timestamp"].isoformat()}) + "\n")
+
+
+def test_flush_commits_submitted_rows(app, route, tmp_path):
+    buffer = ScanWriteBuffer(app, log_dir=str(tmp_path / "log"), flush_interval=60)
+    buffer.start()
+    buffer.submit(row(route, "A"))
+    buffer.submit(row(route, "B"))
+    buffer.close()
+    with app.app_context():
+        assert sorted(s.barcode for s in PackageScan.query) == ["A", "B"]
+    assert [n for n in os.listdir(tmp_path / "log") if n.endswith(".log")] == []
+
+
+def test_recovery_replays_leftover_segments_once(app, route, tmp_path):
+    log_dir = str(tmp_path / "log")
+    write_segment(log_dir, "00000000000000000001-000001.log", [row(route, "A"), row(route, "B")])
+    # A torn final line from the crash is ignored
+    with open(os.path.join(log_dir, "00000000000000000001-000001.log"), "a", encoding="utf-8") as fh:
+        fh.write('{"route_id": ')
+    buffer = ScanWriteBuffer(app, log_dir=log_dir, flush_interval=60)
+    buffer.start()
+    buffer.close()
+    assert buffer.stats()["recovered"] == 2
+    with app.app_context():
+        assert PackageScan.query.count() == 2
+
+
+def test_recovery_skips_committed_segments(app, route, tmp_path):
+    log_dir = str(tmp_path / "log")
+    name = "00000000000000000001-000001.log"
+    write_segment(log_dir, name, [row(route, "A")])
+    with app.app_context():
+        db.session.add(WriteBehindCheckpoint(segment=name))
+        db.session.commit()
+    buffer = ScanWriteBuffer(app, log_dir=log_dir, flush_interval=60)
+    buffer.start()
+    buffer.close()
+    assert buffer.stats()["recovered"] == 0
+    assert not os.path.exists(os.path.join(log_dir, name))
+    with app.app_context():
+        assert PackageScan.query.count() == 0
+
+
+def test_bad_rows_are_set_aside(app, route, tmp_path):
+    log_dir = str(tmp_path / "log")
+    buffer = ScanWriteBuffer(app, log_dir=log_dir, flush_interval=60)
+    buffer.start()
+    buffer.submit(row(route, "A"))
+    buffer.submit({**row(route, "B"), "barcode": ["B"]})  # SQLite cannot bind a list
+    buffer.submit(row(route, "C"))
+    buffer.close()
+    assert buffer.stats()["rejected"] == 1
+    with app.app_context():
+        assert sorted(s.barcode for s in PackageScan.query) == ["A", "C"]
+    with open(os.path.join(log_dir, REJECTED_LOG), encoding="utf-8") as fh:
+        assert len(fh.readlines()) == 1
+
+
+def test_log_dir_belongs_to_one_buffer(app, tmp_path):
+    owner = ScanWriteBuffer(app, log_dir=str(tmp_path / "log"))
+    with pytest.raises(LogDirLocked):
+        ScanWriteBuffer(app, log_dir=str(tmp_path / "log"))
+    owner.close()
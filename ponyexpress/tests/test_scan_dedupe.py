@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+
+from database.models import db, MailboxStop, PackageScan
+from scan_dedupe import ScanDeduper, ScanKeyError
+
+
+def test_key_buckets_repeats_within_the_window():
+    deduper = ScanDeduper(window=60)
+    first = deduper.key("9400", datetime(2025, 6, 1, 8, 0, 1))
+    assert deduper.key("9400", datetime(2025, 6, 1, 8, 0, 59)) == first
+    assert deduper.key("9400", datetime(2025, 6, 1, 8, 1, 0)) != first
+    assert deduper.key("9400", datetime(2025, 6, 1, 8, 0, 1), "abc") == "k:abc"
+
+
+@pytest.mark.parametrize("client_key", ["", 12, "x" * 65])
+def test_bad_client_keys_are_refused(client_key):
+    with pytest.raises(ScanKeyError):
+        ScanDeduper().key("9400", datetime(2025, 6, 1), client_key)
+
+
+def test_insert_is_idempotent(app, route):
+    deduper = ScanDeduper()
+    row = {"route_id": route, "barcode": "9400", "too_big": False, "too_small": True, "lat": 40.7, "lng": -74.0,
+           "timestamp": datetime(2025, 6, 1, 8), "dedupe_key": "k:one"}
+    with app.app_context():
+        assert len(deduper.insert([row, dict(row)])) == 1
+        db.session.commit()
+        assert deduper.insert([dict(row)]) == []
+        db.session.commit()
+        assert PackageScan.query.count() == 1
+        assert MailboxStop.query.filter_by(label="Auto stop").count() == 1
+
+
+def test_scan_retry_with_idempotency_key(app, route, login):
+    client = login("carrier")
+    scan = {"barcode": "9400111", "lat": 40.7, "lng": -74.0, "too_small": True}
+    first = client.post(f"/scan/{route}", json=scan, headers={"Idempotency-Key": "retry-1"})
+    again = client.post(f"/scan/{route}", json=scan, headers={"Idempotency-Key": "retry-1"})
+    assert first.get_json() == {"success": True}
+    assert again.get_json() == {"success": True, "duplicate": True}
+    with app.app_context():
+        assert PackageScan.query.count() == 1
+        assert MailboxStop.query.count() == 1
+
+
+def test_batch_reports_duplicates_and_invalid_items(app, route, login):
+    client = login("carrier")
+    items = [
+        {"barcode": "A", "key": "a"},
+        {"barcode": "A", "key": "a"},
+        {"barcode": 5},
+        {"barcode": "B", "lat": "north"},
+    ]
+    results = client.post(f"/scan/{route}/batch", json=items).get_json()["results"]
+    assert [r["success"] for r in results] == [True, True, False, False]
+    assert results[1].get("duplicate") is True
+    assert [r.get("error") for r in results[2:]] == ["Invalid barcode", "Invalid lat"]
+    with app.app_context():
+        assert PackageScan.query.count() == 1
+
+
+@pytest.mark.parametrize("value", ["false", "true", 0, 1, []])
+def test_flags_must_be_json_booleans(app, route, login, value):
+    client = login("carrier")
+    single = client.post(f"/scan/{route}", json={"barcode": "A", "too_small": value})
+    assert single.status_code == 400 and single.get_json()["error"] == "Invalid too_small"
+    results = client.post(f"/scan/{route}/batch", json=[{"barcode": "B", "too_big": value}, {"barcode": "C"}])
+    assert [r.get("error") for r in results.get_json()["results"]] == ["Invalid too_big", None]
+    with app.app_context():
+        assert [(s.barcode, s.too_big) for s in PackageScan.query] == [("C", False)]
+        assert MailboxStop.query.count() == 0
@@ -0,0 +1,93 @@
+from database.models import db, MailboxStop, PackageScan, RouteTrace
+
+
+def push(client, changes):
+    response = client.post("/sync", json=changes)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_created_rows_are_returned_once_on_retry(app, login):
+    client = login("carrier")
+    changes = {
+        "routes": [{"ref": "r1", "date": "2025-06-02"}],
+        "scans": [{"ref": "s1", "route_id": "r1", "barcode": "9400", "too_small": True, "lat": 40.7, "lng": -74.0}],
+    }
+    first = push(client, changes)
+    again = push(client, changes)
+    assert first["rejected"] == [] and set(first["created"]) == {"r1", "s1"}
+    assert {ref: c["id"] for ref, c in again["created"].items()} == {ref: c["id"] for ref, c in first["created"].items()}
+    with app.app_context():
+        assert RouteTrace.query.count() == 1
+        assert PackageScan.query.count() == 1
+        assert MailboxStop.query.filter_by(label="Auto stop").count() == 1
+
+
+def test_stale_update_is_a_conflict(app, login, route):
+    client = login("carrier")
+    with app.app_context():
+        version = db.session.get(RouteTrace, route).version
+    ok = push(client, {"routes": [{"id": route, "base_version": version, "date": "2025-06-03"}]})
+    assert ok["updated"][0]["id"] == route and ok["conflicts"] == []
+    stale = push(client, {"routes": [{"id": route, "base_version": version, "date": "2025-06-04"}]})
+    assert stale["updated"] == []
+    assert stale["conflicts"][0]["id"] == route
+    with app.app_context():
+        assert db.session.get(RouteTrace, route).date.isoformat() == "2025-06-03"
+
+
+def test_bad_items_are_rejected_one_by_one(login, route):
+    result = push(login("carrier"), {"scans": [
+        {"ref": ["x"], "route_id": route, "barcode": "A"},
+        {"ref": "ok", "route_id": route, "barcode": "B"},
+        {"ref": "no-route", "route_id": "missing", "barcode": "C"},
+    ]})
+    assert [r["index"] for r in result["rejected"]] == [0, 2]
+    assert set(result["created"]) == {"ok"}
+
+
+def test_other_carriers_routes_are_not_writable(login, route):
+    result = push(login("other"), {"scans": [{"ref": "s", "route_id": route, "barcode": "A"}]})
+    assert result["rejected"][0]["error"] == "Unknown route"
+
+
+def test_pull_returns_changes_after_the_cursor(login, route):
+    client = login("carrier")
+    everything = client.get("/sync").get_json()
+    assert [row[0] for row in everything["routes"]["rows"]] == [route]
+    push(client, {"scans": [{"ref": "s", "route_id": route, "barcode": "A"}]})
+    delta = client.get(f"/sync?cursor={everything['cursor']}").get_json()
+    assert "routes" not in delta and len(delta["scans"]["rows"]) == 1
+
+
+def test_flags_must_be_json_booleans(app, login, route):
+    client = login("carrier")
+    created = push(client, {"scans": [{"ref": "s", "route_id": route, "barcode": "A", "too_small": "false"}]})
+    assert created["rejected"][0]["error"] == "too_small must be true or false"
+    scan = push(client, {"scans": [{"ref": "t", "route_id": route, "barcode": "B"}]})["created"]["t"]
+    updated = push(client, {"scans": [{"id": scan["id"], "base_version": scan["version"], "too_big": "false"}]})
+    assert updated["rejected"][0]["error"] == "too_big must be true or false"
+    with app.app_context():
+        assert [(s.barcode, s.too_big, s.too_small) for s in PackageScan.query] == [("B", False, False)]
+        assert MailboxStop.query.count() == 0
+
+
+def test_scans_share_dedupe_keys_with_the_scan_views(app, login, route):
+    client = login("carrier")
+    online = {"barcode": "9400", "key": "label-1", "too_small": True}
+    assert client.post(f"/scan/{route}/batch", json=[online]).get_json()["accepted"] == 1
+    result = push(client, {"scans": [
+        {"ref": "s1", "route_id": route, **online},
+        {"ref": "s2", "route_id": route, "barcode": "9401", "timestamp": "2025-06-01T08:00:05", "too_small": True},
+        {"ref": "s3", "route_id": route, "barcode": "9401", "timestamp": "2025-06-01T08:00:40", "too_small": True},
+        {"ref": "s4", "route_id": route, "barcode": "9402", "key": ""},
+    ]})
+    assert result["rejected"] == [{"kind": "scans", "index": 3, "error": "Scan key must be a string of 1 to 64 characters"}]
+    ids = {ref: created["id"] for ref, created in result["created"].items()}
+    assert ids["s2"] == ids["s3"]
+    again = push(client, {"scans": [{"ref": "s1", "route_id": route, **online}]})
+    assert again["created"]["s1"]["id"] == ids["s1"]
+    with app.app_context():
+        assert PackageScan.query.count() == 2
+        assert PackageScan.query.filter_by(barcode="9400").one().id == ids["s1"]
+        assert MailboxStop.query.filter_by(label="Auto stop").count() == 2
@@ -0,0 +1,33 @@
+from database.models import db, User
+from user_cache import UserCache
+
+
+def test_put_after_invalidation_is_dropped():
+    cache = UserCache()
+    generation = cache.generation(1)  # a request misses and reads the row...
+    cache.invalidate(1)  # ...another commits a change to it...
+    cache.put(1, {"id": 1, "role": "carrier"}, generation)  # ...and the old row must not come back
+    assert cache.get(1) is None
+    assert cache.stats()["stale_puts"] == 1
+    cache.put(1, {"id": 1, "role": "substitute"}, cache.generation(1))
+    assert cache.get(1)["role"] == "substitute"
+
+
+def test_orm_changes_reach_the_cache(app, users):
+    cache = app.extensions["user_cache"]
+    with app.app_context():
+        assert cache.load_user(users["carrier"]).role == "carrier"
+        assert cache.get(users["carrier"]) is not None
+        db.session.get(User, users["carrier"]).role = "substitute"
+        db.session.commit()
+        assert cache.get(users["carrier"]) is None
+        assert cache.load_user(users["carrier"]).role == "substitute"
+
+
+def test_demoted_user_loses_access_on_the_next_request(app, login, users):
+    client = login("supervisor")
+    assert client.get("/live").status_code == 200
+    with app.app_context():
+        db.session.get(User, users["supervisor"]).role = "carrier"
+        db.session.commit()
+    assert client.get("/live").status_code == 302
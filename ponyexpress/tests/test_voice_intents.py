@@ -0,0 +1,50 @@
+import json
+import os
+
+import pytest
+
+from voice_intents import IntentMatcher, VoiceCommandsError
+
+COMMANDS = {
+    "wake_words": ["Hey Pony"],
+    "commands": {"navigation": {"next_stop": ["next stop", "continue route"]}},
+}
+
+
+@pytest.fixture
+def matcher(tmp_path):
+    path = tmp_path / "voice.json"
+    path.write_text(json.dumps(COMMANDS))
+    matcher = IntentMatcher(str(path), reload_interval=0)
+    matcher.reload()
+    return matcher
+
+
+def test_match_with_wake_word_and_typo(matcher):
+    match = matcher.match("hey pony continue rout please", require_wake_word=True)
+    assert (match.intent, match.wake_word) == ("next_stop", "Hey Pony")
+    assert matcher.match("next stop", require_wake_word=True) is None
+
+
+@pytest.mark.parametrize("commands", [
+    {"commands": {"navigation": {"next_stop": 5}}},
+    {"commands": {"navigation": {"next_stop": "next stop"}}},
+    {"commands": {"navigation": {"next_stop": ["next stop", None]}}},
+    {"wake_words": "Hey Pony", "commands": {}},
+    {"commands": {"navigation": ["next stop"]}},
+    {"commands": []},
+])
+def test_malformed_files_raise_voice_commands_error(tmp_path, commands):
+    path = tmp_path / "voice.json"
+    path.write_text(json.dumps(commands))
+    with pytest.raises(VoiceCommandsError):
+        IntentMatcher(str(path)).reload()
+
+
+def test_malformed_reload_keeps_the_previous_version(matcher):
+    with open(matcher.path, "w", encoding="utf-8") as fh:
+        json.dump({"commands": {"navigation": {"next_stop": 5}}}, fh)
+    os.utime(matcher.path, ns=(0, 10**9))
+    assert matcher.reload() is False
+    assert matcher.match("next stop").intent == "next_stop"
+    assert matcher.stats()["reload_errors"] >= 1
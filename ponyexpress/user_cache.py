@@ -0,0 +1,154 @@
+"""Per-process cache for the Flask-Login user loader.
+
+Every authenticated request calls the user loader, so caching the user
+row saves one SQLite round trip per request. The cache stores plain column
+values (never live ORM objects, which belong to one session) and rebuilds
+a persistent ``User`` in the current session without touching the DB.
+
+Entries expire after ``ttl`` seconds and the least recently used entry is
+evicted beyond ``maxsize``. Any ORM update or delete of a ``User`` drops its
+entry when the change is flushed and again after commit, so a deleted or
+demoted user loses access on their next request. Each drop also bumps the
+user's generation: a request that read the row before the change and
+caches it afterwards would bring the old row back, so a row is only
+cached if the generation it was read under is still current. The cache is per process:
+in a multi-worker deployment other workers see such changes within ``ttl``.
+
+The SQLAlchemy listeners are process-global, so they are registered once
+per process and fan out to every watching cache, held weakly: creating
+apps repeatedly (tests, benchmarks) neither stacks listeners nor keeps old
+caches alive. A change is dropped from every live cache, including those
+of apps on other databases; that only costs them a reload.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from database.models import db, User
+
+_PENDING_KEY = "user_cache_invalidate"
+
+_watching = weakref.WeakSet()  # caches told about User changes
+_listen_lock = threading.Lock()
+_listening = False
+
+
+def _invalidate_all(user_id):
+    for cache in list(_watching):
+        cache.invalidate(user_id)
+
+
+def _on_change(mapper, connection, target):
+    _invalidate_all(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.id)
+
+
+def _on_commit(session):
+    # A concurrent request may have re-cached the old row between flush
+    # and commit; drop it again now the change is visible.
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        _invalidate_all(user_id)
+
+
+class UserCache:
+    """Thread-safe TTL + LRU map of user id → column values."""
+
+    def __init__(self, ttl=30.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generations = {}  # user id -> invalidations so far
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = self.stale_puts = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, user_id):
+        """Token to pass to :meth:`put` for a row read from now on."""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def put(self, user_id, values, generation=None):
+        """Cache ``values``, unless ``user_id`` was invalidated since ``generation`` was taken."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(user_id, 0) != generation:
+                self.stale_puts += 1
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+    # ------------------------------------------------------------------
+    # Loader
+    # ------------------------------------------------------------------
+    def load_user(self, user_id):
+        """Return the ``User`` for ``user_id``, from cache when possible."""
+        values = self.get(user_id)
+        if values is None:
+            generation = self.generation(user_id)
+            user = db.session.get(User, user_id)
+            if user is not None:
+                values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+                self.put(user_id, values, generation)
+            return user
+        user = User(**values)
+        # Present the rebuilt object as if it had just been loaded, then
+        # attach it without a SELECT; relationships still lazy-load normally.
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def watch_user_changes(self):
+        """Invalidate entries whenever a ``User`` row is updated or deleted via the ORM."""
+        global _listening
+        with _listen_lock:
+            _watching.add(self)
+            if not _listening:
+                event.listen(User, "after_update", _on_change)
+                event.listen(User, "after_delete", _on_change)
+                event.listen(Session, "after_commit", _on_commit)
+                _listening = True
@@ -0,0 +1,270 @@
+"""Voice-command intent matching.
+
+``voice-commands.json`` lists wake words and, per category, the phrase
+variants of each intent (``start_route``, ``next_stop``, ``delivered``,
+...). Comparing an utterance fuzzily with every phrase is too slow once
+there are thousands of variants, so :class:`IntentMatcher` compiles the
+file into:
+
+- a token trie of the wake words, matched at the start of the utterance;
+- an inverted index of phrase tokens, each weighted by inverse document
+  frequency (common filler words count for little);
+- a map from every word in the index, and every copy of it with one
+  letter deleted, back to the word, which corrects a misheard or
+  misspelt token (one edit away) in a dictionary lookup.
+
+A phrase scores by the weight of its tokens found in the utterance
+(recall), lowered a little by the weight of utterance tokens it does not
+explain (precision). An intent scores as its best phrase. Utterance
+tokens the winning phrase does not use are returned as ``rest``: "where
+is 12 Oak Dr" → ``address_lookup`` with rest ``"12 oak dr"``.
+
+The file is re-read when its modification time changes, checked at most
+every ``reload_interval`` seconds. A file that fails to compile is
+logged and the previous version stays in use.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Weight of filler words, whatever their frequency among the phrases
+STOPWORDS = frozenset(
+    "a an the my me i to this that is are at of for on in it do can you could please now what how".split()
+)
+STOPWORD_WEIGHT = 0.2
+FUZZY_FACTOR = 0.8  # credit for a token matched one edit away
+MIN_FUZZY_LENGTH = 4  # shorter tokens only match exactly
+UNKNOWN_WEIGHT = 0.5  # cost to precision of a token no phrase uses
+
+_STRIP = re.compile(r"['.]")  # "what's" -> "whats", "A.I." -> "ai"
+_SEPARATOR = re.compile(r"[^a-z0-9]+")
+
+
+class VoiceCommandsError(ValueError):
+    """The command file is missing or not in the ``voice-commands.json`` layout."""
+
+
+def tokenize(text):
+    """Lower-case word tokens of ``text``."""
+    return _SEPARATOR.sub(" ", _STRIP.sub("", str(text or "").lower())).split()
+
+
+def _deletes(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _one_edit(a, b):
+    """``True`` if ``a`` and ``b`` are one insertion, deletion, substitution or adjacent swap apart."""
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if abs(len(a) - len(b)) != 1:
+        return False
+    short, long = sorted((a, b), key=len)
+    return any(long[:i] + long[i + 1:] == short for i in range(len(long)))
+
+
+class Match:
+    """Best intent for an utterance."""
+
+    __slots__ = ("intent", "category", "score", "phrase", "wake_word", "rest")
+
+    def __init__(self, intent, category, score, phrase, wake_word, rest):
+        self.intent, self.category, self.score = intent, category, score
+        self.phrase, self.wake_word, self.rest = phrase, wake_word, rest
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _strings(value, what):
+    """``value`` if it is a list of strings (``[]`` for null), else :class:`VoiceCommandsError`."""
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise VoiceCommandsError(f"{what} must be a list of strings")
+    return value
+
+
+class _Compiled:
+    """Immutable matching tables built from one version of the command file."""
+
+    def __init__(self, data):
+        if not isinstance(data, dict) or not isinstance(data.get("commands"), dict):
+            raise VoiceCommandsError("Expected an object with a 'commands' mapping")
+        # Wake words: nested dicts keyed by token; None marks the end of a wake word
+        self.wake = {}
+        for wake_word in _strings(data.get("wake_words"), "'wake_words'"):
+            node = self.wake
+            for token in tokenize(wake_word):
+                node = node.setdefault(token, {})
+            node[None] = wake_word
+
+        # Phrases: (intent, category, text, tokens)
+        self.phrases = []
+        for category, intents in data["commands"].items():
+            if not isinstance(intents, dict):
+                raise VoiceCommandsError(f"Category {category!r} must map intents to phrase lists")
+            for intent, phrases in intents.items():
+                for phrase in _strings(phrases, f"Phrases of {category}.{intent}"):
+                    tokens = tuple(dict.fromkeys(tokenize(phrase)))
+                    if tokens:
+                        self.phrases.append((intent, category, phrase, tokens))
+
+        postings = {}
+        for phrase_id, (_, _, _, tokens) in enumerate(self.phrases):
+            for token in tokens:
+                postings.setdefault(token, []).append(phrase_id)
+        self.postings = {token: np.array(ids, dtype=np.intp) for token, ids in postings.items()}
+        count = len(self.phrases)
+        self.weights = {
+            token: STOPWORD_WEIGHT if token in STOPWORDS else math.log(1 + count / len(ids))
+            for token, ids in self.postings.items()
+        }
+        self.mass = np.array([sum(self.weights[t] for t in tokens) for _, _, _, tokens in self.phrases])
+
+        self.corrections = {}
+        for token in self.postings:
+            if len(token) >= MIN_FUZZY_LENGTH:
+                for variant in _deletes(token) | {token}:
+                    self.corrections.setdefault(variant, set()).add(token)
+
+    def resolve(self, token):
+        """Index token for an utterance token, and the credit it earns (``None`` if unknown)."""
+        if token in self.postings:
+            return token, 1.0
+        if len(token) < MIN_FUZZY_LENGTH:
+            return None, 0.0
+        candidates = set()
+        for variant in _deletes(token) | {token}:
+            candidates |= self.corrections.get(variant, set())
+        candidates = [c for c in candidates if _one_edit(token, c)]
+        if not candidates:
+            return None, 0.0
+        # Prefer the most specific word, then a stable order
+        best = max(candidates, key=lambda c: (self.weights[c], c))
+        return best, FUZZY_FACTOR
+
+    def wake_word(self, tokens, max_start=2):
+        """``(wake word, index after it)`` if one starts within the first tokens, else ``(None, 0)``."""
+        for start in range(min(max_start + 1, len(tokens))):
+            node, found = self.wake, None
+            for position in range(start, len(tokens)):
+                node = node.get(tokens[position])
+                if node is None:
+                    break
+                if None in node:
+                    found = (node[None], position + 1)
+            if found:
+                return found
+        return None, 0
+
+
+class IntentMatcher:
+    """Intent matcher for a ``voice-commands.json`` file, reloaded when it changes."""
+
+    def __init__(self, path, reload_interval=2.0, min_score=0.5):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.min_score = min_score
+        self._compiled = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()  # one reload at a time
+        self.matches = self.misses = self.reloads = self.reload_errors = 0
+        self.compile_ms = 0.0
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def reload(self, force=False):
+        """Recompile the command file if it changed; return ``True`` if it was (re)loaded.
+
+        Raises :class:`VoiceCommandsError` if there is no usable version at
+        all; later failures are logged and the last good version is kept.
+        """
+        now = time.monotonic()
+        if not force and self._compiled is not None and now - self._checked < self.reload_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if not force and mtime == self._mtime:
+                    return False
+                started = time.perf_counter()
+                with open(self.path, encoding="utf-8") as fh:
+                    compiled = _Compiled(json.load(fh))
+            except (OSError, ValueError) as exc:
+                self.reload_errors += 1
+                if self._compiled is None:
+                    raise VoiceCommandsError(f"Cannot load {self.path}: {exc}") from exc
+                logger.error("Keeping the previous voice commands; reloading %s failed: %s", self.path, exc)
+                return False
+            self._compiled, self._mtime = compiled, mtime
+            self.compile_ms = (time.perf_counter() - started) * 1000
+            self.reloads += 1
+            return True
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+    def match(self, text, require_wake_word=False):
+        """Best :class:`Match` for the utterance ``text``, or ``None`` below ``min_score``."""
+        self.reload()
+        compiled = self._compiled
+        tokens = tokenize(text)
+        wake_word, start = compiled.wake_word(tokens)
+        if require_wake_word and wake_word is None:
+            self.misses += 1
+            return None
+
+        query = tokens[start:]
+        resolved = [compiled.resolve(token) for token in query]
+        query_mass = sum(compiled.weights[t] * credit if t else UNKNOWN_WEIGHT for t, credit in resolved)
+        credits = {}  # index token -> best credit
+        for token, credit in resolved:
+            if token is not None and credit > credits.get(token, 0.0):
+                credits[token] = credit
+        best, best_score = None, 0.0
+        if credits:
+            # Score every phrase at once: a token adds its weight to each
+            # phrase in its posting list. Filler words are in most phrases,
+            # so gathering candidates first saves little.
+            matched = np.zeros(len(compiled.phrases))
+            for token, credit in credits.items():
+                matched[compiled.postings[token]] += compiled.weights[token] * credit
+            scores = matched / compiled.mass * (0.7 + 0.3 * matched / query_mass)
+            best = int(scores.argmax())  # ties go to the first phrase in the file
+            best_score = float(scores[best])
+        if best is None or best_score < self.min_score:
+            self.misses += 1
+            return None
+
+        self.matches += 1
+        intent, category, phrase, phrase_tokens = compiled.phrases[best]
+        used = set(phrase_tokens)
+        rest = " ".join(word for word, (token, _) in zip(query, resolved) if token not in used)
+        return Match(intent, category, round(best_score, 3), phrase, wake_word, rest)
+
+    def stats(self):
+        compiled = self._compiled
+        return {
+            "phrases": len(compiled.phrases) if compiled else 0,
+            "tokens": len(compiled.postings) if compiled else 0,
+            "matches": self.matches,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "compile_ms": round(self.compile_ms, 2),
+        }